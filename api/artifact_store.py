@@ -0,0 +1,292 @@
+"""Индекс артефактов API во встроенной SQLite базе.
+
+Вместо поиска файлов перебором директорий (os.listdir) эндпоинты находят
+загрузки, состав ZIP архивов, сохраненные анализы и отчеты по индексам:
+
+    uploads  - file_id -> путь, имя, размер, sha256
+    members  - состав ZIP архива загрузки (без повторной распаковки)
+    analyses - file_id -> сохраненный MatchState
+    reports  - имя файла -> путь отчета (Excel, Timeline кэш)
+
+База в режиме WAL: чтения не блокируются записью. Соединение свое у
+каждого потока и процесса (pre-fork воркеры не делят соединение мастера).
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zipfile
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    file_id     TEXT PRIMARY KEY,
+    filename    TEXT NOT NULL,
+    stored_name TEXT NOT NULL,
+    path        TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    sha256      TEXT,
+    created_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS uploads_stored_name ON uploads (stored_name);
+CREATE INDEX IF NOT EXISTS uploads_sha256 ON uploads (sha256);
+CREATE INDEX IF NOT EXISTS uploads_path ON uploads (path);
+
+CREATE TABLE IF NOT EXISTS members (
+    file_id TEXT NOT NULL REFERENCES uploads (file_id) ON DELETE CASCADE,
+    name    TEXT NOT NULL,
+    size    INTEGER NOT NULL,
+    PRIMARY KEY (file_id, name)
+);
+
+CREATE TABLE IF NOT EXISTS analyses (
+    file_id    TEXT PRIMARY KEY,
+    path       TEXT NOT NULL,
+    threshold  REAL,
+    top_k      INTEGER,
+    model      TEXT,
+    warnings   INTEGER,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analyses_path ON analyses (path);
+
+CREATE TABLE IF NOT EXISTS reports (
+    name       TEXT PRIMARY KEY,
+    file_id    TEXT,
+    kind       TEXT NOT NULL,
+    path       TEXT NOT NULL,
+    size       INTEGER,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_file_id ON reports (file_id);
+CREATE INDEX IF NOT EXISTS reports_path ON reports (path);
+"""
+
+# Члены ZIP архива, которые учитывает анализ (как в LogParser.extract_zip)
+_MEMBER_SUFFIXES = (".txt", ".log", "anomalies_problems.csv")
+_FILE_ID_RE = re.compile(r"^([0-9a-f]{32})")
+
+REPORT_EXCEL = "excel"
+REPORT_TIMELINE = "timeline"
+REPORT_TRACE = "trace"
+REPORT_MEDIA_TYPES = {
+    REPORT_EXCEL: "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    REPORT_TIMELINE: "text/html; charset=utf-8",
+    REPORT_TRACE: "application/json",
+}
+
+
+def zip_members(path: str) -> List[Dict]:
+    """Состав ZIP архива: имена и размеры файлов логов и словаря."""
+    with zipfile.ZipFile(path, "r") as archive:
+        return [
+            {"name": info.filename, "size": info.file_size}
+            for info in archive.infolist()
+            if not info.is_dir() and info.filename.endswith(_MEMBER_SUFFIXES)
+        ]
+
+
+class ArtifactStore:
+    """Метаданные загрузок, анализов и отчетов в SQLite."""
+
+    def __init__(self, db_path: str):
+        """Инициализация: создает базу и схему при первом запуске.
+
+        Args:
+            db_path: Путь к файлу базы
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # Схему создаем отдельным соединением и сразу закрываем - до fork не должно
+        # оставаться открытых соединений
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _conn(self) -> sqlite3.Connection:
+        """Соединение текущего потока (пересоздается после fork)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def close(self) -> None:
+        """Закрывает соединение текущего потока (например, в мастере перед fork)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+    def _write(self, sql: str, params: Iterable = ()) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(sql, tuple(params))
+
+    # --- Загрузки ---
+
+    def add_upload(self, file_id: str, filename: str, path: str, size: int,
+                   sha256: Optional[str] = None, members: Optional[List[Dict]] = None) -> None:
+        """Регистрирует загруженный файл (и состав ZIP архива)."""
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO uploads (file_id, filename, stored_name, path, size, sha256, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file_id, filename, os.path.basename(path), path, size, sha256, time.time()),
+            )
+            if members:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO members (file_id, name, size) VALUES (?, ?, ?)",
+                    [(file_id, member["name"], member["size"]) for member in members],
+                )
+
+    def get_upload(self, file_id: str) -> Optional[Dict]:
+        row = self._conn().execute("SELECT * FROM uploads WHERE file_id = ?", (file_id,)).fetchone()
+        return dict(row) if row else None
+
+    def find_upload(self, stored_name: str) -> Optional[Dict]:
+        """Загрузка по имени файла в хранилище (<file_id>_<имя>)."""
+        row = self._conn().execute("SELECT * FROM uploads WHERE stored_name = ?", (stored_name,)).fetchone()
+        return dict(row) if row else None
+
+    def list_members(self, file_id: str) -> List[Dict]:
+        rows = self._conn().execute(
+            "SELECT name, size FROM members WHERE file_id = ? ORDER BY rowid", (file_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    # --- Анализы ---
+
+    def add_analysis(self, file_id: str, path: str, threshold: Optional[float] = None,
+                     top_k: Optional[int] = None, model: Optional[str] = None,
+                     warnings: Optional[int] = None) -> None:
+        self._write(
+            "INSERT OR REPLACE INTO analyses (file_id, path, threshold, top_k, model, warnings, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (file_id, path, threshold, top_k, model, warnings, time.time()),
+        )
+
+    def get_analysis(self, file_id: str) -> Optional[Dict]:
+        row = self._conn().execute("SELECT * FROM analyses WHERE file_id = ?", (file_id,)).fetchone()
+        return dict(row) if row else None
+
+    # --- Отчеты ---
+
+    def add_report(self, path: str, kind: str, file_id: Optional[str] = None) -> None:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = None
+        self._write(
+            "INSERT OR REPLACE INTO reports (name, file_id, kind, path, size, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (os.path.basename(path), file_id, kind, path, size, time.time()),
+        )
+
+    def get_report(self, name: str) -> Optional[Dict]:
+        row = self._conn().execute("SELECT * FROM reports WHERE name = ?", (name,)).fetchone()
+        return dict(row) if row else None
+
+    def list_reports(self, file_id: str) -> List[Dict]:
+        rows = self._conn().execute(
+            "SELECT * FROM reports WHERE file_id = ? ORDER BY created_at", (file_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    # --- Обслуживание ---
+
+    def forget_paths(self, paths: Iterable[str]) -> None:
+        """Удаляет записи об удаленных файлах (вызывается очисткой артефактов)."""
+        paths = [(path,) for path in paths]
+        if not paths:
+            return
+        conn = self._conn()
+        with conn:
+            conn.executemany("DELETE FROM uploads WHERE path = ?", paths)
+            conn.executemany("DELETE FROM analyses WHERE path = ?", paths)
+            conn.executemany("DELETE FROM reports WHERE path = ?", paths)
+
+    def backfill(self, uploads_dir: str, reports_dir: str, analyses_dir: str) -> int:
+        """Индексирует файлы, созданные до появления базы (один раз, если база пуста).
+
+        Вызывается при импорте API - в том числе в pre-fork мастере, поэтому
+        соединение в конце закрывается: воркеры не должны наследовать его.
+
+        Returns:
+            Число проиндексированных файлов
+        """
+        try:
+            return self._backfill(uploads_dir, reports_dir, analyses_dir)
+        finally:
+            self.close()
+
+    def _backfill(self, uploads_dir: str, reports_dir: str, analyses_dir: str) -> int:
+        conn = self._conn()
+        has_rows = any(
+            conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+            for table in ("uploads", "analyses", "reports")
+        )
+        if has_rows:
+            return 0
+
+        count = 0
+        for entry in _scan(uploads_dir):
+            match = _FILE_ID_RE.match(entry.name)
+            if not match or not entry.name[32:].startswith("_"):
+                continue
+            members = None
+            if entry.name.endswith(".zip"):
+                try:
+                    members = zip_members(entry.path)
+                except (zipfile.BadZipFile, OSError):
+                    members = None
+            self.add_upload(match.group(1), entry.name[33:], entry.path, entry.stat().st_size, members=members)
+            count += 1
+        for entry in _scan(analyses_dir):
+            if entry.name.endswith(".pkl") and _FILE_ID_RE.match(entry.name):
+                self.add_analysis(entry.name[:32], entry.path)
+                count += 1
+        for entry in _scan(reports_dir):
+            if entry.name.endswith(".xlsx"):
+                kind = REPORT_EXCEL
+            elif entry.name.startswith("timeline_") and entry.name.endswith(".html"):
+                kind = REPORT_TIMELINE
+            elif entry.name.startswith("trace_") and entry.name.endswith(".json"):
+                kind = REPORT_TRACE
+            else:
+                continue
+            match = _FILE_ID_RE.search(entry.name)
+            self.add_report(entry.path, kind, match.group(1) if match else None)
+            count += 1
+        if count:
+            logger.info(f"Проиндексировано {count} существующих артефактов")
+        return count
+
+    def counts(self) -> Dict[str, int]:
+        """Число записей в каждой таблице (для метрик)."""
+        conn = self._conn()
+        return {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("uploads", "members", "analyses", "reports")
+        }
+
+
+def _scan(directory: str):
+    try:
+        return [entry for entry in os.scandir(directory) if entry.is_file()]
+    except FileNotFoundError:
+        return []
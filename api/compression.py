@@ -0,0 +1,307 @@
+"""Сжатие ответов API (gzip/brotli).
+
+Timeline HTML и JSON анализа с графиками весят мегабайты, а пользователи
+сидят за медленным VPN. Middleware выбирает кодировку по Accept-Encoding,
+сжимает тела больше порога и умеет сжимать потоковые ответы по чанкам,
+не собирая тело целиком. Для закэшированных артефактов заранее пишутся
+.gz/.br варианты, которые отдаются как есть.
+"""
+
+import gzip
+import logging
+import os
+import tempfile
+import zlib
+from typing import Dict, Optional, Tuple
+
+from fastapi.responses import FileResponse
+
+try:
+    import brotli
+except ImportError:  # brotli опционален - без него работаем только с gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Типы, которые уже сжаты или не должны буферизоваться прокси
+DEFAULT_EXCLUDED_MEDIA_TYPES = (
+    "image/",
+    "video/",
+    "audio/",
+    "application/zip",
+    "application/gzip",
+    "application/octet-stream",
+    "application/vnd.openxmlformats",
+    "text/event-stream",
+)
+
+# Расширения заранее сжатых файлов по кодировке
+PRECOMPRESSED_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Разбирает Accept-Encoding в словарь {кодировка: q}."""
+    encodings = {}
+    for part in header.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        encodings[name.strip().lower()] = quality
+    return encodings
+
+
+def select_encoding(header: Optional[str]) -> Optional[str]:
+    """Выбирает кодировку ответа: brotli, если доступен и принят клиентом, иначе gzip.
+
+    Args:
+        header: Значение заголовка Accept-Encoding
+
+    Returns:
+        "br", "gzip" или None
+    """
+    if not header:
+        return None
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+
+    candidates = []
+    if brotli is not None:
+        candidates.append("br")
+    candidates.append("gzip")
+
+    best, best_quality = None, 0.0
+    for encoding in candidates:
+        quality = accepted.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class _StreamCompressor:
+    """Инкрементальный компрессор для одной кодировки."""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits=31 - формат gzip (заголовок + CRC)
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        """Сжимает чанк; flush=True выталкивает данные, чтобы клиент получил их сразу."""
+        if self.encoding == "br":
+            out = self._compressor.process(data) if data else b""
+            if flush:
+                out += self._compressor.flush()
+            return out
+        out = self._compressor.compress(data) if data else b""
+        if flush:
+            out += self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        return out
+
+    def finish(self) -> bytes:
+        """Завершает поток сжатия."""
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+def compress_bytes(data: bytes, encoding: str, gzip_level: int = 6, brotli_quality: int = 5) -> bytes:
+    """Сжимает тело целиком в указанной кодировке."""
+    if encoding == "br":
+        return brotli.compress(data, quality=brotli_quality)
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+
+class CompressionMiddleware:
+    """ASGI middleware для gzip/brotli сжатия ответов.
+
+    - кодировка выбирается по Accept-Encoding (brotli предпочтительнее);
+    - тела меньше minimum_size и уже сжатые типы не трогаются;
+    - ответы с готовым Content-Encoding (заранее сжатые артефакты) проходят как есть;
+    - потоковые ответы сжимаются по чанкам без буферизации всего тела.
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 5,
+        excluded_media_types: Tuple[str, ...] = DEFAULT_EXCLUDED_MEDIA_TYPES,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.excluded_media_types = excluded_media_types
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = None
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+
+        encoding = select_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    """Состояние сжатия одного ответа."""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.downstream_send = send
+        self.start_message = None
+        self.compressor: Optional[_StreamCompressor] = None
+        self.passthrough = False
+
+    def _should_skip(self, headers) -> bool:
+        """Проверяет, нужно ли пропустить ответ без сжатия."""
+        content_type = ""
+        for name, value in headers:
+            if name == b"content-encoding":
+                return True
+            if name == b"content-type":
+                content_type = value.decode("latin-1").lower()
+        return content_type.startswith(self.middleware.excluded_media_types)
+
+    def _compressed_headers(self, content_length: Optional[int]):
+        """Заголовки ответа после сжатия."""
+        headers = [
+            (name, value) for name, value in self.start_message.get("headers", [])
+            if name not in (b"content-length", b"vary")
+        ]
+        vary = [value for name, value in self.start_message.get("headers", []) if name == b"vary"]
+        vary_values = b", ".join(vary + [b"Accept-Encoding"]) if vary else b"Accept-Encoding"
+        headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+        headers.append((b"vary", vary_values))
+        if content_length is not None:
+            headers.append((b"content-length", str(content_length).encode("latin-1")))
+        return headers
+
+    async def send(self, message):
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            # Откладываем заголовки до первого чанка тела
+            self.start_message = message
+            self.passthrough = self._should_skip(message.get("headers", []))
+            return
+
+        if message_type != "http.response.body":
+            await self.downstream_send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.passthrough:
+            if self.start_message is not None:
+                await self.downstream_send(self.start_message)
+                self.start_message = None
+            await self.downstream_send(message)
+            return
+
+        if self.compressor is None:
+            # Первый чанк тела - решаем, сжимать ли ответ
+            if not more_body and len(body) < self.middleware.minimum_size:
+                self.passthrough = True
+                await self.downstream_send(self.start_message)
+                self.start_message = None
+                await self.downstream_send(message)
+                return
+
+            if not more_body:
+                compressed = compress_bytes(
+                    body, self.encoding,
+                    self.middleware.gzip_level, self.middleware.brotli_quality
+                )
+                self.start_message["headers"] = self._compressed_headers(len(compressed))
+                await self.downstream_send(self.start_message)
+                self.start_message = None
+                await self.downstream_send({"type": "http.response.body", "body": compressed})
+                return
+
+            # Потоковый ответ: длина неизвестна, сжимаем чанк за чанком
+            self.compressor = _StreamCompressor(
+                self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality
+            )
+            self.start_message["headers"] = self._compressed_headers(None)
+            await self.downstream_send(self.start_message)
+            self.start_message = None
+
+        if more_body:
+            chunk = self.compressor.compress(body, flush=True)
+            if chunk:
+                await self.downstream_send({"type": "http.response.body", "body": chunk, "more_body": True})
+        else:
+            chunk = self.compressor.compress(body) + self.compressor.finish()
+            await self.downstream_send({"type": "http.response.body", "body": chunk})
+
+
+def write_precompressed(path: str, data: bytes, gzip_level: int = 9, brotli_quality: int = 11) -> None:
+    """Сохраняет артефакт вместе с .gz и .br вариантами.
+
+    Артефакт пишется один раз, а отдается многократно, поэтому здесь
+    используются максимальные уровни сжатия.
+    """
+    variants = [(path, data), (path + PRECOMPRESSED_SUFFIXES["gzip"], compress_bytes(data, "gzip", gzip_level))]
+    if brotli is not None:
+        variants.append((path + PRECOMPRESSED_SUFFIXES["br"], compress_bytes(data, "br", brotli_quality=brotli_quality)))
+
+    for variant_path, payload in variants:
+        # Пишем атомарно, чтобы параллельный запрос не прочитал половину файла;
+        # суффикс .tmp - очистка артефактов не трогает файлы в процессе записи
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(variant_path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, variant_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def precompressed_response(path: str, accept_encoding: Optional[str], media_type: str) -> FileResponse:
+    """Отдает заранее сжатый вариант артефакта, если клиент его принимает.
+
+    Args:
+        path: Путь к несжатому артефакту
+        accept_encoding: Заголовок Accept-Encoding запроса
+        media_type: MIME тип несжатого содержимого
+
+    Returns:
+        FileResponse со сжатым или исходным файлом
+    """
+    encoding = select_encoding(accept_encoding)
+    if encoding is not None:
+        variant_path = path + PRECOMPRESSED_SUFFIXES[encoding]
+        if os.path.exists(variant_path):
+            return FileResponse(
+                path=variant_path,
+                media_type=media_type,
+                headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"},
+            )
+    return FileResponse(path=path, media_type=media_type, headers={"Vary": "Accept-Encoding"})
@@ -0,0 +1,154 @@
+"""Настройки API, читаемые из переменных окружения.
+
+Все значения имеют безопасные значения по умолчанию, поэтому API
+запускается без .env файла (Render, Fly.io, Vercel, Docker).
+"""
+
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    """Читает целое число из переменной окружения."""
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    """Читает число с плавающей точкой из переменной окружения."""
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    """Читает флаг (1/0, true/false, yes/no) из переменной окружения."""
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Сжатие ответов (gzip/brotli)
+COMPRESSION_ENABLED = _env_bool("API_COMPRESSION_ENABLED", True)
+COMPRESSION_MIN_SIZE = _env_int("API_COMPRESSION_MIN_SIZE", 1024)
+GZIP_LEVEL = _env_int("API_GZIP_LEVEL", 6)
+BROTLI_QUALITY = _env_int("API_BROTLI_QUALITY", 5)
+
+# Загрузка ML модели
+# false - модель грузится при первом ML запросе (serverless, быстрый холодный старт)
+PRELOAD_MODEL = _env_bool("API_PRELOAD_MODEL", True)
+# Сколько ML запрос ждет загрузки модели, прежде чем вернуть 503
+MODEL_READY_TIMEOUT = _env_float("API_MODEL_READY_TIMEOUT", 120.0)
+
+# Бэкенд кодирования текстов: torch, torch-int8, onnx, onnx-int8, hashing (без модели - для нагрузочных тестов)
+ML_ENCODER_BACKEND = os.getenv("ML_ENCODER_BACKEND", "torch")
+ML_MODEL_NAME = os.getenv("ML_MODEL_NAME", "all-MiniLM-L6-v2")
+# Кэш экспортированных ONNX моделей (по умолчанию ~/.cache/atomichack/onnx)
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR") or None
+
+# Динамический батчинг encode между параллельными анализами
+ML_DYNAMIC_BATCHING = _env_bool("ML_DYNAMIC_BATCHING", True)
+ML_BATCH_MAX_SIZE = _env_int("ML_BATCH_MAX_SIZE", 64)
+ML_BATCH_MAX_WAIT_MS = _env_float("ML_BATCH_MAX_WAIT_MS", 5.0)
+
+# Модели, которые клиент может выбрать параметром model (через запятую)
+ML_ALLOWED_MODELS = [
+    name.strip() for name in os.getenv("ML_ALLOWED_MODELS", ML_MODEL_NAME).split(",") if name.strip()
+]
+ML_MAX_TOP_K = _env_int("ML_MAX_TOP_K", 10)
+
+# Дисковый кэш эмбеддингов словарей и ANN индексов (пусто - только в памяти)
+ML_EMBEDDING_CACHE_DIR = os.getenv("ML_EMBEDDING_CACHE_DIR") or None
+
+# Приближенный поиск (IVF индекс) для больших словарей аномалий
+ML_ANN_ENABLED = _env_bool("ML_ANN_ENABLED", False)
+ML_ANN_MIN_DICTIONARY_SIZE = _env_int("ML_ANN_MIN_DICTIONARY_SIZE", 20000)
+# Число кластеров (0 - ~sqrt(размер словаря)) и сколько из них просматривать
+ML_ANN_LISTS = _env_int("ML_ANN_LISTS", 0)
+ML_ANN_PROBE = _env_int("ML_ANN_PROBE", 8)
+
+# Быстрый путь: WARNING, совпадающие с аномалией словаря дословно или с точностью
+# до регистра и пробелов, сопоставляются без модели
+ML_EXACT_MATCH = _env_bool("ML_EXACT_MATCH", True)
+ML_NORMALIZED_MATCH = _env_bool("ML_NORMALIZED_MATCH", True)
+
+# Майнинг шаблонов сообщений при парсинге (Drain): ML кодирует шаблоны вместо сырых строк
+LOG_TEMPLATE_MINING = _env_bool("LOG_TEMPLATE_MINING", False)
+LOG_TEMPLATE_SIMILARITY = _env_float("LOG_TEMPLATE_SIMILARITY", 0.5)
+
+# Маскирование параметров (числа, hex, IP, UUID, пути, время) перед кодированием WARNING
+ML_TEXT_NORMALIZATION = _env_bool("ML_TEXT_NORMALIZATION", False)
+# Маски по умолчанию и свои маски для источников: "hardware=number,path;network=ip"
+ML_NORMALIZER_MASKS = [
+    name.strip() for name in os.getenv("ML_NORMALIZER_MASKS", "timestamp,uuid,ip,path,hex,number").split(",")
+    if name.strip()
+]
+ML_NORMALIZER_SOURCE_MASKS = os.getenv("ML_NORMALIZER_SOURCE_MASKS", "")
+# LRU кэш эмбеддингов WARNING между анализами (0 - выключен)
+ML_EMBEDDING_CACHE_SIZE = _env_int("ML_EMBEDDING_CACHE_SIZE", 20000)
+
+# Хранение артефактов (загрузки, отчеты, Timeline кэш, анализы)
+RETENTION_ENABLED = _env_bool("API_RETENTION_ENABLED", True)
+# Удалять артефакты без обращений дольше TTL (часы, 0 - без TTL)
+RETENTION_TTL_HOURS = _env_float("API_RETENTION_TTL_HOURS", 72.0)
+# Квота на суммарный размер (MB, 0 - без квоты) - сверх нее вытесняются давно не использованные
+RETENTION_MAX_MB = _env_int("API_RETENTION_MAX_MB", 2048)
+RETENTION_SWEEP_INTERVAL = _env_float("API_RETENTION_SWEEP_INTERVAL", 600.0)
+
+# Токен админ эндпоинтов /api/v1/admin/* (заголовок X-Admin-Token). Пусто - эндпоинты выключены
+ADMIN_TOKEN = os.getenv("API_ADMIN_TOKEN") or None
+
+# Корень данных API: uploads, reports, analyses, checkpoints, diagnostics и artifacts.db
+# (по умолчанию - директория api)
+DATA_DIR = os.getenv("API_DATA_DIR") or None
+
+# SQLite индекс артефактов (по умолчанию <API_DATA_DIR>/artifacts.db)
+ARTIFACT_DB_PATH = os.getenv("API_ARTIFACT_DB_PATH") or None
+
+# Потоковый анализ логов /ws/tail: разрешенные директории через запятую (пусто - выключен)
+TAIL_ALLOWED_ROOTS = [
+    root.strip() for root in os.getenv("API_TAIL_ALLOWED_ROOTS", "").split(",") if root.strip()
+]
+TAIL_POLL_INTERVAL = _env_float("API_TAIL_POLL_INTERVAL", 1.0)
+# Строк в одном батче сопоставления и максимум неотправленных сообщений клиента
+TAIL_BATCH_SIZE = _env_int("API_TAIL_BATCH_SIZE", 256)
+TAIL_QUEUE_SIZE = _env_int("API_TAIL_QUEUE_SIZE", 100)
+TAIL_MAX_READ_KB = _env_int("API_TAIL_MAX_READ_KB", 1024)
+# Словарь аномалий для /ws/tail (по умолчанию - общий с ботом)
+TAIL_DICTIONARY_PATH = os.getenv("API_TAIL_DICTIONARY_PATH") or None
+
+# События прогресса анализа: интервал промежуточных событий (сек), очередь подписчика,
+# сколько хранить завершенный канал для опоздавших подписчиков (сек)
+PROGRESS_MIN_INTERVAL = _env_float("API_PROGRESS_MIN_INTERVAL", 0.25)
+PROGRESS_QUEUE_SIZE = _env_int("API_PROGRESS_QUEUE_SIZE", 64)
+PROGRESS_RETAIN_SECONDS = _env_float("API_PROGRESS_RETAIN_SECONDS", 300.0)
+
+# Потоковая выдача находок /api/v1/analyze/stream: WARNING строк в одном батче сопоставления
+STREAM_BATCH_SIZE = _env_int("API_STREAM_BATCH_SIZE", 2048)
+
+# Метрики Prometheus (/metrics)
+METRICS_ENABLED = _env_bool("API_METRICS_ENABLED", True)
+
+# Заголовок Server-Timing с wall/CPU временем этапов в ответе /api/v1/analyze
+SERVER_TIMING_ENABLED = _env_bool("API_SERVER_TIMING", True)
+
+# Профили медленных запросов анализа и Timeline: порог длительности (сек, 0 - выключено),
+# период снятия стеков (мс), сколько последних профилей хранить, директория (по умолчанию <API_DATA_DIR>/diagnostics)
+PROFILE_SLOW_SECONDS = _env_float("API_PROFILE_SLOW_SECONDS", 0.0)
+PROFILE_INTERVAL_MS = _env_float("API_PROFILE_INTERVAL_MS", 10.0)
+PROFILE_MAX_CAPTURES = _env_int("API_PROFILE_MAX_CAPTURES", 50)
+DIAGNOSTICS_DIR = os.getenv("API_DIAGNOSTICS_DIR") or None
+
+# Пик и прирост памяти этапов анализа (tracemalloc) в timings, Server-Timing и /metrics.
+# tracemalloc замедляет аллокации - режим для диагностики
+MEMORY_TRACKING = _env_bool("API_MEMORY_TRACKING", False)
+MEMORY_TRACKING_FRAMES = _env_int("API_MEMORY_TRACKING_FRAMES", 1)
@@ -4,28 +4,57 @@
 Генерирует Excel отчеты в том же формате, что и для защиты.
 """
 
+import asyncio
 import logging
 import os
 import tempfile
 import time
+import tracemalloc
 import hashlib
+import hmac
+import re
 import shutil
-from typing import Optional, List
+import zipfile
+from contextlib import asynccontextmanager
+from typing import Iterator, Optional, List, Tuple
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Form
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Depends, Form, Header, Request, WebSocket, status
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
 
 # Импортируем логику коллеги из core
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from core.services.ml_analyzer import MLLogAnalyzer
+from core.services.findings import FindingsStream, MatchState
+from core.services.incremental import IncrementalAnalyzer, default_source_key
+from core.services.ml_analyzer import AnalysisOptions, MLLogAnalyzer
 from core.services.log_parser import LogParser
+from core.services.log_tailer import LogTailer
+from core.services.metrics import REGISTRY
+from core.services.progress import NULL_PROGRESS, STAGE_FINDINGS, STAGE_REPORT
 from core.services.report_generator import ReportGenerator
+from core.services.text_normalizer import TextNormalizer, parse_source_masks
+from core.services.timing import StageTimer, span
+
+from api import config
+from api.artifact_store import ArtifactStore, REPORT_EXCEL, REPORT_MEDIA_TYPES, REPORT_TIMELINE, REPORT_TRACE, zip_members
+from api.compression import CompressionMiddleware, precompressed_response, write_precompressed
+from api.metrics import (
+    CHART_SECONDS, CONTENT_TYPE as METRICS_CONTENT_TYPE, EXCEL_SECONDS, GRAPH_SECONDS, TIMELINE_CACHE_HITS,
+    TIMELINE_CACHE_MISSES, TIMELINE_SECONDS, UPLOAD_BYTES, MetricsMiddleware,
+)
+from api.retention import RetentionManager, request_temp_dir, touch
+from api.profiler import ProfilerMiddleware, SlowRequestProfiler
+from api.progress import ProgressHub, valid_job_id
+from api.tail import TailSession, resolve_tail_path
+from api.responses import (
+    FastJSONResponse, dumps, format_results, stream_frame, RESULTS_LAYOUTS, RESULTS_LAYOUT_RECORDS,
+    STREAM_FORMAT_NDJSON, STREAM_FORMAT_SSE, STREAM_MEDIA_TYPES,
+)
+from api.warmup import ModelWarmup, ModelNotReadyError
 
 # Настройка логирования
 logging.basicConfig(
@@ -34,13 +63,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Старт без блокировки: модель грузится в фоне, соединения принимаются сразу."""
+    if config.PRELOAD_MODEL:
+        model_warmup.start()
+    if config.RETENTION_ENABLED:
+        retention_manager.start()
+    yield
+    await retention_manager.stop()
+    ml_analyzer.stop_schedulers()
+
+
 # Создаем FastAPI приложение
 app = FastAPI(
     title="AtomicHack Log Monitor API",
     description="API для ML-анализа логов. Использует ту же логику, что и Telegram бот.",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS middleware для веб-интерфейса
@@ -52,23 +96,122 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Сжатие ответов (gzip/brotli) - Timeline HTML и JSON с графиками весят мегабайты
+if config.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=config.COMPRESSION_MIN_SIZE,
+        gzip_level=config.GZIP_LEVEL,
+        brotli_quality=config.BROTLI_QUALITY,
+    )
+
+# Запросы анализа в работе и их длительность для /metrics
+if config.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Корень загрузок, отчетов, анализов, контрольных точек, профилей и индекса артефактов
+DATA_DIR = config.DATA_DIR or os.path.dirname(__file__)
+
+# Профили (collapsed stacks) запросов анализа и Timeline медленнее порога
+slow_request_profiler = SlowRequestProfiler(
+    config.DIAGNOSTICS_DIR or os.path.join(DATA_DIR, 'diagnostics'),
+    threshold_seconds=config.PROFILE_SLOW_SECONDS,
+    interval_seconds=config.PROFILE_INTERVAL_MS / 1000,
+    max_captures=config.PROFILE_MAX_CAPTURES,
+)
+if config.PROFILE_SLOW_SECONDS > 0:
+    app.add_middleware(ProfilerMiddleware, profiler=slow_request_profiler)
+
+# Пик памяти этапов анализа: tracemalloc запускается до создания сервисов
+if config.MEMORY_TRACKING and not tracemalloc.is_tracing():
+    tracemalloc.start(config.MEMORY_TRACKING_FRAMES)
+
 # Инициализируем сервисы (логика коллеги)
-ml_analyzer = MLLogAnalyzer(similarity_threshold=0.7)
-log_parser = LogParser()
+ml_analyzer = MLLogAnalyzer(
+    similarity_threshold=0.7,
+    encoder_backend=config.ML_ENCODER_BACKEND,
+    model_name=config.ML_MODEL_NAME,
+    onnx_cache_dir=config.ONNX_CACHE_DIR,
+    dynamic_batching=config.ML_DYNAMIC_BATCHING,
+    max_batch_size=config.ML_BATCH_MAX_SIZE,
+    max_wait_ms=config.ML_BATCH_MAX_WAIT_MS,
+    embedding_cache_dir=config.ML_EMBEDDING_CACHE_DIR,
+    ann_index=config.ML_ANN_ENABLED,
+    ann_min_dictionary_size=config.ML_ANN_MIN_DICTIONARY_SIZE,
+    ann_lists=config.ML_ANN_LISTS,
+    ann_probe=config.ML_ANN_PROBE,
+    exact_match=config.ML_EXACT_MATCH,
+    normalized_match=config.ML_NORMALIZED_MATCH,
+    text_normalizer=TextNormalizer(
+        config.ML_NORMALIZER_MASKS, parse_source_masks(config.ML_NORMALIZER_SOURCE_MASKS)
+    ) if config.ML_TEXT_NORMALIZATION else None,
+    embedding_cache_size=config.ML_EMBEDDING_CACHE_SIZE,
+)
+log_parser = LogParser(
+    mine_templates=config.LOG_TEMPLATE_MINING,
+    template_similarity=config.LOG_TEMPLATE_SIMILARITY,
+)
 report_generator = ReportGenerator()
 
 # Создаем директории для сохранения отчетов и загруженных файлов
-REPORTS_DIR = os.path.join(os.path.dirname(__file__), 'reports')
-UPLOADS_DIR = os.path.join(os.path.dirname(__file__), 'uploads')
+REPORTS_DIR = os.path.join(DATA_DIR, 'reports')
+UPLOADS_DIR = os.path.join(DATA_DIR, 'uploads')
+# Результаты сопоставления (top-k индексы и score) для повторного применения порога
+ANALYSES_DIR = os.path.join(DATA_DIR, 'analyses')
+# Контрольные точки инкрементального анализа дописываемых файлов
+CHECKPOINTS_DIR = os.path.join(DATA_DIR, 'checkpoints')
 os.makedirs(REPORTS_DIR, exist_ok=True)
 os.makedirs(UPLOADS_DIR, exist_ok=True)
+os.makedirs(ANALYSES_DIR, exist_ok=True)
+os.makedirs(CHECKPOINTS_DIR, exist_ok=True)
+
+# Индекс артефактов: file_id -> загрузка, состав ZIP, анализ, отчеты (вместо перебора директорий)
+artifact_store = ArtifactStore(config.ARTIFACT_DB_PATH or os.path.join(DATA_DIR, 'artifacts.db'))
+artifact_store.backfill(UPLOADS_DIR, REPORTS_DIR, ANALYSES_DIR)
 
-# Загружаем ML модель один раз при старте (для быстрых анализов)
-logger.info("⏳ Загрузка ML модели при старте API...")
-ml_analyzer._load_model()
-logger.info("✅ ML модель загружена и готова к анализам")
+# TTL, квота и фоновая очистка артефактов (запускается в lifespan)
+retention_manager = RetentionManager(
+    {"uploads": UPLOADS_DIR, "reports": REPORTS_DIR, "analyses": ANALYSES_DIR, "checkpoints": CHECKPOINTS_DIR},
+    ttl_seconds=config.RETENTION_TTL_HOURS * 3600,
+    max_bytes=config.RETENTION_MAX_MB * 1024 * 1024,
+    sweep_interval=config.RETENTION_SWEEP_INTERVAL,
+    on_remove=artifact_store.forget_paths,
+)
+
+incremental_analyzer = IncrementalAnalyzer(ml_analyzer, log_parser, CHECKPOINTS_DIR)
+
+# События прогресса анализов по job_id (/ws/progress, /api/v1/progress)
+progress_hub = ProgressHub(
+    queue_size=config.PROGRESS_QUEUE_SIZE,
+    retain_seconds=config.PROGRESS_RETAIN_SECONDS,
+    min_interval=config.PROGRESS_MIN_INTERVAL,
+)
+
+# Метрики, которые читаются в момент сборки /metrics
+REGISTRY.gauge(
+    "logmonitor_artifacts_bytes", "Занятость директорий с артефактами (по последней очистке)", ("directory",),
+    function=lambda: {(name,): usage["bytes"] for name, usage in retention_manager.metrics()["directories"].items()},
+)
+REGISTRY.gauge(
+    "logmonitor_artifact_records", "Записей в индексе артефактов", ("table",),
+    function=lambda: {(table,): count for table, count in artifact_store.counts().items()},
+)
+REGISTRY.gauge(
+    "logmonitor_embedding_cache_entries", "Векторов в LRU кэше эмбеддингов WARNING",
+    function=lambda: len(ml_analyzer.embedding_cache) if ml_analyzer.embedding_cache is not None else 0,
+)
 
+# Дефолтный словарь аномалий (общий с ботом)
+DEFAULT_ANOMALIES_PATH = os.path.join(
+    os.path.dirname(__file__), '..', 'src', 'bot', 'services', 'anomalies_problems.csv'
+)
+
+# ML модель загружается и прогревается в фоне после старта (см. lifespan),
+# готовность отдается через /readyz
+model_warmup = ModelWarmup(ml_analyzer)
 
+
+@CHART_SECONDS.time()
 def generate_log_visualization(logs_df: pd.DataFrame) -> str:
     """
     Генерирует интерактивный HTML график распределения логов по времени.
@@ -80,6 +223,8 @@ def generate_log_visualization(logs_df: pd.DataFrame) -> str:
         HTML строка с графиком
     """
     try:
+        import plotly.graph_objects as go
+        
         # Подготовляем данные
         df = logs_df.copy()
         
@@ -157,6 +302,7 @@ def generate_log_visualization(logs_df: pd.DataFrame) -> str:
         return f"<div style='color: red;'>Ошибка при генерации графика: {str(e)}</div>"
 
 
+@TIMELINE_SECONDS.time()
 def generate_timeline_visualization_from_df(logs_df: pd.DataFrame) -> str:
     """
     Генерирует Timeline график от коллеги (из graphics.py) для DataFrame.
@@ -169,6 +315,8 @@ def generate_timeline_visualization_from_df(logs_df: pd.DataFrame) -> str:
         HTML строка с графиком Timeline
     """
     try:
+        import plotly.express as px
+        
         df = logs_df.copy()
         
         # Проверяем наличие необходимых колонок
@@ -230,6 +378,7 @@ def generate_timeline_visualization_from_df(logs_df: pd.DataFrame) -> str:
         return f"<div style='color: red;'>Ошибка при генерации Timeline: {str(e)}</div>"
 
 
+@GRAPH_SECONDS.time()
 def generate_anomaly_graph(results_df: pd.DataFrame, anomalies_df: pd.DataFrame) -> str:
     """
     Генерирует интерактивный граф связей между аномалиями и проблемами.
@@ -352,25 +501,233 @@ async def root():
     }
 
 
+@app.get("/livez")
+async def liveness_check():
+    """Liveness probe: процесс жив и обслуживает event loop."""
+    return {"status": "alive"}
+
+
+@app.get("/readyz")
+async def readiness_check():
+    """Readiness probe: 200 только когда ML модель загружена и прогрета."""
+    state = model_warmup.state()
+    if not model_warmup.is_ready:
+        return JSONResponse(status_code=503, content=state, headers={"Retry-After": "5"})
+    return state
+
+
 @app.get("/health")
 async def health_check():
     """Проверка здоровья API."""
     return {
         "status": "healthy",
-        "ml_model": "loaded" if ml_analyzer.model is not None else "not_loaded",
+        "ml_model": "loaded" if model_warmup.is_ready else model_warmup.status,
         "services": {
-            "ml_analyzer": "ready",
+            "ml_analyzer": "ready" if model_warmup.is_ready else model_warmup.status,
             "log_parser": "ready",
             "report_generator": "ready"
         }
     }
 
 
+def _parse_unit_interval(value: str, default: float, name: str) -> float:
+    """Парсит число из формы и ограничивает его диапазоном [0, 1]."""
+    try:
+        return max(0.0, min(1.0, float(value)))
+    except (ValueError, TypeError):
+        logger.warning(f"Неверное значение {name}: {value}, использую дефолтное {default}")
+        return default
+
+
+def _analysis_state_path(analysis_id: str) -> str:
+    """Путь к сохраненному MatchState анализа (analysis_id = file_id)."""
+    if not re.fullmatch(r"[0-9a-f]{32}", analysis_id):
+        raise HTTPException(status_code=400, detail="Неверный идентификатор анализа")
+    return os.path.join(ANALYSES_DIR, f"{analysis_id}.pkl")
+
+
+def _existing_artifact(record: Optional[dict]) -> Optional[str]:
+    """Путь артефакта из индекса, если файл еще на месте (иначе запись удаляется)."""
+    if record is None:
+        return None
+    if not os.path.exists(record["path"]):
+        artifact_store.forget_paths([record["path"]])
+        return None
+    touch(record["path"])
+    return record["path"]
+
+
+def _store_timeline(cache_path: str, html: str, file_id: str) -> None:
+    """Сохраняет Timeline в кэш (с .gz/.br вариантами) и в индекс артефактов."""
+    write_precompressed(cache_path, html.encode('utf-8'))
+    artifact_store.add_report(cache_path, REPORT_TIMELINE, file_id)
+
+
+def _register_upload(file_id: str, filename: str, path: str, content: bytes) -> None:
+    """Добавляет загрузку в индекс артефактов (состав ZIP читается из каталога архива)."""
+    members = None
+    if filename.lower().endswith('.zip'):
+        try:
+            members = zip_members(path)
+        except zipfile.BadZipFile:
+            members = None
+    artifact_store.add_upload(file_id, filename, path, len(content), hashlib.sha256(content).hexdigest(), members)
+
+
+def _check_analysis_params(results_layout: str, top_k: int, model: Optional[str]) -> None:
+    """Проверяет общие параметры анализа из формы.
+
+    Raises:
+        HTTPException: 400 при неверном results_layout, top_k или модели
+    """
+    if results_layout not in RESULTS_LAYOUTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неверный results_layout: {results_layout}. Допустимо: {', '.join(RESULTS_LAYOUTS)}"
+        )
+    if not 1 <= top_k <= config.ML_MAX_TOP_K:
+        raise HTTPException(status_code=400, detail=f"top_k должен быть от 1 до {config.ML_MAX_TOP_K}")
+    if model and model not in config.ML_ALLOWED_MODELS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Модель {model} недоступна. Допустимо: {', '.join(config.ML_ALLOWED_MODELS)}"
+        )
+
+
+async def _save_upload(log_file: UploadFile) -> Tuple[str, str]:
+    """Сохраняет загруженный файл в UPLOADS_DIR и регистрирует его в индексе.
+
+    Returns:
+        (file_id, путь к сохраненному файлу)
+    """
+    # Генерируем file_id сразу
+    file_id = hashlib.md5(f"{log_file.filename}_{time.time()}".encode()).hexdigest()
+
+    # Читаем файл один раз в память
+    content = await log_file.read()
+    UPLOAD_BYTES.observe(len(content))
+
+    # Сохраняем СРАЗУ в постоянное хранилище (избегаем двойного копирования)
+    permanent_path = os.path.join(UPLOADS_DIR, f"{file_id}_{log_file.filename}")
+    with open(permanent_path, 'wb') as f:
+        f.write(content)
+    logger.info(f"📁 Файл сохранен для анализа и будущих графиков: {permanent_path}")
+
+    # Регистрируем загрузку в индексе (для ZIP - вместе с составом архива)
+    await run_in_threadpool(_register_upload, file_id, log_file.filename, permanent_path, content)
+    return file_id, permanent_path
+
+
+def _log_files(filename: str, log_file_path: str, temp_dir: str) -> List[str]:
+    """Файлы с логами загрузки: содержимое ZIP архива (без словаря) или сам файл."""
+    if filename.endswith('.zip'):
+        logger.info("Извлекаем ZIP архив")
+        log_files = log_parser.extract_zip(log_file_path, temp_dir)
+        # Фильтруем только лог-файлы (не CSV)
+        return [f for f in log_files if not f.endswith('anomalies_problems.csv')]
+    return [log_file_path]
+
+
+async def _load_anomalies(anomalies_file: Optional[UploadFile], filename: str,
+                          log_file_path: str, temp_dir: str) -> pd.DataFrame:
+    """Словарь аномалий: загруженный, из ZIP архива или дефолтный.
+
+    Raises:
+        HTTPException: 400, если словарь не найден
+    """
+    if anomalies_file:
+        logger.info(f"Используем пользовательский словарь: {anomalies_file.filename}")
+        anomalies_path = os.path.join(temp_dir, anomalies_file.filename)
+        with open(anomalies_path, 'wb') as f:
+            content = await anomalies_file.read()
+            f.write(content)
+    else:
+        # Проверяем, только если это ZIP архив
+        if filename.lower().endswith('.zip'):
+            extracted_anomalies = [f for f in log_parser.extract_zip(log_file_path, temp_dir)
+                                  if f.endswith('anomalies_problems.csv')]
+
+            if extracted_anomalies:
+                logger.info(f"Найден словарь в ZIP: {extracted_anomalies[0]}")
+                anomalies_path = extracted_anomalies[0]
+            else:
+                anomalies_path = None
+        else:
+            anomalies_path = None
+
+        # Если словарь не найден - используем дефолтный
+        if not anomalies_path:
+            if os.path.exists(DEFAULT_ANOMALIES_PATH):
+                logger.info("Используем дефолтный словарь аномалий")
+                anomalies_path = DEFAULT_ANOMALIES_PATH
+            else:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Словарь аномалий не найден. Загрузите файл anomalies_problems.csv"
+                )
+
+    # Читаем словарь аномалий
+    anomalies_df = pd.read_csv(anomalies_path, sep=';', encoding='utf-8')
+    logger.info(f"Загружено {len(anomalies_df)} аномалий из словаря")
+    return anomalies_df
+
+
+async def _create_excel_report(results_df: pd.DataFrame, excel_filename: str,
+                               file_id: Optional[str] = None) -> Optional[str]:
+    """Создает Excel отчет в REPORTS_DIR (ТОЧНО ТАК ЖЕ КАК ДЛЯ ЗАЩИТЫ).
+
+    Returns:
+        Путь к отчету или None, если результатов нет
+    """
+    if results_df.empty:
+        return None
+
+    # Добавляем поле 'Сценарий' для совместимости с report_generator
+    results_df_with_scenario = results_df.copy()
+    results_df_with_scenario['Сценарий'] = 1  # ID сценария по умолчанию
+
+    # Конвертируем DataFrame в формат для report_generator (точно как в боте)
+    analysis_results = [{
+        'results': results_df_with_scenario.to_dict('records')
+    }]
+
+    # Создаем Excel отчет СРАЗУ в постоянной директории (избегаем копирования)
+    excel_report_path = os.path.join(REPORTS_DIR, excel_filename)
+    with EXCEL_SECONDS.time():
+        excel_report_path = await run_in_threadpool(
+            report_generator.create_excel_report,
+            analysis_results,
+            excel_report_path
+        )
+    logger.info(f"Excel отчет создан: {excel_report_path}")
+    await run_in_threadpool(artifact_store.add_report, excel_report_path, REPORT_EXCEL, file_id)
+    return excel_report_path
+
+
+def _save_trace(timer: StageTimer, file_id: str) -> str:
+    """Сохраняет интервалы запроса как trace JSON в REPORTS_DIR.
+
+    Returns:
+        Ссылка на скачивание trace файла
+    """
+    trace_path = timer.save_trace(os.path.join(REPORTS_DIR, f"trace_{file_id}.json"), f"analyze {file_id}")
+    artifact_store.add_report(trace_path, REPORT_TRACE, file_id)
+    return f"/api/v1/download/{os.path.basename(trace_path)}"
+
+
 @app.post("/api/v1/analyze")
 async def analyze_logs(
     log_file: UploadFile = File(..., description="Файл с логами (.txt, .log, .zip)"),
     anomalies_file: Optional[UploadFile] = File(None, description="Словарь аномалий (anomalies_problems.csv)"),
-    threshold: str = Form("0.7")
+    threshold: str = Form("0.7"),
+    results_layout: str = Form(RESULTS_LAYOUT_RECORDS, description="Формат results: records (список строк) или columns (словарь колонок)"),
+    new_anomaly_floor: str = Form("0.5", description="Минимальный score новой аномалии (ниже threshold)"),
+    top_k: int = Form(1, description="Сколько ближайших аномалий словаря проверять для каждой WARNING строки"),
+    model: Optional[str] = Form(None, description="Модель кодирования (из ML_ALLOWED_MODELS)"),
+    incremental: bool = Form(False, description="Анализировать только дописанный хвост файла (txt/log)"),
+    source_key: Optional[str] = Form(None, description="Идентичность файла для incremental (по умолчанию - имя файла и хэш первой строки)"),
+    job_id: Optional[str] = Form(None, description="ID для событий прогресса (/ws/progress/{job_id})"),
+    timings: bool = Form(False, description="Добавить в ответ разбивку времени по этапам и trace файл")
 ):
     """
     Анализирует логи с использованием ML (логика коллеги).
@@ -381,160 +738,168 @@ async def analyze_logs(
         log_file: Файл с логами (txt, log или zip)
         anomalies_file: Опциональный словарь аномалий (если не указан, используется дефолтный)
         threshold: Порог similarity для ML-модели (0.0-1.0)
+        results_layout: Формат таблицы results - "records" или "columns"
+        new_anomaly_floor: Минимальный score новой аномалии (0.0-1.0)
+        top_k: Число ближайших аномалий словаря для каждой WARNING строки
+        model: Модель кодирования (по умолчанию ML_MODEL_NAME)
+        incremental: Продолжить с контрольной точки прошлого анализа этого файла
+        source_key: Ключ контрольной точки (по умолчанию - имя файла и хэш его первой строки)
+        job_id: Идентификатор для подписки на прогресс (латиница, цифры, - и _)
+        timings: Вернуть блок timings (wall/CPU по этапам) и ссылку на trace файл
     
     Returns:
         JSON с результатами анализа и ссылкой на Excel отчет
     """
-    temp_dir = tempfile.mkdtemp()
+    _check_analysis_params(results_layout, top_k, model)
+    if job_id is not None and not valid_job_id(job_id):
+        raise HTTPException(status_code=400, detail="Неверный job_id: до 64 символов A-Z, a-z, 0-9, - и _")
+    progress = progress_hub.reporter(job_id) if job_id else NULL_PROGRESS
+    
+    # Временная директория удаляется в finally при любом исходе запроса
+    temp_dir_handle = request_temp_dir()
+    temp_dir = temp_dir_handle.name
+    # Этапы запроса для Server-Timing и блока timings (span() в core пишет в текущий таймер)
+    timer = (
+        StageTimer(memory=config.MEMORY_TRACKING)
+        if timings or config.SERVER_TIMING_ENABLED or config.MEMORY_TRACKING else None
+    )
+    timer_token = timer.activate() if timer is not None else None
     
     try:
-        # Преобразуем threshold из строки в число
-        try:
-            threshold_float = float(threshold)
-            # Убедимся, что threshold в допустимом диапазоне
-            threshold_float = max(0.0, min(1.0, threshold_float))
-        except (ValueError, TypeError):
-            threshold_float = 0.7
-            logger.warning(f"Неверное значение threshold: {threshold}, использую дефолтное 0.7")
+        # Параметры анализа - свои для каждого запроса, общий анализатор не меняется
+        threshold_float = _parse_unit_interval(threshold, 0.7, "threshold")
+        options = AnalysisOptions(
+            similarity_threshold=threshold_float,
+            new_anomaly_floor=_parse_unit_interval(new_anomaly_floor, 0.5, "new_anomaly_floor"),
+            model_name=model or None,
+            top_k=top_k,
+        )
         
         logger.info(f"Получен запрос на анализ: {log_file.filename}")
         logger.info(f"🎯 Используемый порог схожести: {threshold_float}")
         
-        # Генерируем file_id сразу
-        file_id = hashlib.md5(f"{log_file.filename}_{time.time()}".encode()).hexdigest()
-        
-        # Читаем файл один раз в память
-        content = await log_file.read()
-        
-        # Сохраняем СРАЗУ в постоянное хранилище (избегаем двойного копирования)
-        permanent_path = os.path.join(UPLOADS_DIR, f"{file_id}_{log_file.filename}")
-        with open(permanent_path, 'wb') as f:
-            f.write(content)
-        
-        # Используем постоянный путь для анализа (вместо temp)
-        log_file_path = permanent_path
-        logger.info(f"📁 Файл сохранен для анализа и будущих графиков: {log_file_path}")
-        
-        # Определяем файлы с логами
-        if log_file.filename.endswith('.zip'):
-            logger.info("Извлекаем ZIP архив")
-            log_files = log_parser.extract_zip(log_file_path, temp_dir)
-            # Фильтруем только лог-файлы (не CSV)
-            log_files = [f for f in log_files if not f.endswith('anomalies_problems.csv')]
-        else:
-            log_files = [log_file_path]
-        
-        # Парсим логи (логика коллеги)
-        logger.info(f"Парсинг {len(log_files)} файлов логов")
-        logs_df = log_parser.parse_log_files(log_files)
-        
-        if logs_df.empty:
-            raise HTTPException(status_code=400, detail="Не удалось распарсить логи. Проверьте формат файла.")
-        
-        logger.info(f"Распарсено {len(logs_df)} строк логов")
-        
-        # Базовый анализ
-        basic_analysis = log_parser.analyze_logs_basic(logs_df)
+        # Сохраняем загрузку и определяем файлы с логами
+        with span("upload"):
+            file_id, log_file_path = await _save_upload(log_file)
+        with span("extract"):
+            log_files = _log_files(log_file.filename, log_file_path, temp_dir)
+        
+        # Инкрементальный режим: хвост файла парсится вместе с ML анализом (ниже)
+        use_incremental = incremental and not log_file.filename.lower().endswith('.zip')
+        if not use_incremental:
+            # Парсим логи (логика коллеги)
+            logger.info(f"Парсинг {len(log_files)} файлов логов")
+            with span("parse"):
+                logs_df = await run_in_threadpool(log_parser.parse_log_files, log_files, progress)
+            
+            if logs_df.empty:
+                raise HTTPException(status_code=400, detail="Не удалось распарсить логи. Проверьте формат файла.")
+            
+            logger.info(f"Распарсено {len(logs_df)} строк логов")
+            
+            # Базовый анализ
+            with span("basic_stats"):
+                basic_analysis = log_parser.analyze_logs_basic(logs_df)
         
         # Загружаем словарь аномалий
-        if anomalies_file:
-            logger.info(f"Используем пользовательский словарь: {anomalies_file.filename}")
-            anomalies_path = os.path.join(temp_dir, anomalies_file.filename)
-            with open(anomalies_path, 'wb') as f:
-                content = await anomalies_file.read()
-                f.write(content)
-        else:
-            # Проверяем, только если это ZIP архив
-            if log_file.filename.lower().endswith('.zip'):
-                extracted_anomalies = [f for f in log_parser.extract_zip(log_file_path, temp_dir) 
-                                      if f.endswith('anomalies_problems.csv')]
-                
-                if extracted_anomalies:
-                    logger.info(f"Найден словарь в ZIP: {extracted_anomalies[0]}")
-                    anomalies_path = extracted_anomalies[0]
-                else:
-                    anomalies_path = None
-            else:
-                anomalies_path = None
-            
-            # Если словарь не найден - используем дефолтный
-            if not anomalies_path:
-                default_anomalies = os.path.join(
-                    os.path.dirname(__file__), 
-                    '..', 'src', 'bot', 'services', 'anomalies_problems.csv'
-                )
-                if os.path.exists(default_anomalies):
-                    logger.info("Используем дефолтный словарь аномалий")
-                    anomalies_path = default_anomalies
-                else:
-                    raise HTTPException(
-                        status_code=400, 
-                        detail="Словарь аномалий не найден. Загрузите файл anomalies_problems.csv"
-                    )
-        
-        # Читаем словарь аномалий
-        anomalies_df = pd.read_csv(anomalies_path, sep=';', encoding='utf-8')
-        logger.info(f"Загружено {len(anomalies_df)} аномалий из словаря")
-        
-        # ML-анализ (ЛОГИКА КОЛЛЕГИ БЕЗ ИЗМЕНЕНИЙ)
-        ml_analyzer.similarity_threshold = threshold_float
+        with span("dictionary_load"):
+            anomalies_df = await _load_anomalies(anomalies_file, log_file.filename, log_file_path, temp_dir)
+        
+        # Если модель еще грузится - ждем ее (парсинг выше уже выполнен параллельно)
+        try:
+            with span("model_wait"):
+                await model_warmup.wait_ready(config.MODEL_READY_TIMEOUT)
+        except ModelNotReadyError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
+        
+        # ML-анализ: сопоставление WARNING строк со словарем (MatchState), затем находки по порогу
+        # Тяжелые этапы выполняются в пуле потоков, чтобы параллельные анализы
+        # не блокировали event loop
         logger.info(f"Запуск ML-анализа с порогом {threshold_float}")
-        results_df = ml_analyzer.analyze_logs_with_ml(logs_df, anomalies_df)
+        incremental_result = None
+        if use_incremental:
+            with span("match", incremental=True):
+                incremental_result = await run_in_threadpool(
+                    incremental_analyzer.analyze, source_key or default_source_key(log_file.filename, log_file_path),
+                    log_file_path, anomalies_df, options, progress
+                )
+            match_state = incremental_result.match_state
+            # Базовая статистика - по впервые проанализированным строкам
+            logs_df = incremental_result.new_logs
+            if logs_df.empty and incremental_result.reused_warnings == 0 and incremental_result.from_line == 1:
+                raise HTTPException(status_code=400, detail="Не удалось распарсить логи. Проверьте формат файла.")
+            with span("basic_stats"):
+                basic_analysis = log_parser.analyze_logs_basic(logs_df)
+        else:
+            with span("match"):
+                match_state = await run_in_threadpool(ml_analyzer.match_warnings, logs_df, anomalies_df, options, progress)
+        progress.stage(STAGE_FINDINGS, warnings=match_state.warning_count)
+        with span("findings"):
+            results_df = match_state.build_findings(options.similarity_threshold, options.new_anomaly_floor)
         
         logger.info(f"ML-анализ завершен: найдено {len(results_df)} проблем")
         
+        # Сохраняем результаты сопоставления - смена порога не потребует повторного анализа
+        state_path = _analysis_state_path(file_id)
+        with span("save_state"):
+            await run_in_threadpool(match_state.save, state_path)
+        await run_in_threadpool(
+            artifact_store.add_analysis, file_id, state_path, threshold_float, options.top_k,
+            options.model_name or ml_analyzer.model_name, match_state.warning_count
+        )
+        
         # Получаем статистику
         summary = ml_analyzer.get_analysis_summary(results_df)
         
         # Создаем Excel отчет (ТОЧНО ТАК ЖЕ КАК ДЛЯ ЗАЩИТЫ)
-        excel_report_path = None
-        if not results_df.empty:
-            # Добавляем поле 'Сценарий' для совместимости с report_generator
-            results_df_with_scenario = results_df.copy()
-            results_df_with_scenario['Сценарий'] = 1  # ID сценария по умолчанию
-            
-            # Конвертируем DataFrame в формат для report_generator (точно как в боте)
-            analysis_results = [{
-                'results': results_df_with_scenario.to_dict('records')
-            }]
-            
-            # Создаем Excel отчет СРАЗУ в постоянной директории (избегаем копирования)
-            excel_filename = f"analysis_report_{file_id}_{log_file.filename}.xlsx"
-            excel_report_path = os.path.join(REPORTS_DIR, excel_filename)
-            excel_report_path = report_generator.create_excel_report(
-                analysis_results, 
-                excel_report_path
+        progress.stage(STAGE_REPORT, problems=len(results_df))
+        with span("report"):
+            excel_report_path = await _create_excel_report(
+                results_df, f"analysis_report_{file_id}_{log_file.filename}.xlsx", file_id
             )
-            logger.info(f"Excel отчет создан: {excel_report_path}")
         
         # Формируем ответ
         logger.info("Формирую ответ...")
         response = {
             "status": "success",
             "file_id": file_id,  # ID файла для будущей генерации графиков
+            "analysis_id": file_id,  # ID для /api/v1/analyses/{analysis_id}/rethreshold
             "filename": log_file.filename,
             "analysis": {
                 "basic_stats": basic_analysis,
-                "ml_results": summary,
-                "threshold_used": threshold_float
+                "ml_results": {**summary, "stage_counts": match_state.stage_counts},
+                "threshold_used": threshold_float,
+                "new_anomaly_floor": options.new_anomaly_floor,
+                "top_k": options.top_k,
+                "model": options.model_name or ml_analyzer.model_name
             },
-            "results": results_df.to_dict('records') if not results_df.empty else [],
+            "results_layout": results_layout,
+            "results": format_results(results_df, results_layout),
             "excel_report": f"/api/v1/download/{os.path.basename(excel_report_path)}" if excel_report_path else None,
         }
+        if incremental_result is not None:
+            response["incremental"] = {
+                "mode": incremental_result.mode,
+                "from_line": incremental_result.from_line,
+                "analyzed_lines": incremental_result.checkpoint.line_number,
+                "reused_warnings": incremental_result.reused_warnings,
+            }
         
         # Генерируем графики только для небольших файлов (до 10k строк)
         # Для больших файлов графики можно сгенерировать отдельно через Dashboard
         if len(logs_df) <= 10000:
             logger.info(f"Генерирую графики для {len(logs_df)} строк...")
             try:
-                response["log_visualization"] = generate_log_visualization(logs_df) if not logs_df.empty else None
+                with span("charts"):
+                    response["log_visualization"] = generate_log_visualization(logs_df) if not logs_df.empty else None
                 logger.info("График логов создан")
             except Exception as e:
                 logger.error(f"Ошибка при генерации графика логов: {e}")
                 response["log_visualization"] = None
             
             try:
-                response["anomaly_graph"] = generate_anomaly_graph(results_df, anomalies_df) if not results_df.empty else None
+                with span("charts"):
+                    response["anomaly_graph"] = generate_anomaly_graph(results_df, anomalies_df) if not results_df.empty else None
                 logger.info("График аномалий создан")
             except Exception as e:
                 logger.error(f"Ошибка при генерации графика аномалий: {e}")
@@ -544,53 +909,393 @@ async def analyze_logs(
             response["log_visualization"] = None
             response["anomaly_graph"] = None
         
+        headers = {}
+        if timer is not None:
+            headers["Server-Timing"] = timer.server_timing()
+            if timings:
+                response["timings"] = timer.to_dict()
+                response["trace"] = await run_in_threadpool(_save_trace, timer, file_id)
+        
         logger.info("Возвращаю ответ клиенту")
-        return response
+        progress.finish(analysis_id=file_id, total_problems=summary.get("total_problems", len(results_df)))
+        # Отдаем готовый Response, чтобы не гонять результаты через jsonable_encoder
+        return FastJSONResponse(content=response, headers=headers)
         
+    except HTTPException as e:
+        progress.fail(str(e.detail))
+        raise
     except Exception as e:
         logger.error(f"Ошибка при анализе: {e}", exc_info=True)
+        progress.fail(str(e))
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        temp_dir_handle.cleanup()
+        if timer_token is not None:
+            StageTimer.deactivate(timer_token)
+
+
+def _stream_findings(file_id: str, filename: str, basic_analysis: dict, logs_df: pd.DataFrame,
+                     anomalies_df: pd.DataFrame, options: AnalysisOptions, results_layout: str,
+                     stream_format: str) -> Iterator[bytes]:
+    """Кадры потоковой выдачи находок: start, findings по батчам, summary (или error).
+
+    Синхронный генератор - StreamingResponse итерирует его в пуле потоков,
+    поэтому кодирование батчей не блокирует event loop.
+    """
+    def frame(frame_type: str, content: dict) -> bytes:
+        return stream_frame({"type": frame_type, **content}, stream_format, frame_type)
+
+    try:
+        warnings_total = int((logs_df["level"] == "WARNING").sum())
+        yield frame("start", {
+            "file_id": file_id,
+            "analysis_id": file_id,
+            "filename": filename,
+            "basic_stats": basic_analysis,
+            "warnings": warnings_total,
+            "batch_size": config.STREAM_BATCH_SIZE,
+        })
+
+        stream = FindingsStream(logs_df, anomalies_df, options, options.similarity_threshold, options.new_anomaly_floor)
+        warnings_done = 0
+        batches = ml_analyzer.iter_match_batches(logs_df, anomalies_df, options, config.STREAM_BATCH_SIZE)
+        for batch_number, batch in enumerate(batches):
+            results_df = stream.add(batch)
+            warnings_done += batch.warning_count
+            yield frame("findings", {
+                "kind": "known",
+                "batch": batch_number,
+                "warnings_done": warnings_done,
+                "warnings_total": warnings_total,
+                "count": len(results_df),
+                "results": format_results(results_df, results_layout),
+            })
+
+        # Новые аномалии упорядочены по score среди всех WARNING - отдаются после последнего батча
+        match_state = stream.finish()
+        for results_df in stream.new_anomalies(match_state, config.STREAM_BATCH_SIZE):
+            yield frame("findings", {
+                "kind": "new",
+                "count": len(results_df),
+                "results": format_results(results_df, results_layout),
+            })
+
+        state_path = _analysis_state_path(file_id)
+        match_state.save(state_path)
+        artifact_store.add_analysis(
+            file_id, state_path, options.similarity_threshold, options.top_k,
+            options.model_name or ml_analyzer.model_name, match_state.warning_count
+        )
+        summary = stream.summary()
+        logger.info(f"Потоковый анализ {file_id} завершен: найдено {summary['total_problems']} проблем")
+        yield frame("summary", {
+            "status": "success",
+            "analysis_id": file_id,
+            "analysis": {
+                "ml_results": {**summary, "stage_counts": match_state.stage_counts},
+                "threshold_used": options.similarity_threshold,
+                "new_anomaly_floor": options.new_anomaly_floor,
+                "top_k": options.top_k,
+                "model": options.model_name or ml_analyzer.model_name,
+                "warnings": match_state.warning_count,
+            },
+        })
+    except Exception as e:
+        # Заголовки уже отправлены - ошибка передается последним кадром
+        logger.error(f"Ошибка при потоковом анализе: {e}", exc_info=True)
+        yield frame("error", {"detail": str(e)})
+
+
+@app.post("/api/v1/analyze/stream")
+async def analyze_logs_stream(
+    log_file: UploadFile = File(..., description="Файл с логами (.txt, .log, .zip)"),
+    anomalies_file: Optional[UploadFile] = File(None, description="Словарь аномалий (anomalies_problems.csv)"),
+    threshold: str = Form("0.7"),
+    results_layout: str = Form(RESULTS_LAYOUT_RECORDS, description="Формат results в кадрах: records или columns"),
+    new_anomaly_floor: str = Form("0.5", description="Минимальный score новой аномалии (ниже threshold)"),
+    top_k: int = Form(1, description="Сколько ближайших аномалий словаря проверять для каждой WARNING строки"),
+    model: Optional[str] = Form(None, description="Модель кодирования (из ML_ALLOWED_MODELS)"),
+    stream_format: str = Form(STREAM_FORMAT_NDJSON, description="Формат потока: ndjson или sse")
+):
+    """
+    Анализирует логи и отдает находки по мере сопоставления батчей WARNING строк.
+
+    Ответ - NDJSON (application/x-ndjson) или SSE (text/event-stream) с кадрами:
+    start (basic_stats, число WARNING), findings (kind=known - находки батча
+    в порядке логов, kind=new - новые аномалии по убыванию score после всех
+    батчей) и summary (сводка и analysis_id для rethreshold); при ошибке во
+    время выдачи - error. Таблица находок целиком не собирается, Excel отчет
+    можно получить через rethreshold с with_report.
+
+    Args:
+        log_file: Файл с логами (txt, log или zip)
+        anomalies_file: Опциональный словарь аномалий (если не указан, используется дефолтный)
+        threshold: Порог similarity для ML-модели (0.0-1.0)
+        results_layout: Формат results в кадрах findings - "records" или "columns"
+        new_anomaly_floor: Минимальный score новой аномалии (0.0-1.0)
+        top_k: Число ближайших аномалий словаря для каждой WARNING строки
+        model: Модель кодирования (по умолчанию ML_MODEL_NAME)
+        stream_format: "ndjson" или "sse"
+
+    Returns:
+        Потоковый ответ с кадрами анализа
+    """
+    _check_analysis_params(results_layout, top_k, model)
+    if stream_format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неверный stream_format: {stream_format}. Допустимо: {', '.join(STREAM_MEDIA_TYPES)}"
+        )
+
+    # Временная директория нужна только до парсинга - поток работает с DataFrame
+    temp_dir_handle = request_temp_dir()
+    temp_dir = temp_dir_handle.name
+
+    try:
+        options = AnalysisOptions(
+            similarity_threshold=_parse_unit_interval(threshold, 0.7, "threshold"),
+            new_anomaly_floor=_parse_unit_interval(new_anomaly_floor, 0.5, "new_anomaly_floor"),
+            model_name=model or None,
+            top_k=top_k,
+        )
+        logger.info(f"Получен запрос на потоковый анализ: {log_file.filename}")
+
+        file_id, log_file_path = await _save_upload(log_file)
+        log_files = _log_files(log_file.filename, log_file_path, temp_dir)
+        logs_df = await run_in_threadpool(log_parser.parse_log_files, log_files)
+        if logs_df.empty:
+            raise HTTPException(status_code=400, detail="Не удалось распарсить логи. Проверьте формат файла.")
+        basic_analysis = log_parser.analyze_logs_basic(logs_df)
+        anomalies_df = await _load_anomalies(anomalies_file, log_file.filename, log_file_path, temp_dir)
+
+        try:
+            await model_warmup.wait_ready(config.MODEL_READY_TIMEOUT)
+        except ModelNotReadyError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка при подготовке потокового анализа: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        temp_dir_handle.cleanup()
+
+    # Для сопоставления нужны только WARNING и ERROR - остальные строки не держим на время потока
+    relevant_logs = logs_df[logs_df["level"].isin(["WARNING", "ERROR"])]
+    del logs_df
+    return StreamingResponse(
+        _stream_findings(
+            file_id, log_file.filename, basic_analysis, relevant_logs, anomalies_df, options,
+            results_layout, stream_format,
+        ),
+        media_type=STREAM_MEDIA_TYPES[stream_format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/v1/analyses/{analysis_id}/rethreshold")
+async def rethreshold_analysis(
+    analysis_id: str,
+    threshold: str = Form(..., description="Новый порог similarity (0.0-1.0)"),
+    new_anomaly_floor: Optional[str] = Form(None, description="Минимальный score новой аномалии (по умолчанию - как в анализе)"),
+    top_k: Optional[int] = Form(None, description="Сколько совпадений учитывать (не больше, чем в анализе)"),
+    results_layout: str = Form(RESULTS_LAYOUT_RECORDS, description="Формат results: records или columns"),
+    with_report: bool = Form(False, description="Сформировать Excel отчет для нового порога")
+):
+    """
+    Пересобирает находки анализа для нового порога без повторного анализа.
+
+    Использует сохраненные top-k индексы и score каждой WARNING строки:
+    парсинг и ML инференс не выполняются, только фильтрация массивов.
+
+    Args:
+        analysis_id: analysis_id из ответа /api/v1/analyze
+        threshold: Новый порог similarity (0.0-1.0)
+        new_anomaly_floor: Минимальный score новой аномалии (0.0-1.0)
+        top_k: Число совпадений на WARNING строку
+        results_layout: Формат таблицы results - "records" или "columns"
+        with_report: Создать Excel отчет
+
+    Returns:
+        JSON с результатами для нового порога
+    """
+    if results_layout not in RESULTS_LAYOUTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неверный results_layout: {results_layout}. Допустимо: {', '.join(RESULTS_LAYOUTS)}"
+        )
+
+    _analysis_state_path(analysis_id)
+    state_path = await run_in_threadpool(_existing_artifact, artifact_store.get_analysis(analysis_id))
+    if state_path is None:
+        raise HTTPException(status_code=404, detail=f"Анализ {analysis_id} не найден")
+    try:
+        match_state = await run_in_threadpool(MatchState.load, state_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Анализ {analysis_id} не найден")
+    except ValueError as e:
+        raise HTTPException(status_code=410, detail=str(e))
+
+    stored_options = match_state.options or AnalysisOptions()
+    threshold_float = _parse_unit_interval(threshold, stored_options.similarity_threshold, "threshold")
+    floor_float = (
+        _parse_unit_interval(new_anomaly_floor, stored_options.new_anomaly_floor, "new_anomaly_floor")
+        if new_anomaly_floor is not None else stored_options.new_anomaly_floor
+    )
+    if top_k is not None and not 1 <= top_k <= stored_options.top_k:
+        raise HTTPException(status_code=400, detail=f"top_k должен быть от 1 до {stored_options.top_k}")
+    used_top_k = top_k or stored_options.top_k
+
+    started = time.perf_counter()
+    results_df = match_state.build_findings(threshold_float, floor_float, used_top_k)
+    logger.info(
+        f"🎯 Анализ {analysis_id} пересобран с порогом {threshold_float}: "
+        f"{len(results_df)} проблем за {(time.perf_counter() - started) * 1000:.1f} мс"
+    )
+
+    summary = ml_analyzer.get_analysis_summary(results_df)
+    excel_report_path = None
+    if with_report:
+        excel_report_path = await _create_excel_report(
+            results_df, f"analysis_report_{analysis_id}_t{threshold_float:.3f}.xlsx", analysis_id
+        )
+
+    return FastJSONResponse(content={
+        "status": "success",
+        "analysis_id": analysis_id,
+        "analysis": {
+            "ml_results": {**summary, "stage_counts": match_state.stage_counts},
+            "threshold_used": threshold_float,
+            "new_anomaly_floor": floor_float,
+            "top_k": used_top_k,
+            "model": stored_options.model_name or ml_analyzer.model_name,
+            "warnings": match_state.warning_count,
+        },
+        "results_layout": results_layout,
+        "results": format_results(results_df, results_layout),
+        "excel_report": f"/api/v1/download/{os.path.basename(excel_report_path)}" if excel_report_path else None,
+    })
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Метрики процесса в текстовом формате Prometheus."""
+    if not config.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Метрики выключены")
+    return PlainTextResponse(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Доступ к админ эндпоинтам: только с API_ADMIN_TOKEN, без него эндпоинты выключены."""
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Админ эндпоинты выключены")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), config.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Неверный X-Admin-Token")
+
+
+@app.get("/api/v1/admin/retention", dependencies=[Depends(require_admin)], include_in_schema=bool(config.ADMIN_TOKEN))
+async def retention_metrics():
+    """Занятость директорий с артефактами и итоги фоновой очистки."""
+    return retention_manager.metrics()
+
+
+@app.post("/api/v1/admin/retention/sweep", dependencies=[Depends(require_admin)],
+          include_in_schema=bool(config.ADMIN_TOKEN))
+async def retention_sweep():
+    """Запускает очистку артефактов немедленно."""
+    result = await run_in_threadpool(retention_manager.sweep)
+    return {**result, "metrics": retention_manager.metrics()}
+
+
+@app.get("/api/v1/admin/profiles", dependencies=[Depends(require_admin)], include_in_schema=bool(config.ADMIN_TOKEN))
+async def list_profiles():
+    """Сохраненные профили медленных запросов (новые первыми)."""
+    profiles = await run_in_threadpool(slow_request_profiler.list_captures)
+    return {
+        "enabled": config.PROFILE_SLOW_SECONDS > 0,
+        "threshold_seconds": config.PROFILE_SLOW_SECONDS,
+        "profiles": [
+            {**meta, "download": f"/api/v1/admin/profiles/{meta['capture_id']}"} for meta in profiles
+        ],
+    }
+
+
+@app.get("/api/v1/admin/profiles/{capture_id}", dependencies=[Depends(require_admin)],
+         include_in_schema=bool(config.ADMIN_TOKEN))
+async def download_profile(capture_id: str):
+    """Профиль запроса в формате collapsed stacks (flamegraph.pl, speedscope)."""
+    path = slow_request_profiler.capture_path(capture_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Профиль {capture_id} не найден")
+    return FileResponse(path=path, filename=os.path.basename(path), media_type="text/plain")
+
+
+@app.websocket("/ws/progress/{job_id}")
+async def progress_websocket(websocket: WebSocket, job_id: str):
+    """
+    События прогресса анализа с job_id (подписываться можно до отправки файла).
+
+    Каждое событие: stage (parsing, matching, encoding, search, findings,
+    report, done, failed), elapsed, stage_elapsed и поля этапа (files_done,
+    lines_per_sec, encoded, batches, ...). Последнее событие - final: true.
+    """
+    await websocket.accept()
+    if not valid_job_id(job_id):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Неверный job_id")
+        return
+    async for event in progress_hub.subscribe(job_id):
+        await websocket.send_text(dumps(event).decode("utf-8"))
+    await websocket.close()
+
+
+@app.get("/api/v1/progress/{job_id}")
+async def progress_events(job_id: str):
+    """События прогресса анализа с job_id как Server-Sent Events."""
+    if not valid_job_id(job_id):
+        raise HTTPException(status_code=400, detail="Неверный job_id")
+
+    async def event_stream():
+        async for event in progress_hub.subscribe(job_id):
+            yield stream_frame(event, STREAM_FORMAT_SSE, "progress")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/api/v1/download/{filename}")
 async def download_report(filename: str):
     """
-    Скачивает сгенерированный Excel отчет.
+    Скачивает сгенерированный Excel отчет (или другой отчет из индекса: Timeline, trace).
     
     **Формат Excel точно такой же, как для защиты на хакатоне.**
     """
-    # Ищем файл в директории reports
-    file_path = os.path.join(REPORTS_DIR, filename)
-    
-    if not os.path.exists(file_path):
-        # Если не найден в reports, ищем в temp
-        file_path = os.path.join(tempfile.gettempdir(), filename)
+    # Отчет ищем по индексу артефактов
+    record = artifact_store.get_report(filename)
+    file_path = await run_in_threadpool(_existing_artifact, record)
     
-    if not os.path.exists(file_path):
+    if file_path is None:
         logger.warning(f"Excel файл не найден: {filename}")
         raise HTTPException(status_code=404, detail=f"Файл {filename} не найден")
     
-    logger.info(f"Скачивание Excel отчета: {file_path}")
+    logger.info(f"Скачивание отчета: {file_path}")
     return FileResponse(
         path=file_path,
         filename=filename,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        media_type=REPORT_MEDIA_TYPES.get(record["kind"], REPORT_MEDIA_TYPES[REPORT_EXCEL])
     )
 
 
 @app.get("/api/v1/anomalies/default")
 async def get_default_anomalies():
     """Возвращает дефолтный словарь аномалий."""
-    default_anomalies = os.path.join(
-        os.path.dirname(__file__), 
-        '..', 'src', 'bot', 'services', 'anomalies_problems.csv'
-    )
-    
-    if not os.path.exists(default_anomalies):
+    if not os.path.exists(DEFAULT_ANOMALIES_PATH):
         raise HTTPException(status_code=404, detail="Дефолтный словарь не найден")
     
     return FileResponse(
-        path=default_anomalies,
+        path=DEFAULT_ANOMALIES_PATH,
         filename="anomalies_problems.csv",
         media_type="text/csv"
     )
@@ -605,7 +1310,8 @@ async def generate_timeline(
     
     Возвращает HTML с интерактивным графиком распределения логов по времени.
     """
-    temp_dir = tempfile.mkdtemp()
+    temp_dir_handle = request_temp_dir()
+    temp_dir = temp_dir_handle.name
     
     try:
         logger.info(f"Получен запрос на Timeline для файла: {log_file.filename}")
@@ -615,6 +1321,7 @@ async def generate_timeline(
         with open(log_file_path, 'wb') as f:
             content = await log_file.read()
             f.write(content)
+        UPLOAD_BYTES.observe(len(content))
         
         # Определяем файлы с логами
         if log_file.filename.endswith('.zip'):
@@ -725,6 +1432,8 @@ async def generate_timeline(
     except Exception as e:
         logger.error(f"Ошибка при создании Timeline: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        temp_dir_handle.cleanup()
 
 
 @app.get("/api/v1/timeline/zip/{filename}")
@@ -733,42 +1442,52 @@ async def list_zip_contents(filename: str):
     Возвращает список файлов внутри ZIP архива из истории анализов.
     """
     try:
-        # Ищем файл в reports или temp
-        zip_path = None
-        
-        # Проверяем в директории reports
-        possible_path = os.path.join(REPORTS_DIR, filename)
-        if os.path.exists(possible_path):
-            zip_path = possible_path
+        # Ищем загрузку по индексу артефактов (имя файла в хранилище: <file_id>_<имя>)
+        upload = artifact_store.find_upload(filename)
+        zip_path = await run_in_threadpool(_existing_artifact, upload)
         
         if not zip_path:
             raise HTTPException(status_code=404, detail=f"ZIP файл {filename} не найден")
         
-        # Извлекаем список файлов
-        temp_dir = tempfile.mkdtemp()
-        extracted_files = log_parser.extract_zip(zip_path, temp_dir)
+        # Состав архива берем из индекса - без распаковки
+        members = artifact_store.list_members(upload["file_id"])
+        if not members:
+            members = await run_in_threadpool(zip_members, zip_path)
         
         # Фильтруем только .txt файлы
         txt_files = [
-            os.path.basename(f) for f in extracted_files 
-            if f.endswith('.txt') and not f.endswith('anomalies_problems.csv')
+            os.path.basename(member["name"]) for member in members
+            if member["name"].endswith('.txt')
         ]
         
         logger.info(f"Найдено {len(txt_files)} файлов в {filename}")
         
         return {"files": txt_files}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Ошибка при чтении ZIP: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _timeline_cache_path(file_id: str, selected_file: Optional[str]) -> str:
+    """Путь к закэшированному Timeline HTML для загруженного файла."""
+    suffix = ""
+    if selected_file:
+        suffix = "_" + hashlib.md5(selected_file.encode()).hexdigest()[:12]
+    return os.path.join(REPORTS_DIR, f"timeline_{file_id}{suffix}.html")
+
+
 @app.post("/api/v1/timeline/by-file-id/{file_id}")
-async def generate_timeline_by_file_id(file_id: str, selected_file: Optional[str] = None):
+async def generate_timeline_by_file_id(request: Request, file_id: str, selected_file: Optional[str] = None):
     """
     Генерирует Timeline график для ранее загруженного файла по его file_id.
     Для ZIP можно указать конкретный файл через selected_file.
     
+    Загруженные файлы не меняются, поэтому готовый HTML кэшируется вместе
+    с .gz/.br вариантами и при повторных запросах отдается без пересчета.
+    
     Args:
         file_id: ID файла из предыдущего анализа
         selected_file: (опционально) имя файла внутри ZIP архива
@@ -776,19 +1495,29 @@ async def generate_timeline_by_file_id(file_id: str, selected_file: Optional[str
     Returns:
         HTML с Timeline графиком
     """
+    temp_dir_handle = None
     try:
         logger.info(f"Запрос на Timeline для file_id: {file_id}, selected_file: {selected_file}")
         
-        # Ищем файл в uploads директории
-        matching_files = [f for f in os.listdir(UPLOADS_DIR) if f.startswith(file_id)]
+        accept_encoding = request.headers.get("accept-encoding")
+        cache_path = _timeline_cache_path(file_id, selected_file)
+        if os.path.exists(cache_path):
+            logger.info(f"Timeline найден в кэше: {cache_path}")
+            TIMELINE_CACHE_HITS.inc()
+            touch(cache_path)
+            return precompressed_response(cache_path, accept_encoding, "text/html; charset=utf-8")
+        TIMELINE_CACHE_MISSES.inc()
         
-        if not matching_files:
+        # Ищем загрузку по индексу артефактов
+        file_path = await run_in_threadpool(_existing_artifact, artifact_store.get_upload(file_id))
+        
+        if file_path is None:
             raise HTTPException(status_code=404, detail=f"Файл с ID {file_id} не найден")
         
-        file_path = os.path.join(UPLOADS_DIR, matching_files[0])
         logger.info(f"Найден файл: {file_path}")
         
-        temp_dir = tempfile.mkdtemp()
+        temp_dir_handle = request_temp_dir()
+        temp_dir = temp_dir_handle.name
         
         # Определяем файлы с логами
         if file_path.endswith('.zip'):
@@ -893,20 +1622,100 @@ async def generate_timeline_by_file_id(file_id: str, selected_file: Optional[str
             </body>
             </html>
             """
-            return HTMLResponse(content=success_html)
+            await run_in_threadpool(_store_timeline, cache_path, success_html, file_id)
+            return precompressed_response(cache_path, accept_encoding, "text/html; charset=utf-8")
         
         # Генерируем Timeline график только если есть ошибки/предупреждения
         timeline_html = generate_timeline_visualization_from_df(logs_df)
         
         logger.info("Timeline график успешно создан по file_id")
         
-        return HTMLResponse(content=timeline_html)
+        # Кэшируем только полноценный документ (не сообщение об ошибке)
+        if not timeline_html.lstrip().startswith('<html'):
+            return HTMLResponse(content=timeline_html)
+        
+        await run_in_threadpool(_store_timeline, cache_path, timeline_html, file_id)
+        return precompressed_response(cache_path, accept_encoding, "text/html; charset=utf-8")
         
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Ошибка при создании Timeline по file_id: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if temp_dir_handle is not None:
+            temp_dir_handle.cleanup()
+
+
+@app.websocket("/ws/tail")
+async def tail_logs(
+    websocket: WebSocket,
+    path: str,
+    threshold: float = 0.7,
+    new_anomaly_floor: float = 0.5,
+    from_start: bool = False,
+):
+    """
+    Потоковый анализ дописываемого лога (tail -f) на сервере.
+
+    Новые строки файла (или файлов .log/.txt директории) разбираются
+    небольшими батчами, WARNING строки сопоставляются со словарем
+    (API_TAIL_DICTIONARY_PATH или дефолтный).
+    Клиент получает сообщение hello, затем batch сообщения: счетчики уровней
+    (за батч и с начала подключения), совпадения и число отброшенных
+    сообщений (dropped), если клиент не успевает читать.
+
+    Args:
+        path: Файл или директория внутри API_TAIL_ALLOWED_ROOTS
+        threshold: Порог similarity
+        new_anomaly_floor: Минимальный score новой аномалии
+        from_start: Анализировать и уже записанное содержимое
+    """
+    await websocket.accept()
+    real_path = resolve_tail_path(path, config.TAIL_ALLOWED_ROOTS)
+    if real_path is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Путь вне разрешенных директорий")
+        return
+    dictionary_path = config.TAIL_DICTIONARY_PATH or DEFAULT_ANOMALIES_PATH
+    if not os.path.exists(dictionary_path):
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR, reason="Словарь аномалий не найден")
+        return
+    try:
+        await model_warmup.wait_ready(config.MODEL_READY_TIMEOUT)
+    except ModelNotReadyError as e:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason=str(e))
+        return
+
+    try:
+        tailer = await run_in_threadpool(
+            LogTailer, real_path, log_parser, from_start, config.TAIL_MAX_READ_KB * 1024
+        )
+    except FileNotFoundError:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Путь не найден")
+        return
+
+    anomalies_df = pd.read_csv(dictionary_path, sep=';', encoding='utf-8')
+    # Эмбеддинги словаря кодируются один раз и берутся из кэша анализатора
+    await run_in_threadpool(ml_analyzer.encode_dictionary, anomalies_df['Аномалия'].astype(str).tolist())
+
+    session = TailSession(
+        websocket,
+        tailer,
+        ml_analyzer,
+        anomalies_df,
+        AnalysisOptions(
+            similarity_threshold=max(0.0, min(1.0, threshold)),
+            new_anomaly_floor=max(0.0, min(1.0, new_anomaly_floor)),
+        ),
+        poll_interval=config.TAIL_POLL_INTERVAL,
+        batch_size=config.TAIL_BATCH_SIZE,
+        queue_size=config.TAIL_QUEUE_SIZE,
+    )
+    loop = asyncio.get_running_loop()
+    tailer.on_change = lambda: loop.call_soon_threadsafe(session.notify)
+    tailer.start_watching()
+    logger.info(f"📡 Потоковый анализ {real_path} ({len(tailer.files)} файлов)")
+    await session.run()
 
 
 if __name__ == "__main__":
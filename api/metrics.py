@@ -0,0 +1,77 @@
+"""Метрики API для /metrics (формат Prometheus).
+
+Метрики парсера и ML анализатора регистрируются в core.services.metrics,
+здесь - то, что видно только на уровне HTTP: размеры загрузок, запросы
+анализа в работе, длительность запросов и память процесса. Каждый воркер
+(uvicorn --workers, pre-fork) отдает свои значения.
+"""
+
+import time
+from typing import Optional
+
+from api.procmem import rss_bytes
+from core.services.metrics import BYTES_BUCKETS, CACHE_REQUESTS, REGISTRY, STAGE_SECONDS
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+UPLOAD_BYTES = REGISTRY.histogram(
+    "logmonitor_upload_bytes", "Размер загруженных файлов логов", buckets=BYTES_BUCKETS
+)
+IN_FLIGHT = REGISTRY.gauge("logmonitor_analyses_in_flight", "Запросы анализа в работе", ("endpoint",))
+REQUEST_SECONDS = REGISTRY.histogram(
+    "logmonitor_request_duration_seconds", "Длительность запросов анализа", ("endpoint",)
+)
+REGISTRY.gauge("logmonitor_process_resident_memory_bytes", "RSS процесса", function=rss_bytes)
+
+EXCEL_SECONDS = STAGE_SECONDS.labels("excel")
+TIMELINE_SECONDS = STAGE_SECONDS.labels("timeline")
+CHART_SECONDS = STAGE_SECONDS.labels("chart")
+GRAPH_SECONDS = STAGE_SECONDS.labels("graph")
+TIMELINE_CACHE_HITS = CACHE_REQUESTS.labels("timeline", "hit")
+TIMELINE_CACHE_MISSES = CACHE_REQUESTS.labels("timeline", "miss")
+
+# Отслеживаемые эндпоинты: путь -> метка endpoint (by-file-id - по префиксу)
+TRACKED_PATHS = {
+    "/api/v1/analyze": "analyze",
+    "/api/v1/analyze/stream": "analyze_stream",
+    "/api/v1/timeline": "timeline",
+}
+TRACKED_PREFIXES = (
+    ("/api/v1/timeline/by-file-id/", "timeline_by_file_id"),
+    ("/api/v1/analyses/", "rethreshold"),
+)
+
+
+def endpoint_label(path: str) -> Optional[str]:
+    """Метка endpoint для пути запроса (None - запрос не отслеживается)."""
+    label = TRACKED_PATHS.get(path)
+    if label is not None:
+        return label
+    for prefix, prefix_label in TRACKED_PREFIXES:
+        if path.startswith(prefix):
+            return prefix_label
+    return None
+
+
+class MetricsMiddleware:
+    """ASGI middleware: запросы анализа в работе и их длительность.
+
+    Запрос считается завершенным, когда приложение отдало ответ целиком -
+    для потоковых ответов это конец потока.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        label = endpoint_label(scope["path"]) if scope["type"] == "http" else None
+        if label is None:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        with IN_FLIGHT.labels(label).track():
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                REQUEST_SECONDS.labels(label).observe(time.perf_counter() - started)
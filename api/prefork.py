@@ -0,0 +1,220 @@
+"""Pre-fork режим API: одна копия модели на все воркеры.
+
+Обычный `uvicorn --workers N` импортирует api.main в каждом воркере,
+и каждый грузит свою копию трансформера - память растет линейно.
+Здесь мастер-процесс один раз загружает модель и эмбеддинги дефолтного
+словаря, замораживает объекты для GC и форкает воркеров. Веса модели
+остаются разделяемыми страницами (copy-on-write), а мастер периодически
+пишет в лог уникальную память (USS) каждого воркера.
+
+Запуск:
+    python -m api.prefork --workers 4 --port 8001
+
+Поддерживаются torch бэкенды и hashing (без модели): сессии ONNX Runtime
+держат пул потоков, который не переживает fork.
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict
+
+# Модель грузит мастер синхронно до fork - фоновая загрузка в воркерах не нужна
+os.environ["API_PRELOAD_MODEL"] = "false"
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.procmem import process_memory
+
+logger = logging.getLogger("api.prefork")
+
+
+def _bind_socket(host: str, port: int) -> socket.socket:
+    """Создает слушающий сокет в мастере (наследуется воркерами)."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _set_torch_threads(num_threads: int):
+    """Задает число потоков torch, если torch уже импортирован."""
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(num_threads)
+
+
+def preload(api_main) -> None:
+    """Загружает модель и эмбеддинги дефолтного словаря в мастере."""
+    import pandas as pd
+
+    if api_main.ml_analyzer.encoder_backend.startswith("onnx"):
+        raise SystemExit(
+            "Pre-fork режим не поддерживает ONNX бэкенды (ML_ENCODER_BACKEND=torch|torch-int8|hashing)"
+        )
+
+    if api_main.ml_analyzer.encoder_backend.startswith("torch"):
+        # Прогрев в один поток: пул потоков OpenMP, созданный до fork, зависает в детях
+        import torch
+        torch.set_num_threads(1)
+
+    api_main.model_warmup.load_now()
+
+    if os.path.exists(api_main.DEFAULT_ANOMALIES_PATH):
+        anomalies_df = pd.read_csv(api_main.DEFAULT_ANOMALIES_PATH, sep=';', encoding='utf-8')
+        anomaly_texts = anomalies_df["Аномалия"].astype(str).tolist()
+        embeddings = api_main.ml_analyzer.encode_dictionary(anomaly_texts)
+        # ANN индекс (если включен) тоже строится один раз и разделяется воркерами
+        api_main.ml_analyzer.dictionary_index(anomaly_texts, embeddings)
+        logger.info(f"Эмбеддинги дефолтного словаря ({len(anomalies_df)} аномалий) загружены в мастере")
+
+    # Поток планировщика инференса не переживает fork - воркеры запустят свой
+    api_main.ml_analyzer.stop_schedulers()
+
+    # Все созданные объекты - в постоянное поколение: сборщик мусора в воркерах
+    # не будет трогать их заголовки и копировать страницы
+    gc.collect()
+    gc.freeze()
+
+
+def run_worker(app, sock: socket.socket, threads: int, log_level: str, retention: bool) -> None:
+    """Тело воркера: свой event loop uvicorn на общем сокете.
+
+    retention - запускать ли в этом воркере фоновую очистку артефактов: она
+    нужна в одном процессе, иначе воркеры чистят одно дерево одновременно.
+    """
+    import uvicorn
+
+    from api import config as api_config
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    _set_torch_threads(threads)
+    api_config.RETENTION_ENABLED = api_config.RETENTION_ENABLED and retention
+
+    config = uvicorn.Config(app, log_level=log_level, lifespan="on")
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+    os._exit(0)
+
+
+class PreforkMaster:
+    """Мастер: форкает воркеров, перезапускает упавших, отчитывается о памяти."""
+
+    def __init__(self, app, sock: socket.socket, workers: int, threads: int,
+                 log_level: str, report_interval: float, report_file: str = None):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.threads = threads
+        self.log_level = log_level
+        self.report_interval = report_interval
+        self.report_file = report_file
+        self.children: Dict[int, int] = {}  # pid -> номер воркера
+        self.stopping = False
+
+    def spawn(self, index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            # Очистку артефактов ведет воркер #1 (и его замена после перезапуска)
+            run_worker(self.app, self.sock, self.threads, self.log_level, retention=index == 1)
+        self.children[pid] = index
+        logger.info(f"Воркер #{index} запущен (pid {pid})")
+
+    def memory_report(self) -> Dict:
+        """USS/PSS/RSS мастера и каждого воркера."""
+        report = {
+            "timestamp": time.time(),
+            "master": {"pid": os.getpid(), **process_memory()},
+            "workers": [
+                {"worker": index, "pid": pid, **process_memory(pid)}
+                for pid, index in sorted(self.children.items(), key=lambda item: item[1])
+            ],
+        }
+        return report
+
+    def log_memory(self) -> None:
+        report = self.memory_report()
+        mb = 1024 * 1024
+        for worker in report["workers"]:
+            logger.info(
+                f"Воркер #{worker['worker']} (pid {worker['pid']}): "
+                f"USS {worker.get('uss', 0) / mb:.0f} MB, PSS {worker.get('pss', 0) / mb:.0f} MB, "
+                f"RSS {worker.get('rss', 0) / mb:.0f} MB"
+            )
+        if self.report_file:
+            with open(self.report_file, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+
+    def stop(self, *_):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        for index in range(1, self.workers + 1):
+            self.spawn(index)
+
+        next_report = time.monotonic() + self.report_interval
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                index = self.children.pop(pid, None)
+                if index is not None and not self.stopping:
+                    logger.warning(f"Воркер #{index} (pid {pid}) завершился со статусом {status}, перезапускаю")
+                    self.spawn(index)
+                continue
+
+            if not self.stopping and self.report_interval > 0 and time.monotonic() >= next_report:
+                self.log_memory()
+                next_report = time.monotonic() + self.report_interval
+            time.sleep(0.5)
+
+        logger.info("Все воркеры остановлены")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Pre-fork сервер API с общей ML моделью")
+    parser.add_argument("--host", default=os.getenv("API_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8001")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "2")))
+    parser.add_argument("--threads", type=int, default=0,
+                        help="Потоков torch на воркер (0 - CPU / число воркеров)")
+    parser.add_argument("--report-interval", type=float, default=60.0,
+                        help="Интервал отчета о памяти воркеров в секундах (0 - выключить)")
+    parser.add_argument("--report-file", help="Записывать последний отчет о памяти в JSON файл")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    import api.main as api_main
+
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+    preload(api_main)
+    sock = _bind_socket(args.host, args.port)
+    logger.info(f"Pre-fork мастер (pid {os.getpid()}): {args.workers} воркеров на {args.host}:{args.port}, "
+                f"{threads} потоков torch на воркер")
+
+    master = PreforkMaster(api_main.app, sock, args.workers, threads,
+                           args.log_level, args.report_interval, args.report_file)
+    master.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Память процессов по данным /proc (Linux).
+
+USS (уникальная память) - сколько освободится при завершении процесса,
+PSS - доля с учетом разделяемых страниц. Для pre-fork воркеров именно USS
+показывает реальную стоимость одного воркера.
+"""
+
+import os
+from typing import Dict, Optional
+
+_SMAPS_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared_clean",
+    "Shared_Dirty": "shared_dirty",
+    "Private_Clean": "private_clean",
+    "Private_Dirty": "private_dirty",
+}
+
+
+def process_memory(pid: Optional[int] = None) -> Dict[str, int]:
+    """Возвращает память процесса в байтах: rss, pss, uss, shared.
+
+    Args:
+        pid: PID процесса (None - текущий)
+
+    Returns:
+        Словарь с размерами в байтах (пустой, если /proc недоступен)
+    """
+    pid = pid or os.getpid()
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                if name in _SMAPS_FIELDS:
+                    values[_SMAPS_FIELDS[name]] = int(rest.split()[0]) * 1024
+    except (FileNotFoundError, PermissionError, ProcessLookupError):
+        # Старые ядра без smaps_rollup - отдаем хотя бы RSS
+        rss = rss_bytes(pid)
+        return {"rss": rss} if rss else {}
+
+    if not values:
+        return {}
+    return {
+        "rss": values.get("rss", 0),
+        "pss": values.get("pss", 0),
+        "uss": values.get("private_clean", 0) + values.get("private_dirty", 0),
+        "shared": values.get("shared_clean", 0) + values.get("shared_dirty", 0),
+    }
+
+
+def rss_bytes(pid: Optional[int] = None) -> int:
+    """RSS процесса в байтах (дешево: одна строка /proc/<pid>/statm)."""
+    pid = pid or os.getpid()
+    try:
+        with open(f"/proc/{pid}/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (FileNotFoundError, PermissionError, ProcessLookupError, IndexError, ValueError):
+        return 0
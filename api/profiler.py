@@ -0,0 +1,303 @@
+"""Сэмплирующий профайлер медленных запросов анализа и Timeline.
+
+Пока идет хотя бы один отслеживаемый запрос, фоновый поток раз в interval
+снимает стеки всех потоков процесса (sys._current_frames) и добавляет их
+в счетчики каждого запроса в работе. Если запрос шел дольше порога,
+счетчики сохраняются в директорию диагностики в формате collapsed stacks
+(вход flamegraph.pl, speedscope, inferno) с метаданными рядом, иначе
+отбрасываются. Без запросов поток спит на Condition и ничего не стоит.
+
+Стеки снимаются со всего процесса: при параллельных запросах в профиль
+медленного попадает и работа соседних. Простаивающие потоки (ожидание
+блокировки, очереди, select event loop) не учитываются.
+"""
+
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from api.metrics import endpoint_label
+from api.progress import JOB_ID_PATTERN
+
+logger = logging.getLogger(__name__)
+
+REQUEST_ID_HEADER = b"x-request-id"
+COLLAPSED_SUFFIX = ".collapsed"
+META_SUFFIX = ".json"
+
+# Эндпоинты, для которых снимается профиль (метки из api.metrics)
+PROFILED_ENDPOINTS = frozenset({"analyze", "analyze_stream", "timeline", "timeline_by_file_id"})
+
+# Верхние кадры простаивающих потоков: (файл, функция)
+_IDLE_LEAVES = frozenset({
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),  # concurrent.futures: SimpleQueue.get
+})
+_MAX_DEPTH = 128
+# Кэш подписей кадров сбрасывается без запросов в работе и при переполнении
+_MAX_LABELS = 10_000
+
+
+@dataclass
+class ProfileSession:
+    """Отслеживаемый запрос: стеки, снятые пока он выполнялся."""
+
+    request_id: str
+    endpoint: str
+    path: str
+    started: float = field(default_factory=time.perf_counter)
+    started_at: float = field(default_factory=time.time)
+    stacks: Counter = field(default_factory=Counter)
+    samples: int = 0
+    duration: Optional[float] = None
+
+
+class SlowRequestProfiler:
+    """Сэмплирование стеков во время запросов и сохранение профилей медленных.
+
+    Args:
+        directory: Директория диагностики
+        threshold_seconds: Порог длительности запроса для сохранения профиля
+        interval_seconds: Период снятия стеков
+        max_captures: Сколько последних профилей хранить
+    """
+
+    def __init__(self, directory: str, threshold_seconds: float,
+                 interval_seconds: float = 0.01, max_captures: int = 50):
+        self.directory = directory
+        self.threshold_seconds = threshold_seconds
+        self.interval_seconds = max(0.001, interval_seconds)
+        self.max_captures = max(1, max_captures)
+        self._sessions: Dict[int, ProfileSession] = {}
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._labels: Dict[object, str] = {}
+
+    def begin(self, request_id: str, endpoint: str, path: str) -> ProfileSession:
+        """Начинает сэмплирование для запроса."""
+        session = ProfileSession(request_id=request_id, endpoint=endpoint, path=path)
+        with self._condition:
+            self._sessions[id(session)] = session
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return session
+
+    def end(self, session: ProfileSession, status_code: Optional[int] = None) -> Optional[str]:
+        """Завершает сэмплирование; сохраняет профиль, если запрос был медленным.
+
+        Returns:
+            Путь к collapsed файлу или None (запрос быстрее порога или нет сэмплов)
+        """
+        if not self.detach(session):
+            return None
+        return self.save(session, status_code)
+
+    def detach(self, session: ProfileSession) -> bool:
+        """Прекращает сэмплирование запроса (дешево, можно из event loop).
+
+        Returns:
+            True, если запрос медленнее порога и профиль нужно сохранить (save)
+        """
+        with self._condition:
+            self._sessions.pop(id(session), None)
+        session.duration = time.perf_counter() - session.started
+        return session.duration >= self.threshold_seconds and bool(session.stacks)
+
+    def save(self, session: ProfileSession, status_code: Optional[int] = None) -> Optional[str]:
+        """Сохраняет профиль отсоединенного запроса (файловый ввод-вывод - вне event loop).
+
+        Returns:
+            Путь к collapsed файлу или None при ошибке записи
+        """
+        duration = session.duration if session.duration is not None else time.perf_counter() - session.started
+        try:
+            path = self._save(session, duration, status_code)
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось сохранить профиль запроса {session.request_id}: {e}")
+            return None
+        logger.info(
+            f"🐢 Медленный запрос {session.endpoint} {session.request_id}: {duration:.2f} с, "
+            f"профиль сохранен ({session.samples} сэмплов)"
+        )
+        return path
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        while True:
+            with self._condition:
+                if not self._sessions:
+                    # Без запросов кэш не держит объекты кода живыми
+                    self._labels.clear()
+                while not self._sessions:
+                    self._condition.wait()
+            if len(self._labels) > _MAX_LABELS:
+                self._labels.clear()
+            stacks = self._sample(own_ident)
+            # Под блокировкой: end() сохраняет счетчики уже снятого с учета запроса
+            with self._condition:
+                for session in self._sessions.values():
+                    session.samples += 1
+                    session.stacks.update(stacks)
+            time.sleep(self.interval_seconds)
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _sample(self, own_ident: int) -> List[str]:
+        """Collapsed стеки занятых потоков: "поток;внешний;...;внутренний"."""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+                continue
+            labels = []
+            while frame is not None and len(labels) < _MAX_DEPTH:
+                labels.append(self._label(frame.f_code))
+                frame = frame.f_back
+            labels.append(names.get(ident, f"thread-{ident}").replace(";", ":").replace(" ", "_"))
+            stacks.append(";".join(reversed(labels)))
+        return stacks
+
+    def _save(self, session: ProfileSession, duration: float, status_code: Optional[int]) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        # X-Request-ID задает клиент и может повторяться - имя файла дополняется
+        # случайным суффиксом, чтобы повтор не перезаписал прошлый профиль
+        capture_id = f"{session.request_id[:47]}-{uuid.uuid4().hex[:16]}"
+        base = os.path.join(self.directory, capture_id)
+        lines = [f"{stack} {count}" for stack, count in session.stacks.most_common()]
+        meta = {
+            "capture_id": capture_id,
+            "request_id": session.request_id,
+            "endpoint": session.endpoint,
+            "path": session.path,
+            "status_code": status_code,
+            "duration_seconds": round(duration, 3),
+            "threshold_seconds": self.threshold_seconds,
+            "interval_ms": round(self.interval_seconds * 1000, 3),
+            "samples": session.samples,
+            "created_at": session.started_at,
+        }
+        _write_atomic(base + COLLAPSED_SUFFIX, "\n".join(lines) + "\n")
+        _write_atomic(base + META_SUFFIX, json.dumps(meta, ensure_ascii=False))
+        self._prune()
+        return base + COLLAPSED_SUFFIX
+
+    def _prune(self) -> None:
+        """Оставляет max_captures последних профилей."""
+        captures = self.list_captures()
+        for meta in captures[self.max_captures:]:
+            for suffix in (COLLAPSED_SUFFIX, META_SUFFIX):
+                try:
+                    os.remove(os.path.join(self.directory, meta["capture_id"] + suffix))
+                except OSError:
+                    pass
+
+    def list_captures(self) -> List[Dict]:
+        """Метаданные сохраненных профилей, новые первыми."""
+        captures = []
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return captures
+        for entry in entries:
+            if not entry.name.endswith(META_SUFFIX):
+                continue
+            try:
+                with open(entry.path, encoding="utf-8") as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            meta.setdefault("capture_id", entry.name[:-len(META_SUFFIX)])
+            captures.append(meta)
+        captures.sort(key=lambda meta: meta.get("created_at", 0), reverse=True)
+        return captures
+
+    def capture_path(self, capture_id: str) -> Optional[str]:
+        """Путь к collapsed файлу профиля (None, если его нет)."""
+        if not JOB_ID_PATTERN.match(capture_id):
+            return None
+        path = os.path.join(self.directory, capture_id + COLLAPSED_SUFFIX)
+        return path if os.path.exists(path) else None
+
+
+def _write_atomic(path: str, text: str) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def request_id_from(headers) -> str:
+    """ID запроса из заголовка X-Request-ID (если он допустим) или новый."""
+    for name, value in headers:
+        if name.lower() == REQUEST_ID_HEADER:
+            request_id = value.decode("latin-1")
+            if JOB_ID_PATTERN.match(request_id):
+                return request_id
+            break
+    return uuid.uuid4().hex
+
+
+class ProfilerMiddleware:
+    """ASGI middleware: профиль анализа и Timeline, если запрос медленнее порога.
+
+    ID запроса (X-Request-ID клиента или новый) возвращается в заголовке
+    X-Request-ID - по нему профиль находится в /api/v1/admin/profiles.
+    """
+
+    def __init__(self, app, profiler: SlowRequestProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        label = endpoint_label(scope["path"]) if scope["type"] == "http" else None
+        if label not in PROFILED_ENDPOINTS:
+            await self.app(scope, receive, send)
+            return
+
+        request_id = request_id_from(scope["headers"])
+        status_code = None
+
+        async def send_with_request_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (REQUEST_ID_HEADER, request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        session = self.profiler.begin(request_id, label, scope["path"])
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            # Запись профиля и очистка старых - в пуле потоков, не задерживая event loop
+            if self.profiler.detach(session):
+                await run_in_threadpool(self.profiler.save, session, status_code)
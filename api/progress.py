@@ -0,0 +1,128 @@
+"""Рассылка событий прогресса анализа подписчикам (WebSocket и SSE).
+
+Клиент выбирает job_id, подписывается на /ws/progress/{job_id} или
+/api/v1/progress/{job_id} (SSE) и передает тот же job_id в /api/v1/analyze.
+События приходят из потоков анализа и передаются в event loop
+подписчика через call_soon_threadsafe. Каждый подписчик получает
+последнее событие сразу после подписки, затем новые - через ограниченную
+очередь (при переполнении теряются самые старые: важно текущее
+состояние). После финального события канал хранится retain_seconds
+для опоздавших подписчиков.
+"""
+
+import asyncio
+import logging
+import re
+import threading
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from core.services.progress import ProgressReporter
+
+logger = logging.getLogger(__name__)
+
+JOB_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def valid_job_id(job_id: Optional[str]) -> bool:
+    return bool(job_id) and JOB_ID_PATTERN.match(job_id) is not None
+
+
+def _deliver(queue: asyncio.Queue, event: Dict) -> None:
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+class _Channel:
+    __slots__ = ("last_event", "subscribers", "finished_at")
+
+    def __init__(self):
+        self.last_event: Optional[Dict] = None
+        # (очередь, event loop подписчика)
+        self.subscribers: List[Tuple[asyncio.Queue, asyncio.AbstractEventLoop]] = []
+        self.finished_at: Optional[float] = None
+
+
+class ProgressHub:
+    """Каналы событий прогресса по job_id."""
+
+    def __init__(self, queue_size: int = 64, retain_seconds: float = 300.0, min_interval: float = 0.25):
+        """Инициализация.
+
+        Args:
+            queue_size: Максимум недоставленных событий одного подписчика
+            retain_seconds: Сколько хранить завершенный канал для опоздавших подписчиков
+            min_interval: Минимальный интервал промежуточных событий анализа (сек)
+        """
+        self.queue_size = queue_size
+        self.retain_seconds = retain_seconds
+        self.min_interval = min_interval
+        self._channels: Dict[str, _Channel] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._channels)
+
+    def _purge(self, now: float) -> None:
+        """Удаляет завершенные каналы старше retain_seconds (под блокировкой)."""
+        expired = [
+            job_id for job_id, channel in self._channels.items()
+            if channel.finished_at is not None and now - channel.finished_at > self.retain_seconds
+        ]
+        for job_id in expired:
+            del self._channels[job_id]
+
+    def reporter(self, job_id: str) -> ProgressReporter:
+        """ProgressReporter анализа с этим job_id."""
+        with self._lock:
+            self._purge(time.time())
+            channel = self._channels.setdefault(job_id, _Channel())
+            # Повторный запуск с тем же job_id начинает канал заново
+            channel.last_event = None
+            channel.finished_at = None
+        return ProgressReporter(lambda event: self.publish(job_id, event), min_interval=self.min_interval)
+
+    def publish(self, job_id: str, event: Dict) -> None:
+        """Рассылает событие подписчикам (из любого потока)."""
+        now = time.time()
+        event = {"job_id": job_id, "ts": round(now, 3), **event}
+        with self._lock:
+            channel = self._channels.setdefault(job_id, _Channel())
+            channel.last_event = event
+            if event.get("final"):
+                channel.finished_at = now
+            subscribers = list(channel.subscribers)
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(_deliver, queue, event)
+            except RuntimeError:
+                # Event loop подписчика уже закрыт
+                pass
+
+    async def subscribe(self, job_id: str) -> AsyncIterator[Dict]:
+        """События канала до финального (включительно).
+
+        Подписаться можно и до запуска анализа - канал создается заранее.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        subscriber = (queue, asyncio.get_running_loop())
+        with self._lock:
+            self._purge(time.time())
+            channel = self._channels.setdefault(job_id, _Channel())
+            if channel.last_event is not None:
+                queue.put_nowait(channel.last_event)
+            channel.subscribers.append(subscriber)
+        try:
+            while True:
+                event = await queue.get()
+                yield event
+                if event.get("final"):
+                    return
+        finally:
+            with self._lock:
+                channel.subscribers.remove(subscriber)
+                # Канал, в который анализ еще ничего не публиковал, без подписчиков не нужен
+                if (not channel.subscribers and channel.last_event is None
+                        and self._channels.get(job_id) is channel):
+                    del self._channels[job_id]
@@ -0,0 +1,125 @@
+"""Быстрая JSON сериализация ответов API.
+
+Ответы анализа содержат pandas/NumPy значения (int64, Timestamp, NaN),
+поэтому вместо stdlib json и jsonable_encoder используем orjson, который
+умеет сериализовать NumPy массивы напрямую.
+"""
+
+import datetime
+from typing import Any, Dict, List
+
+import numpy as np
+import orjson
+import pandas as pd
+from fastapi.responses import JSONResponse
+
+# Допустимые форматы таблицы результатов в ответе
+RESULTS_LAYOUT_RECORDS = "records"
+RESULTS_LAYOUT_COLUMNS = "columns"
+RESULTS_LAYOUTS = (RESULTS_LAYOUT_RECORDS, RESULTS_LAYOUT_COLUMNS)
+
+# Форматы потоковой выдачи: NDJSON (по объекту на строку) и Server-Sent Events
+STREAM_FORMAT_NDJSON = "ndjson"
+STREAM_FORMAT_SSE = "sse"
+STREAM_MEDIA_TYPES = {
+    STREAM_FORMAT_NDJSON: "application/x-ndjson",
+    STREAM_FORMAT_SSE: "text/event-stream",
+}
+
+
+def _default(obj: Any) -> Any:
+    """Сериализует типы, которые orjson не поддерживает сам."""
+    if obj is None or obj is pd.NaT or obj is pd.NA:
+        return None
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, np.ndarray):
+        # object/строковые массивы orjson не сериализует - отдаем списком
+        return obj.tolist()
+    if isinstance(obj, (pd.Series, pd.Index, pd.Categorical)):
+        return _default(np.asarray(obj))
+    if isinstance(obj, pd.DataFrame):
+        return dataframe_to_columns(obj)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """Сериализует объект в JSON (bytes) через orjson."""
+    return orjson.dumps(
+        content,
+        default=_default,
+        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+    )
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON ответ на orjson с нативной поддержкой NumPy и pandas.
+
+    Возвращайте экземпляр напрямую из эндпоинта, чтобы FastAPI не прогонял
+    содержимое через jsonable_encoder.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def dataframe_to_columns(df: pd.DataFrame) -> Dict[str, Any]:
+    """Колоночное представление DataFrame: {колонка: массив значений}.
+
+    Имена колонок не повторяются в каждой строке, а числовые колонки
+    сериализуются orjson напрямую из NumPy без промежуточных списков.
+    """
+    columns = {}
+    for column in df.columns:
+        values = df[column].to_numpy()
+        if values.dtype.kind in "iufb":
+            columns[str(column)] = np.ascontiguousarray(values)
+        else:
+            columns[str(column)] = values.tolist()
+    return columns
+
+
+def dataframe_to_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Построчное представление DataFrame (исходный формат ответа)."""
+    return df.to_dict('records')
+
+
+def format_results(df: pd.DataFrame, layout: str = RESULTS_LAYOUT_RECORDS) -> Any:
+    """Форматирует таблицу результатов в выбранном формате ответа.
+
+    Args:
+        df: DataFrame с результатами анализа
+        layout: "records" (список строк) или "columns" (словарь колонок)
+
+    Returns:
+        Список словарей или словарь массивов
+    """
+    if layout == RESULTS_LAYOUT_COLUMNS:
+        if df.empty:
+            return {}
+        return dataframe_to_columns(df)
+    return dataframe_to_records(df) if not df.empty else []
+
+
+def stream_frame(content: Dict[str, Any], stream_format: str = STREAM_FORMAT_NDJSON, event: str = "message") -> bytes:
+    """Кадр потоковой выдачи.
+
+    Args:
+        content: Объект кадра
+        stream_format: "ndjson" или "sse"
+        event: Имя события SSE
+
+    Returns:
+        Строка NDJSON или событие SSE (bytes)
+    """
+    if stream_format == STREAM_FORMAT_SSE:
+        return b"event: " + event.encode("utf-8") + b"\ndata: " + dumps(content) + b"\n\n"
+    return dumps(content) + b"\n"
@@ -0,0 +1,255 @@
+"""Хранение артефактов API: TTL, квота на размер и фоновая очистка.
+
+Загрузки, отчеты, Timeline кэш и сохраненные анализы накапливаются
+в директориях API. RetentionManager периодически удаляет артефакты,
+к которым не обращались дольше TTL, а если суммарный размер все еще
+больше квоты - вытесняет самые давно использованные (LRU по времени
+последнего доступа). Время доступа обновляется через touch() при
+каждом чтении артефакта.
+
+Сжатые варианты (.gz/.br) удаляются вместе с исходным файлом.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Префикс временных директорий запросов - по нему находим брошенные после падений
+TEMP_DIR_PREFIX = "atomichack_"
+
+# Файлы, которые в этот момент записываются (атомарная запись через .tmp, в том числе ".tmp<pid>")
+_IN_PROGRESS_PATTERN = re.compile(r"\.tmp\d*$")
+_VARIANT_SUFFIXES = (".gz", ".br")
+
+
+def request_temp_dir() -> tempfile.TemporaryDirectory:
+    """Временная директория запроса, удаляемая при выходе из контекста."""
+    return tempfile.TemporaryDirectory(prefix=TEMP_DIR_PREFIX)
+
+
+def touch(path: Optional[str]) -> None:
+    """Отмечает доступ к артефакту (atime) для LRU вытеснения."""
+    if not path:
+        return
+    try:
+        stat = os.stat(path)
+        os.utime(path, (time.time(), stat.st_mtime))
+    except OSError:
+        pass
+
+
+def _artifact_key(path: str) -> str:
+    """Ключ артефакта: сжатые варианты относятся к исходному файлу."""
+    for suffix in _VARIANT_SUFFIXES:
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+
+@dataclass
+class _Artifact:
+    key: str
+    paths: List[str] = field(default_factory=list)
+    size: int = 0
+    last_access: float = 0.0
+
+
+@dataclass
+class RetentionStats:
+    """Накопительная статистика очистки (для метрик)."""
+
+    sweeps: int = 0
+    files_removed: int = 0
+    bytes_reclaimed: int = 0
+    temp_dirs_removed: int = 0
+    last_sweep_at: Optional[float] = None
+    last_sweep_seconds: float = 0.0
+    last_sweep_bytes: int = 0
+
+
+class RetentionManager:
+    """TTL и квота на размер для директорий с артефактами."""
+
+    def __init__(
+        self,
+        directories: Dict[str, str],
+        ttl_seconds: float = 72 * 3600,
+        max_bytes: int = 2 * 1024 ** 3,
+        sweep_interval: float = 600.0,
+        min_age_seconds: float = 60.0,
+        on_remove: Optional[Callable[[Iterable[str]], None]] = None,
+    ):
+        """Инициализация.
+
+        Args:
+            directories: Имя -> путь директорий под управлением (uploads, reports, ...)
+            ttl_seconds: Удалять артефакты без доступа дольше этого времени (0 - без TTL)
+            max_bytes: Квота на суммарный размер всех директорий (0 - без квоты)
+            sweep_interval: Интервал фоновой очистки в секундах
+            min_age_seconds: Не трогать артефакты моложе этого (могут еще использоваться)
+            on_remove: Вызывается со списком удаленных путей (например, чистит индекс артефактов)
+        """
+        self.directories = directories
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.min_age_seconds = min_age_seconds
+        self.on_remove = on_remove
+        self.stats = RetentionStats()
+        self._usage: Dict[str, Dict[str, int]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _scan(self) -> List[_Artifact]:
+        """Собирает артефакты всех директорий (с учетом сжатых вариантов)."""
+        artifacts: Dict[str, _Artifact] = {}
+        usage = {}
+        for name, directory in self.directories.items():
+            files = size = 0
+            try:
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                entries = []
+            for entry in entries:
+                if not entry.is_file(follow_symlinks=False) or _IN_PROGRESS_PATTERN.search(entry.name):
+                    continue
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                artifact = artifacts.setdefault(_artifact_key(entry.path), _Artifact(_artifact_key(entry.path)))
+                artifact.paths.append(entry.path)
+                artifact.size += stat.st_size
+                artifact.last_access = max(artifact.last_access, stat.st_atime, stat.st_mtime)
+                files += 1
+                size += stat.st_size
+            usage[name] = {"files": files, "bytes": size}
+        self._usage = usage
+        return list(artifacts.values())
+
+    def _remove(self, artifact: _Artifact, removed_paths: List[str]) -> int:
+        removed = 0
+        for path in artifact.paths:
+            try:
+                os.remove(path)
+                removed += 1
+                removed_paths.append(path)
+            except FileNotFoundError:
+                removed_paths.append(path)
+            except OSError as e:
+                logger.warning(f"Не удалось удалить {path}: {e}")
+        self.stats.files_removed += removed
+        return removed
+
+    def _sweep_temp_dirs(self, now: float) -> None:
+        """Удаляет брошенные временные директории запросов (например, после падения процесса)."""
+        max_age = max(self.ttl_seconds, 3600.0) if self.ttl_seconds else 3600.0
+        try:
+            entries = list(os.scandir(tempfile.gettempdir()))
+        except OSError:
+            return
+        for entry in entries:
+            if not entry.name.startswith(TEMP_DIR_PREFIX) or not entry.is_dir(follow_symlinks=False):
+                continue
+            try:
+                if now - entry.stat(follow_symlinks=False).st_mtime < max_age:
+                    continue
+            except FileNotFoundError:
+                continue
+            shutil.rmtree(entry.path, ignore_errors=True)
+            self.stats.temp_dirs_removed += 1
+
+    def sweep(self) -> Dict:
+        """Одна очистка: TTL, затем LRU вытеснение до квоты.
+
+        Returns:
+            Итог очистки: удалено файлов и освобождено байт
+        """
+        started = time.perf_counter()
+        now = time.time()
+        artifacts = self._scan()
+        files_before = self.stats.files_removed
+        reclaimed = 0
+        removed_paths: List[str] = []
+
+        candidates = [a for a in artifacts if now - a.last_access >= self.min_age_seconds]
+        if self.ttl_seconds:
+            for artifact in candidates:
+                if now - artifact.last_access > self.ttl_seconds:
+                    self._remove(artifact, removed_paths)
+                    reclaimed += artifact.size
+            candidates = [a for a in candidates if now - a.last_access <= self.ttl_seconds]
+
+        if self.max_bytes:
+            total = sum(a.size for a in artifacts) - reclaimed
+            for artifact in sorted(candidates, key=lambda a: a.last_access):
+                if total <= self.max_bytes:
+                    break
+                self._remove(artifact, removed_paths)
+                reclaimed += artifact.size
+                total -= artifact.size
+
+        self._sweep_temp_dirs(now)
+        if removed_paths and self.on_remove is not None:
+            try:
+                self.on_remove(removed_paths)
+            except Exception as e:
+                logger.warning(f"Ошибка обработки удаленных артефактов: {e}")
+
+        removed = self.stats.files_removed - files_before
+        self.stats.sweeps += 1
+        self.stats.bytes_reclaimed += reclaimed
+        self.stats.last_sweep_at = now
+        self.stats.last_sweep_seconds = time.perf_counter() - started
+        self.stats.last_sweep_bytes = reclaimed
+        if removed:
+            logger.info(f"🧹 Очистка: удалено {removed} файлов, освобождено {reclaimed / 1024 / 1024:.1f} MB")
+            # Обновляем занятость после удаления
+            self._scan()
+        return {"files_removed": removed, "bytes_reclaimed": reclaimed}
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.error(f"Ошибка фоновой очистки: {e}", exc_info=True)
+            await asyncio.sleep(self.sweep_interval)
+
+    def start(self) -> asyncio.Task:
+        """Запускает периодическую очистку в фоне (повторный вызов - та же задача)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def metrics(self) -> Dict:
+        """Метрики: занятость директорий и итоги очистки."""
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "max_bytes": self.max_bytes,
+            "directories": self._usage,
+            "total_bytes": sum(usage["bytes"] for usage in self._usage.values()),
+            "sweeps": self.stats.sweeps,
+            "files_removed": self.stats.files_removed,
+            "bytes_reclaimed": self.stats.bytes_reclaimed,
+            "temp_dirs_removed": self.stats.temp_dirs_removed,
+            "last_sweep_at": self.stats.last_sweep_at,
+            "last_sweep_seconds": round(self.stats.last_sweep_seconds, 4),
+            "last_sweep_bytes": self.stats.last_sweep_bytes,
+        }
@@ -0,0 +1,159 @@
+"""Потоковый анализ дописываемых логов через WebSocket (/ws/tail).
+
+Сессия читает новые строки LogTailer небольшими батчами, сопоставляет
+WARNING строки со словарем (эмбеддинги словаря закэшированы анализатором)
+и кладет сообщения в ограниченную очередь клиента. Медленный клиент не
+копит память: при переполнении отбрасываются самые старые сообщения,
+а их число приходит клиенту в поле dropped.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional
+
+import pandas as pd
+from fastapi import WebSocket, WebSocketDisconnect
+from starlette.concurrency import run_in_threadpool
+
+from core.services.log_tailer import LogTailer
+from core.services.ml_analyzer import AnalysisOptions, MLLogAnalyzer
+
+from api.responses import dataframe_to_records, dumps
+
+logger = logging.getLogger(__name__)
+
+LEVELS = ("ERROR", "WARNING", "INFO")
+
+
+def resolve_tail_path(path: str, allowed_roots: List[str]) -> Optional[str]:
+    """Проверяет, что путь лежит внутри разрешенных директорий.
+
+    Returns:
+        Реальный путь (симлинки раскрыты) или None, если путь запрещен
+    """
+    real_path = os.path.realpath(path)
+    for root in allowed_roots:
+        real_root = os.path.realpath(root)
+        if os.path.commonpath([real_root, real_path]) == real_root:
+            return real_path
+    return None
+
+
+class TailSession:
+    """Одно WebSocket подключение к /ws/tail."""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        tailer: LogTailer,
+        analyzer: MLLogAnalyzer,
+        anomalies_df: pd.DataFrame,
+        options: AnalysisOptions,
+        poll_interval: float = 1.0,
+        batch_size: int = 256,
+        queue_size: int = 100,
+    ):
+        """Инициализация.
+
+        Args:
+            websocket: Принятое WebSocket соединение
+            tailer: Источник новых строк
+            analyzer: ML анализатор (общий для приложения)
+            anomalies_df: Словарь аномалий
+            options: Порог и параметры сопоставления
+            poll_interval: Интервал опроса файлов (сек)
+            batch_size: Максимум строк в одном батче сопоставления
+            queue_size: Максимум неотправленных сообщений клиента
+        """
+        self.websocket = websocket
+        self.tailer = tailer
+        self.analyzer = analyzer
+        self.anomalies_df = anomalies_df
+        self.options = options
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.totals = {level: 0 for level in LEVELS}
+        self.dropped = 0
+        self._wake = asyncio.Event()
+
+    def _match_batch(self, records: List[Dict]) -> Dict:
+        """Счетчики уровней и совпадения WARNING строк одного батча (в потоке)."""
+        logs_df = pd.DataFrame(records)
+        counts = logs_df["level"].value_counts().to_dict()
+        for level in LEVELS:
+            self.totals[level] += int(counts.get(level, 0))
+
+        matches = []
+        if counts.get("WARNING"):
+            match_state = self.analyzer.match_warnings(logs_df, self.anomalies_df, self.options)
+            matches = dataframe_to_records(
+                match_state.warning_matches(self.options.similarity_threshold, self.options.new_anomaly_floor)
+            )
+        return {
+            "type": "batch",
+            "lines": len(records),
+            "counts": {level: int(counts.get(level, 0)) for level in LEVELS},
+            "totals": dict(self.totals),
+            "matches": matches,
+        }
+
+    def _enqueue(self, message: Dict) -> None:
+        if self.queue.full():
+            # Клиент не успевает читать - теряем самое старое сообщение
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    def notify(self) -> None:
+        """Будит опрос раньше интервала (вызывается из потока watchdog)."""
+        self._wake.set()
+
+    async def _produce(self) -> None:
+        while True:
+            records = await run_in_threadpool(self.tailer.poll)
+            for start in range(0, len(records), self.batch_size):
+                message = await run_in_threadpool(self._match_batch, records[start:start + self.batch_size])
+                self._enqueue(message)
+            if records:
+                # Файл мог быть прочитан не до конца (max_read_bytes) - читаем дальше сразу
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _send(self) -> None:
+        while True:
+            message = await self.queue.get()
+            message["dropped"] = self.dropped
+            await self.websocket.send_text(dumps(message).decode("utf-8"))
+
+    async def _receive(self) -> None:
+        # Входящие сообщения не используются - ждем отключения клиента
+        while True:
+            await self.websocket.receive_text()
+
+    async def run(self) -> None:
+        """Обслуживает подключение до отключения клиента."""
+        await self.websocket.send_text(dumps({
+            "type": "hello",
+            "files": [os.path.basename(path) for path in self.tailer.files],
+            "threshold": self.options.similarity_threshold,
+            "new_anomaly_floor": self.options.new_anomaly_floor,
+        }).decode("utf-8"))
+
+        tasks = [asyncio.ensure_future(coro) for coro in (self._produce(), self._send(), self._receive())]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                error = task.exception()
+                if error is not None and not isinstance(error, WebSocketDisconnect):
+                    raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.tailer.close()
@@ -0,0 +1,102 @@
+"""Фоновая загрузка и прогрев ML модели.
+
+Модель загружается после старта процесса в отдельном потоке, поэтому
+API сразу принимает соединения (/livez отвечает), а /readyz сообщает
+оркестратору, когда можно направлять трафик. ML запросы, пришедшие
+во время загрузки, ждут готовности модели с таймаутом.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_LOADING = "loading"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+
+
+class ModelNotReadyError(Exception):
+    """Модель не успела загрузиться за отведенное время или загрузка упала."""
+
+
+class ModelWarmup:
+    """Управляет фоновой загрузкой модели анализатора."""
+
+    def __init__(self, analyzer):
+        """Инициализация.
+
+        Args:
+            analyzer: Экземпляр MLLogAnalyzer с методом warm_up()
+        """
+        self.analyzer = analyzer
+        self.status = STATUS_PENDING
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.ready_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _warm_up(self):
+        """Синхронная часть: загрузка модели и пробный encode (в потоке)."""
+        self.status = STATUS_LOADING
+        self.started_at = time.time()
+        logger.info("⏳ Фоновая загрузка ML модели...")
+        try:
+            self.analyzer.warm_up()
+        except Exception as e:
+            self.status = STATUS_FAILED
+            self.error = str(e)
+            logger.error(f"Не удалось загрузить ML модель: {e}", exc_info=True)
+            raise
+        self.ready_at = time.time()
+        self.status = STATUS_READY
+        logger.info(f"✅ ML модель загружена и прогрета за {self.ready_at - self.started_at:.1f} сек")
+
+    def load_now(self):
+        """Синхронно загружает и прогревает модель (pre-fork мастер до fork)."""
+        self._warm_up()
+
+    def start(self) -> asyncio.Task:
+        """Запускает загрузку в фоне (повторный вызов возвращает ту же задачу)."""
+        if self._task is None or (self._task.done() and self.status == STATUS_FAILED):
+            self.error = None
+            self._task = asyncio.get_running_loop().create_task(asyncio.to_thread(self._warm_up))
+            # Исключение сохраняется в self.error, не даем asyncio ругаться на него
+            self._task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return self._task
+
+    @property
+    def is_ready(self) -> bool:
+        return self.status == STATUS_READY
+
+    async def wait_ready(self, timeout: float) -> None:
+        """Ждет готовности модели, запуская загрузку, если она еще не начата.
+
+        Args:
+            timeout: Максимальное время ожидания в секундах
+
+        Raises:
+            ModelNotReadyError: Если модель не загрузилась за timeout или загрузка упала
+        """
+        if self.is_ready:
+            return
+        task = self.start()
+        try:
+            # shield - таймаут одного запроса не должен отменять загрузку
+            await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise ModelNotReadyError(f"ML модель еще загружается (ожидание {timeout:.0f} сек истекло)")
+        except Exception as e:
+            raise ModelNotReadyError(f"ML модель не загружена: {e}")
+
+    def state(self) -> Dict:
+        """Состояние загрузки для /readyz и /health."""
+        state = {"status": self.status}
+        if self.error:
+            state["error"] = self.error
+        if self.ready_at and self.started_at:
+            state["load_seconds"] = round(self.ready_at - self.started_at, 2)
+        return state
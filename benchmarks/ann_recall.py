@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Точность и скорость ANN индекса (IVF) против точного поиска.
+
+Словарь - синтетические кластеризованные эмбеддинги (как у похожих
+формулировок аномалий) или реальные эмбеддинги из .npy файла (--embeddings).
+Запросы - строки словаря с шумом. Для каждого n_probe замеряются:
+- recall@1: доля запросов, у которых top-1 индекса совпадает с точным
+  (по score - дубликаты текстов в словаре дают одинаковые векторы);
+- время поиска и ускорение относительно точного пути.
+
+Скрипт возвращает код 1, если recall@1 при --check-probe ниже --min-recall.
+
+Пример:
+    python benchmarks/ann_recall.py --dictionary-size 100000 --probes 4 8 16 32
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from core.services.ann_index import IVFIndex
+from core.services.ml_analyzer import MLLogAnalyzer
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def synthetic_dictionary(size: int, dim: int, clusters: int, spread: float, rng) -> np.ndarray:
+    """Кластеры близких векторов на сфере (группы похожих формулировок)."""
+    centers = rng.normal(size=(clusters, dim))
+    return _normalize(centers[rng.integers(0, clusters, size)] + spread * rng.normal(size=(size, dim)))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="recall@1 и скорость IVF индекса против точного поиска")
+    parser.add_argument("--embeddings", help=".npy с нормализованными эмбеддингами словаря (вместо синтетики)")
+    parser.add_argument("--dictionary-size", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384, help="Размерность (all-MiniLM-L6-v2 - 384)")
+    parser.add_argument("--clusters", type=int, default=2_000, help="Кластеров в синтетическом словаре")
+    parser.add_argument("--spread", type=float, default=0.05, help="Разброс внутри кластера")
+    parser.add_argument("--queries", type=int, default=20_000)
+    parser.add_argument("--noise", type=float, default=0.03, help="Шум запросов относительно строк словаря")
+    parser.add_argument("--lists", type=int, default=0, help="Кластеров индекса (0 - ~sqrt(размер))")
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--check-probe", type=int, default=8, help="n_probe, для которого проверяется --min-recall")
+    parser.add_argument("--min-recall", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Сохранить JSON результат в файл")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.embeddings:
+        dictionary = _normalize(np.load(args.embeddings))
+    else:
+        dictionary = synthetic_dictionary(args.dictionary_size, args.dim, args.clusters, args.spread, rng)
+    queries = _normalize(
+        dictionary[rng.integers(0, len(dictionary), args.queries)]
+        + args.noise * rng.normal(size=(args.queries, dictionary.shape[1]))
+    )
+
+    start = time.perf_counter()
+    exact_indices, exact_scores = MLLogAnalyzer._top_k_matches(queries, dictionary, 1)
+    exact_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = IVFIndex.build(dictionary, n_lists=args.lists)
+    build_seconds = time.perf_counter() - start
+
+    runs = []
+    failures = []
+    for n_probe in args.probes:
+        start = time.perf_counter()
+        indices, scores = index.search(queries, 1, n_probe=n_probe)
+        seconds = time.perf_counter() - start
+        # Совпадение по score: дубликаты в словаре - равноправные ответы
+        recall = float(np.mean(scores[:, 0] >= exact_scores[:, 0] - 1e-6))
+        runs.append({
+            "n_probe": n_probe,
+            "recall_at_1": recall,
+            "index_match_at_1": float(np.mean(indices[:, 0] == exact_indices[:, 0])),
+            "search_seconds": seconds,
+            "speedup": exact_seconds / seconds if seconds else None,
+        })
+        if n_probe == args.check_probe and recall < args.min_recall:
+            failures.append(f"n_probe={n_probe}: recall@1 {recall:.3f} < {args.min_recall}")
+
+    report = {
+        "dictionary_size": len(dictionary),
+        "dim": int(dictionary.shape[1]),
+        "queries": args.queries,
+        "n_lists": index.n_lists,
+        "build_seconds": build_seconds,
+        "exact_seconds": exact_seconds,
+        "runs": runs,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+
+    for failure in failures:
+        print(f"❌ {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
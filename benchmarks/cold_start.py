@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк холодного старта API.
+
+Измеряет в свежих процессах:
+- время `import api.main` и какие тяжелые модули оказались загружены;
+- время от запуска uvicorn до первого успешного ответа /livez и /health.
+
+Результат печатается в JSON (для отслеживания в CI). С флагами --max-*
+скрипт завершается с кодом 1 при превышении бюджета.
+
+Пример:
+    python benchmarks/cold_start.py --runs 3 --max-import 2.0 --forbid-heavy
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# Модули, которые не должны импортироваться вместе с api.main
+HEAVY_MODULES = ["torch", "sentence_transformers", "plotly.express", "networkx", "pyvis", "openpyxl"]
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import api.main
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"import_seconds": elapsed, "heavy_modules": heavy}}))
+"""
+
+
+def _free_port() -> int:
+    """Находит свободный TCP порт."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _child_env() -> dict:
+    """Окружение дочернего процесса: модель не предзагружается, чтобы мерить сам API."""
+    env = os.environ.copy()
+    env.setdefault("API_PRELOAD_MODEL", "false")
+    env["PYTHONPATH"] = str(ROOT_DIR) + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def measure_import() -> dict:
+    """Импортирует api.main в новом интерпретаторе."""
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE.format(heavy=HEAVY_MODULES)],
+        cwd=ROOT_DIR, env=_child_env(), capture_output=True, text=True, check=True,
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def _wait_for(url: str, deadline: float) -> float:
+    """Опрашивает url до первого ответа 200, возвращает момент ответа."""
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter()
+        except OSError:
+            time.sleep(0.02)
+    raise TimeoutError(f"Нет ответа от {url}")
+
+
+def measure_first_response(timeout: float) -> dict:
+    """Запускает uvicorn и меряет время до первых ответов."""
+    port = _free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT_DIR, env=_child_env(),
+    )
+    try:
+        deadline = start + timeout
+        livez_at = _wait_for(f"http://127.0.0.1:{port}/livez", deadline)
+        health_start = time.perf_counter()
+        health_at = _wait_for(f"http://127.0.0.1:{port}/health", deadline)
+        return {
+            "first_response_seconds": livez_at - start,
+            "health_seconds": health_at - health_start,
+        }
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк холодного старта API")
+    parser.add_argument("--runs", type=int, default=3, help="Количество запусков")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Таймаут запуска сервера (сек)")
+    parser.add_argument("--max-import", type=float, help="Бюджет на import api.main (медиана, сек)")
+    parser.add_argument("--max-first-response", type=float, help="Бюджет до первого ответа (медиана, сек)")
+    parser.add_argument("--forbid-heavy", action="store_true",
+                        help="Падать, если api.main импортирует тяжелые модули")
+    parser.add_argument("--output", help="Сохранить JSON результат в файл")
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.runs)]
+    responses = [measure_first_response(args.timeout) for _ in range(args.runs)]
+
+    result = {
+        "runs": args.runs,
+        "import_seconds": statistics.median(r["import_seconds"] for r in imports),
+        "first_response_seconds": statistics.median(r["first_response_seconds"] for r in responses),
+        "health_seconds": statistics.median(r["health_seconds"] for r in responses),
+        "heavy_modules": sorted({name for r in imports for name in r["heavy_modules"]}),
+        "python": sys.version.split()[0],
+    }
+
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+
+    failures = []
+    if args.max_import is not None and result["import_seconds"] > args.max_import:
+        failures.append(f"import api.main {result['import_seconds']:.2f}s > {args.max_import:.2f}s")
+    if args.max_first_response is not None and result["first_response_seconds"] > args.max_first_response:
+        failures.append(f"первый ответ {result['first_response_seconds']:.2f}s > {args.max_first_response:.2f}s")
+    if args.forbid_heavy and result["heavy_modules"]:
+        failures.append(f"тяжелые модули при импорте: {', '.join(result['heavy_modules'])}")
+
+    for failure in failures:
+        print(f"❌ {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
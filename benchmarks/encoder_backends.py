@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Сравнение бэкендов кодирования MLLogAnalyzer на тест-кейсах.
+
+Для каждого бэкенда (torch, torch-int8, onnx, onnx-int8):
+- скорость кодирования WARNING строк (предложений/сек);
+- паритет: доля WARNING строк, у которых top-1 аномалия из словаря совпадает
+  с эталонным torch бэкендом.
+
+Тест-кейсы берутся из "Test Cases/TestCase*/" (логи *.txt/*.log + anomalies_problems.csv).
+Скрипт возвращает код 1, если паритет ниже --min-agreement.
+
+Пример:
+    python benchmarks/encoder_backends.py --backends torch onnx onnx-int8
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from core.services.encoders import ENCODER_BACKENDS, HashingEncoder, create_encoder
+from core.services.log_parser import LogParser
+
+REFERENCE_BACKEND = "torch"
+
+
+def load_test_cases(test_cases_dir: Path):
+    """Загружает WARNING строки и словарь аномалий каждого тест-кейса."""
+    parser = LogParser()
+    cases = []
+    for case_dir in sorted(d for d in test_cases_dir.iterdir() if d.is_dir() and d.name.startswith("TestCase")):
+        anomalies_path = case_dir / "anomalies_problems.csv"
+        if not anomalies_path.exists():
+            continue
+        log_files = [str(p) for p in sorted(case_dir.iterdir()) if p.suffix in (".txt", ".log")]
+        logs_df = parser.parse_log_files(log_files)
+        if logs_df.empty:
+            continue
+        warnings = logs_df.loc[logs_df["level"] == "WARNING", "text"].astype(str).tolist()
+        anomalies = pd.read_csv(anomalies_path, sep=";", encoding="utf-8")["Аномалия"].astype(str).tolist()
+        cases.append({"name": case_dir.name, "warnings": warnings, "anomalies": anomalies})
+    return cases
+
+
+def run_backend(backend: str, cases, batch_size: int, repeats: int):
+    """Кодирует тест-кейсы бэкендом: скорость и top-1 совпадения."""
+    encoder = create_encoder(backend)
+    encoder.warm_up()
+
+    top1 = {}
+    encode_seconds = 0.0
+    sentences = 0
+    for case in cases:
+        anomaly_embeddings = encoder.encode(case["anomalies"], batch_size=batch_size)
+        for _ in range(repeats):
+            start = time.perf_counter()
+            warning_embeddings = encoder.encode(case["warnings"], batch_size=batch_size)
+            encode_seconds += time.perf_counter() - start
+            sentences += len(case["warnings"])
+        scores = warning_embeddings @ anomaly_embeddings.T
+        top1[case["name"]] = scores.argmax(axis=1) if len(case["warnings"]) else np.zeros(0, dtype=int)
+
+    return {
+        "sentences_per_second": sentences / encode_seconds if encode_seconds else None,
+        "sentences": sentences,
+        "encode_seconds": encode_seconds,
+    }, top1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк и паритет бэкендов кодирования")
+    parser.add_argument("--test-cases", default=str(ROOT_DIR / "Test Cases"), help="Директория с тест-кейсами")
+    parser.add_argument("--backends", nargs="+", choices=list(ENCODER_BACKENDS),
+                        default=[backend for backend in ENCODER_BACKENDS if backend != HashingEncoder.name])
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3, help="Повторов кодирования для замера скорости")
+    parser.add_argument("--min-agreement", type=float, default=0.99,
+                        help="Минимальная доля совпадений top-1 с torch бэкендом")
+    parser.add_argument("--output", help="Сохранить JSON результат в файл")
+    args = parser.parse_args()
+
+    cases = load_test_cases(Path(args.test_cases))
+    if not cases:
+        print(f"❌ Тест-кейсы не найдены в {args.test_cases}", file=sys.stderr)
+        return 1
+
+    backends = list(args.backends)
+    if REFERENCE_BACKEND not in backends:
+        backends.insert(0, REFERENCE_BACKEND)
+
+    results = {}
+    top1_by_backend = {}
+    for backend in backends:
+        results[backend], top1_by_backend[backend] = run_backend(backend, cases, args.batch_size, args.repeats)
+
+    reference = top1_by_backend[REFERENCE_BACKEND]
+    total = sum(len(v) for v in reference.values())
+    failures = []
+    for backend in backends:
+        matches = sum(int((top1_by_backend[backend][name] == reference[name]).sum()) for name in reference)
+        agreement = matches / total if total else 1.0
+        results[backend]["top1_agreement"] = agreement
+        if agreement < args.min_agreement:
+            failures.append(f"{backend}: top-1 совпадает с torch в {agreement:.2%} случаев")
+
+    report = {"test_cases": [c["name"] for c in cases], "backends": results}
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+
+    for failure in failures:
+        print(f"❌ {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,557 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест API: /api/v1/analyze, /api/v1/timeline и /api/v1/download.
+
+Сервер:
+- --server inprocess (по умолчанию) - uvicorn в потоке этого процесса;
+- --server launch - uvicorn отдельным процессом (--workers для нескольких воркеров);
+- --url http://host:port - уже запущенный сервер (RSS - по --server-pid, если указан).
+
+Для inprocess и launch выставляется ML_ENCODER_BACKEND=hashing (--encoder):
+тест работает без сети и модели и меряет обслуживание запросов, а не скорость
+модели. Логи разного размера (--sizes, строк в файле) генерируются
+benchmarks/synthetic.py, словарь аномалий отправляется вместе с логами.
+
+Для каждого уровня --concurrency потоки-клиенты --duration секунд шлют запросы
+вперемешку (--mix analyze=6,timeline=3,download=1; download берет ссылки
+на Excel из ответов analyze). Результат в JSON по уровням: пропускная способность,
+перцентили задержки и доля ошибок по эндпоинтам, RSS сервера во времени.
+Код 1, если доля ошибок уровня выше --max-error-rate.
+
+После уровней - проверка head-of-line блокировки планировщика инференса
+(--hol-lines, 0 - пропустить): задержка маленьких анализов (--hol-small-lines)
+без нагрузки и пока идет один большой анализ с множеством уникальных WARNING.
+Маленькие запросы каждый раз с новыми текстами - кэш эмбеддингов их не спасает.
+С --max-hol-ratio код 1, если медиана под нагрузкой больше медианы без нее
+в указанное число раз.
+
+Загрузки, отчеты, анализы и индекс артефактов запущенного тестом сервера
+пишутся во временный API_DATA_DIR и удаляются после прогона - рабочие
+директории api/ не затрагиваются.
+В режиме inprocess клиенты делят GIL с сервером - для точных цифр используйте launch.
+
+Пример:
+    python benchmarks/load_test.py --server launch --concurrency 1 2 4 8 --duration 30
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from api.procmem import rss_bytes
+from benchmarks.synthetic import SyntheticSpec, build_dictionary, generate_lines
+
+ENDPOINTS = ("analyze", "timeline", "download")
+PERCENTILES = (50, 90, 95, 99)
+
+
+def _free_port() -> int:
+    """Находит свободный TCP порт."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(url: str, timeout: float) -> None:
+    """Опрашивает url до первого ответа 200."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Нет ответа от {url}")
+
+
+def _server_env(encoder: str, data_dir: str) -> Dict[str, str]:
+    env = {
+        "ML_ENCODER_BACKEND": encoder,
+        # Загрузки, отчеты, анализы и индекс артефактов теста - отдельно от рабочих в api/
+        "API_DATA_DIR": data_dir,
+    }
+    return {name: os.environ.get(name, value) for name, value in env.items()}
+
+
+class InProcessServer:
+    """uvicorn в фоновом потоке текущего процесса."""
+
+    def __init__(self, encoder: str, data_dir: str):
+        os.environ.update(_server_env(encoder, data_dir))
+        import uvicorn
+        from api.main import app
+
+        self.port = _free_port()
+        self.pid = os.getpid()
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, name="load-test-server", daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout: float) -> None:
+        self.thread.start()
+        _wait_for(f"{self.url}/readyz", timeout)
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        if self.thread.is_alive():
+            self.thread.join(timeout=10)
+
+
+class LaunchedServer:
+    """uvicorn отдельным процессом."""
+
+    def __init__(self, encoder: str, workers: int, data_dir: str):
+        self.port = _free_port()
+        self.env = {**os.environ, **_server_env(encoder, data_dir)}
+        self.env["PYTHONPATH"] = str(ROOT_DIR) + os.pathsep + self.env.get("PYTHONPATH", "")
+        self.workers = workers
+        self.process: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def start(self, timeout: float) -> None:
+        command = [sys.executable, "-m", "uvicorn", "api.main:app", "--host", "127.0.0.1",
+                   "--port", str(self.port), "--log-level", "warning"]
+        if self.workers > 1:
+            command += ["--workers", str(self.workers)]
+        self.process = subprocess.Popen(command, cwd=ROOT_DIR, env=self.env)
+        _wait_for(f"{self.url}/readyz", timeout)
+
+    def stop(self) -> None:
+        if self.process is None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def _children(pid: int) -> List[int]:
+    """PID дочерних процессов (воркеры uvicorn --workers)."""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", "r") as f:
+            return [int(child) for child in f.read().split()]
+    except (OSError, ValueError):
+        return []
+
+
+def server_rss(pid: int) -> int:
+    """RSS сервера с воркерами (байты)."""
+    return rss_bytes(pid) + sum(rss_bytes(child) for child in _children(pid))
+
+
+def multipart(fields: Dict[str, str], files: Dict[str, Tuple[str, bytes]]) -> Tuple[bytes, str]:
+    """Тело multipart/form-data и его Content-Type."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n".encode() + content + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Доли эндпоинтов из строки "analyze=6,timeline=3,download=1"."""
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Неизвестный эндпоинт {name}: {', '.join(ENDPOINTS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Workload:
+    """Готовые тела запросов для каждого размера логов и ссылки на отчеты для download."""
+
+    def __init__(self, sizes: List[int], spec: SyntheticSpec, mix: Dict[str, float], seed: int):
+        dictionary = build_dictionary(spec).to_csv(sep=";", index=False).encode("utf-8")
+        self.spec = spec
+        self.dictionary = dictionary
+        self.analyze_bodies = {}
+        self.timeline_bodies = {}
+        self.input_bytes = {}
+        for size in sizes:
+            content = ("\n".join(generate_lines(SyntheticSpec(**{**spec.to_dict(), "lines": size}))) + "\n").encode()
+            self.input_bytes[size] = len(content)
+            self.analyze_bodies[size] = multipart(
+                {"threshold": "0.7"},
+                {"log_file": (f"load_{size}.log", content), "anomalies_file": ("anomalies_problems.csv", dictionary)},
+            )
+            self.timeline_bodies[size] = multipart({}, {"log_file": (f"load_{size}.log", content)})
+        self.sizes = sizes
+        self.endpoints = list(mix)
+        self.weights = [mix[name] for name in self.endpoints]
+        self.seed = seed
+        self.reports: List[str] = []
+        self._lock = threading.Lock()
+
+    def analyze_body(self, spec: SyntheticSpec, name: str) -> Tuple[bytes, str]:
+        """Тело /api/v1/analyze для произвольного набора логов со словарем нагрузки."""
+        content = ("\n".join(generate_lines(spec)) + "\n").encode()
+        return multipart(
+            {"threshold": "0.7"},
+            {"log_file": (name, content), "anomalies_file": ("anomalies_problems.csv", self.dictionary)},
+        )
+
+    def add_report(self, path: str) -> None:
+        with self._lock:
+            self.reports.append(path)
+
+    def report(self, rng: random.Random) -> Optional[str]:
+        with self._lock:
+            return rng.choice(self.reports) if self.reports else None
+
+
+def request(base_url: str, endpoint: str, size: Optional[int], workload: Workload,
+            rng: random.Random, timeout: float) -> Tuple[str, Optional[int], int, int]:
+    """Выполняет один запрос.
+
+    Returns:
+        (эндпоинт, размер логов, HTTP статус (0 - ошибка соединения), байт ответа)
+    """
+    if endpoint == "download":
+        path = workload.report(rng)
+        if path is None:
+            endpoint = "analyze"  # Отчетов еще нет - сначала анализ
+        else:
+            http_request = urllib.request.Request(base_url + path)
+            size = None
+    if endpoint == "analyze":
+        body, content_type = workload.analyze_bodies[size]
+        http_request = urllib.request.Request(base_url + "/api/v1/analyze", data=body,
+                                              headers={"Content-Type": content_type}, method="POST")
+    elif endpoint == "timeline":
+        body, content_type = workload.timeline_bodies[size]
+        http_request = urllib.request.Request(base_url + "/api/v1/timeline", data=body,
+                                              headers={"Content-Type": content_type}, method="POST")
+    try:
+        with urllib.request.urlopen(http_request, timeout=timeout) as response:
+            payload = response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        return endpoint, size, e.code, len(e.read() or b"")
+    except OSError:
+        return endpoint, size, 0, 0
+    if endpoint == "analyze" and status == 200:
+        report = json.loads(payload).get("excel_report")
+        if report:
+            workload.add_report(report)
+    return endpoint, size, status, len(payload)
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    ordered = sorted(values)
+    # Nearest-rank: наименьшее значение, не меньше которого percentile% наблюдений
+    index = max(0, min(len(ordered) - 1, math.ceil(percentile / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _latency_stats(samples: List[Dict]) -> Dict:
+    latencies = [sample["latency"] for sample in samples]
+    errors = sum(1 for sample in samples if not 200 <= sample["status"] < 300)
+    stats = {"requests": len(samples), "errors": errors, "error_rate": errors / len(samples) if samples else 0.0}
+    if latencies:
+        stats.update({f"p{p}_ms": round(_percentile(latencies, p) * 1000, 1) for p in PERCENTILES})
+        stats["max_ms"] = round(max(latencies) * 1000, 1)
+        stats["mean_ms"] = round(sum(latencies) / len(latencies) * 1000, 1)
+    return stats
+
+
+def run_level(base_url: str, workload: Workload, concurrency: int, duration: float, timeout: float) -> Dict:
+    """Нагрузка одного уровня конкурентности."""
+    samples: List[Dict] = []
+    samples_lock = threading.Lock()
+    started = time.perf_counter()
+    deadline = started + duration
+
+    def client(index: int) -> None:
+        rng = random.Random(workload.seed * 1009 + concurrency * 101 + index)
+        while time.perf_counter() < deadline:
+            endpoint = rng.choices(workload.endpoints, workload.weights)[0]
+            size = rng.choice(workload.sizes)
+            request_started = time.perf_counter()
+            endpoint, size, status, response_bytes = request(base_url, endpoint, size, workload, rng, timeout)
+            finished = time.perf_counter()
+            with samples_lock:
+                samples.append({
+                    "endpoint": endpoint, "size": size, "status": status, "bytes": response_bytes,
+                    "latency": finished - request_started, "finished": finished - started,
+                })
+
+    threads = [threading.Thread(target=client, args=(index,), daemon=True) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    by_endpoint = defaultdict(list)
+    by_size = defaultdict(list)
+    statuses = defaultdict(int)
+    for sample in samples:
+        by_endpoint[sample["endpoint"]].append(sample)
+        if sample["size"] is not None:
+            by_size[sample["size"]].append(sample)
+        statuses[str(sample["status"])] += 1
+    return {
+        "concurrency": concurrency,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(samples) / elapsed, 3) if elapsed else 0.0,
+        "response_mb": round(sum(sample["bytes"] for sample in samples) / 2 ** 20, 3),
+        "statuses": dict(statuses),
+        **_latency_stats(samples),
+        "endpoints": {name: _latency_stats(items) for name, items in sorted(by_endpoint.items())},
+        "sizes": {str(size): _latency_stats(items) for size, items in sorted(by_size.items())},
+    }
+
+
+def _post_analyze(base_url: str, body: Tuple[bytes, str], timeout: float) -> Tuple[int, float]:
+    """POST /api/v1/analyze: (HTTP статус (0 - ошибка соединения), секунды)."""
+    data, content_type = body
+    http_request = urllib.request.Request(base_url + "/api/v1/analyze", data=data,
+                                          headers={"Content-Type": content_type}, method="POST")
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(http_request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = 0
+    return status, time.perf_counter() - started
+
+
+def head_of_line(base_url: str, workload: Workload, small_lines: int, large_lines: int,
+                 samples: int, timeout: float) -> Dict:
+    """Задержка маленьких анализов без нагрузки и во время одного большого."""
+    base = workload.spec.to_dict()
+    counter = iter(range(1, 1_000_000))
+
+    def small_body() -> Tuple[bytes, str]:
+        # Новый seed - новые тексты WARNING, минуя кэш эмбеддингов
+        spec = SyntheticSpec(**{**base, "lines": small_lines, "cardinality": 50,
+                                "seed": workload.seed * 7919 + next(counter)})
+        return workload.analyze_body(spec, f"hol_small_{small_lines}.log")
+
+    idle = [_post_analyze(base_url, small_body(), timeout) for _ in range(samples)]
+
+    large_spec = SyntheticSpec(**{**base, "lines": large_lines, "warning_share": 0.5,
+                                  "cardinality": max(1, large_lines // 2), "seed": workload.seed * 104729})
+    large_body = workload.analyze_body(large_spec, f"hol_large_{large_lines}.log")
+    large_result: Dict = {}
+
+    def run_large() -> None:
+        large_result["status"], large_result["seconds"] = _post_analyze(base_url, large_body, timeout)
+
+    large_thread = threading.Thread(target=run_large, name="load-test-hol-large", daemon=True)
+    large_thread.start()
+    time.sleep(0.2)  # Большой запрос успевает дойти до кодирования
+    loaded = []
+    while large_thread.is_alive() or not loaded:
+        loaded.append(_post_analyze(base_url, small_body(), timeout))
+        if len(loaded) >= samples and not large_thread.is_alive():
+            break
+    large_thread.join()
+
+    def stats(results: List[Tuple[int, float]]) -> Dict:
+        latencies = [seconds for _, seconds in results]
+        return {
+            "requests": len(results),
+            "errors": sum(1 for status, _ in results if not 200 <= status < 300),
+            "p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+            "max_ms": round(max(latencies) * 1000, 1),
+        }
+
+    idle_stats, loaded_stats = stats(idle), stats(loaded)
+    return {
+        "small_lines": small_lines,
+        "large_lines": large_lines,
+        "large_status": large_result.get("status"),
+        "large_ms": round(large_result.get("seconds", 0.0) * 1000, 1),
+        "idle": idle_stats,
+        "under_large": loaded_stats,
+        "p50_ratio": round(loaded_stats["p50_ms"] / idle_stats["p50_ms"], 2) if idle_stats["p50_ms"] else None,
+    }
+
+
+class RssSampler:
+    """RSS сервера раз в interval секунд (в отдельном потоке)."""
+
+    def __init__(self, pid: Optional[int], interval: float):
+        self.pid = pid
+        self.interval = interval
+        self.series: List[Dict] = []
+        self.level: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="load-test-rss", daemon=True)
+        self._started = time.perf_counter()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.series.append({
+                "t": round(time.perf_counter() - self._started, 2),
+                "concurrency": self.level,
+                "rss_mb": round(server_rss(self.pid) / 2 ** 20, 1),
+            })
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        if self.pid:
+            self._thread.start()
+
+    def stop(self) -> Dict:
+        if not self.pid:
+            return {}
+        self._stop.set()
+        self._thread.join()
+        values = [point["rss_mb"] for point in self.series]
+        return {
+            "start_mb": values[0] if values else None,
+            "peak_mb": max(values) if values else None,
+            "end_mb": values[-1] if values else None,
+            "series": self.series,
+        }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API (analyze, timeline, download)")
+    parser.add_argument("--server", choices=("inprocess", "launch"), default="inprocess",
+                        help="Где запускать сервер (игнорируется с --url)")
+    parser.add_argument("--url", help="Уже запущенный сервер, например http://127.0.0.1:8001")
+    parser.add_argument("--server-pid", type=int, help="PID сервера для RSS при --url")
+    parser.add_argument("--workers", type=int, default=1, help="Воркеры uvicorn для --server launch")
+    parser.add_argument("--encoder", default="hashing", help="ML_ENCODER_BACKEND сервера (hashing - без модели)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4], help="Уровни конкурентности")
+    parser.add_argument("--duration", type=float, default=20.0, help="Секунд нагрузки на уровень")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000],
+                        help="Размеры файлов логов (строк), выбираются случайно")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("analyze=6,timeline=3,download=1"),
+                        help="Доли эндпоинтов")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Таймаут запроса (сек)")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--rss-interval", type=float, default=0.5, help="Период замера RSS (сек)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Допустимая доля ошибок уровня")
+    parser.add_argument("--hol-lines", type=int, default=50000,
+                        help="Строк большого анализа для проверки head-of-line блокировки (0 - пропустить)")
+    parser.add_argument("--hol-small-lines", type=int, default=200, help="Строк маленьких анализов этой проверки")
+    parser.add_argument("--hol-samples", type=int, default=5, help="Маленьких анализов без нагрузки (и минимум под ней)")
+    parser.add_argument("--max-hol-ratio", type=float,
+                        help="Допустимое отношение медиан маленьких анализов под большим и без него")
+    parser.add_argument("--output", help="Сохранить JSON результат в файл")
+    args = parser.parse_args()
+
+    spec = SyntheticSpec(warning_share=0.1, error_share=0.002, cardinality=2000, dictionary_size=100, seed=args.seed)
+    workload = Workload(args.sizes, spec, args.mix, args.seed)
+
+    server = None
+    data_dir = None
+    if args.url:
+        base_url, pid = args.url.rstrip("/"), args.server_pid
+    else:
+        data_dir = tempfile.mkdtemp(prefix="load_test_")
+        if args.server == "inprocess":
+            server = InProcessServer(args.encoder, data_dir)
+        else:
+            server = LaunchedServer(args.encoder, args.workers, data_dir)
+        try:
+            server.start(args.startup_timeout)
+        except BaseException:
+            server.stop()
+            shutil.rmtree(data_dir, ignore_errors=True)
+            raise
+        base_url, pid = server.url, server.pid
+
+    sampler = RssSampler(pid, args.rss_interval)
+    levels = []
+    hol = None
+    try:
+        sampler.start()
+        for concurrency in args.concurrency:
+            sampler.level = concurrency
+            level = run_level(base_url, workload, concurrency, args.duration, args.timeout)
+            levels.append(level)
+            print(f"concurrency {concurrency}: {level['throughput_rps']:.2f} rps, "
+                  f"p95 {level.get('p95_ms')} ms, ошибок {level['errors']}", file=sys.stderr)
+        if args.hol_lines > 0:
+            sampler.level = "head_of_line"
+            hol = head_of_line(base_url, workload, args.hol_small_lines, args.hol_lines,
+                               max(1, args.hol_samples), args.timeout)
+            print(f"head-of-line: маленький анализ {hol['idle']['p50_ms']} мс без нагрузки, "
+                  f"{hol['under_large']['p50_ms']} мс под большим ({hol['large_ms']} мс)", file=sys.stderr)
+    finally:
+        rss = sampler.stop()
+        if server is not None:
+            server.stop()
+        if data_dir is not None:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        "server": "url" if args.url else args.server,
+        "workers": args.workers,
+        "encoder": args.encoder,
+        "duration_seconds": args.duration,
+        "mix": args.mix,
+        "sizes": {str(size): {"lines": size, "bytes": workload.input_bytes[size]} for size in args.sizes},
+        "levels": levels,
+        "head_of_line": hol,
+        "rss": rss,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+
+    failures = [
+        f"concurrency {level['concurrency']}: ошибок {level['error_rate']:.1%} > {args.max_error_rate:.1%}"
+        for level in levels if level["error_rate"] > args.max_error_rate
+    ]
+    if hol is not None:
+        if hol["large_status"] != 200 or hol["idle"]["errors"] or hol["under_large"]["errors"]:
+            failures.append(f"head-of-line: ошибки запросов (большой анализ - статус {hol['large_status']})")
+        elif args.max_hol_ratio is not None and hol["p50_ratio"] and hol["p50_ratio"] > args.max_hol_ratio:
+            failures.append(f"head-of-line: медиана маленьких анализов x{hol['p50_ratio']} > x{args.max_hol_ratio}")
+    for failure in failures:
+        print(f"❌ {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
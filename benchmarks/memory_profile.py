@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Пик памяти этапов анализа на МБ входных логов (страж регрессий).
+
+Генерирует синтетические логи (benchmarks/synthetic.py) и прогоняет тот же
+конвейер, что и /api/v1/analyze: парсинг, базовая статистика, сопоставление
+(hashing бэкенд - без модели), находки, Excel отчет. Этапы замеряются
+StageTimer(memory=True) под tracemalloc, включая вложенные этапы парсера
+(read, parse_lines, dataframe) и анализатора (dictionary_encode, warning_encode,
+search).
+
+Для каждого этапа - пик над уровнем на его начале и чистый прирост,
+в МБ и в МБ на МБ входа. С --baseline результат сравнивается с
+сохраненным: код 1, если peak_per_input_mb этапа (или общий) вырос больше
+чем на --tolerance. Этапы с пиком в baseline меньше --min-stage-mb не
+сравниваются (шум). --write-baseline сохраняет текущий результат.
+
+Пример:
+    python benchmarks/memory_profile.py --baseline benchmarks/memory_baseline.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from benchmarks.synthetic import add_spec_arguments, build_dictionary, spec_from_args, write_logs
+from core.services.log_parser import LogParser
+from core.services.ml_analyzer import AnalysisOptions, MLLogAnalyzer
+from core.services.report_generator import ReportGenerator
+from core.services.timing import StageTimer, span
+
+MB = 1024 * 1024
+# Этапы верхнего уровня - как в /api/v1/analyze
+TOP_LEVEL_STAGES = ("parse", "basic_stats", "match", "findings", "report")
+
+
+def run_pipeline(log_paths, anomalies_df, report_path: str) -> StageTimer:
+    """Конвейер /api/v1/analyze с замером памяти этапов."""
+    parser = LogParser()
+    analyzer = MLLogAnalyzer(encoder_backend="hashing")
+    report_generator = ReportGenerator()
+    options = AnalysisOptions()
+
+    timer = StageTimer(memory=True)
+    token = timer.activate()
+    try:
+        with span("parse"):
+            logs_df = parser.parse_log_files(log_paths)
+        with span("basic_stats"):
+            parser.analyze_logs_basic(logs_df)
+        with span("match"):
+            state = analyzer.match_warnings(logs_df, anomalies_df, options)
+        with span("findings"):
+            results_df = state.build_findings(options.similarity_threshold, options.new_anomaly_floor)
+        with span("report"):
+            # Как _create_excel_report в API
+            results_with_scenario = results_df.copy()
+            results_with_scenario["Сценарий"] = 1
+            report_generator.create_excel_report([{"results": results_with_scenario.to_dict("records")}], report_path)
+    finally:
+        StageTimer.deactivate(token)
+    return timer
+
+
+def summarize(timer: StageTimer, input_mb: float) -> dict:
+    stages = {}
+    for name, stage in timer.stages().items():
+        peak_mb = stage["peak_bytes"] / MB
+        stages[name] = {
+            "wall_ms": stage["wall_ms"],
+            "peak_mb": round(peak_mb, 3),
+            "net_mb": round(stage["net_bytes"] / MB, 3),
+            "peak_per_input_mb": round(peak_mb / input_mb, 4),
+        }
+    total_peak_mb = max(stages[name]["peak_mb"] for name in TOP_LEVEL_STAGES if name in stages)
+    return {
+        "peak_mb": round(total_peak_mb, 3),
+        "peak_per_input_mb": round(total_peak_mb / input_mb, 4),
+        "stages": stages,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float, min_stage_mb: float) -> list:
+    """Этапы, у которых пик на МБ входа вырос больше чем на tolerance."""
+    failures = []
+    checks = [("total", current["peak_per_input_mb"], baseline["peak_per_input_mb"], baseline["peak_mb"])]
+    for name, stage in baseline.get("stages", {}).items():
+        if name in current["stages"]:
+            checks.append((name, current["stages"][name]["peak_per_input_mb"], stage["peak_per_input_mb"],
+                           stage["peak_mb"]))
+    for name, value, expected, expected_mb in checks:
+        if expected_mb < min_stage_mb:
+            continue
+        if value > expected * (1 + tolerance):
+            failures.append(f"{name}: {value:.3f} МБ/МБ входа > {expected:.3f} (+{tolerance:.0%})")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Пик памяти этапов анализа на МБ входа")
+    # Умолчания держат отчет небольшим: openpyxl под tracemalloc в разы медленнее
+    add_spec_arguments(parser, lines=50_000, warning_share=0.1, error_share=0.002, cardinality=2000,
+                       dictionary_size=100)
+    parser.add_argument("--baseline", help="JSON с прошлым результатом для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Допустимый рост пика на МБ входа")
+    parser.add_argument("--min-stage-mb", type=float, default=1.0,
+                        help="Не сравнивать этапы с пиком в baseline меньше (МБ)")
+    parser.add_argument("--max-peak-per-mb", type=float, help="Абсолютный бюджет общего пика на МБ входа")
+    parser.add_argument("--write-baseline", help="Сохранить результат как baseline")
+    parser.add_argument("--output", help="Сохранить JSON результат в файл")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    spec = spec_from_args(args)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_paths = write_logs(spec, tmp_dir)
+        input_mb = sum(os.path.getsize(path) for path in log_paths) / MB
+        anomalies_df = build_dictionary(spec)
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            timer = run_pipeline(log_paths, anomalies_df, os.path.join(tmp_dir, "report.xlsx"))
+        finally:
+            tracemalloc.stop()
+        seconds = time.perf_counter() - started
+
+    report = {
+        "spec": spec.to_dict(),
+        "input_mb": round(input_mb, 3),
+        "seconds": round(seconds, 3),
+        **summarize(timer, input_mb),
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+    if args.write_baseline:
+        Path(args.write_baseline).write_text(text + "\n", encoding="utf-8")
+
+    failures = []
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        if baseline.get("spec") != report["spec"]:
+            print("⚠️ Параметры данных отличаются от baseline - сравнение по МБ входа приблизительное",
+                  file=sys.stderr)
+        failures.extend(compare(report, baseline, args.tolerance, args.min_stage_mb))
+    if args.max_peak_per_mb is not None and report["peak_per_input_mb"] > args.max_peak_per_mb:
+        failures.append(f"общий пик {report['peak_per_input_mb']:.3f} МБ/МБ входа > {args.max_peak_per_mb}")
+
+    for failure in failures:
+        print(f"❌ {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарки этапов анализа на детерминированных синтетических логах.
+
+Каждый этап замеряется отдельно (--repeats повторов после --warmup прогревов):
+- parse_log_files        - LogParser.parse_log_files по файлам логов;
+- analyze_logs_basic     - базовая статистика по DataFrame логов;
+- analyze_logs_with_ml   - MLLogAnalyzer.analyze_logs_with_ml (по умолчанию
+                           hashing бэкенд без модели, --encoder torch и т.д. - реальная модель);
+- create_excel_report    - ReportGenerator.create_excel_report по находкам;
+- log_visualization, timeline_visualization, anomaly_graph - графики API
+                           (anomaly_graph пропускается без networkx/pyvis; если график
+                           вернул HTML с ошибкой, этап помечается error и не замеряется).
+
+Данные задаются параметрами генератора (benchmarks/synthetic.py): строки,
+файлы, доли уровней, число различных сообщений, размер словаря. Результат -
+JSON с min/median/mean/stdev секунд и пропускной способностью этапа, а также
+окружением (версии, CPU, коммит) для отслеживания трендов. С --baseline код 1,
+если медиана этапа выросла больше чем в --max-slowdown раз.
+
+Пример:
+    python benchmarks/pipeline.py --lines 200000 --repeats 5 --output pipeline.json
+"""
+
+import argparse
+import gc
+import importlib.util
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from benchmarks.synthetic import add_spec_arguments, build_dictionary, spec_from_args, write_logs
+from core.services.encoders import ENCODER_BACKENDS, HashingEncoder
+from core.services.log_parser import LogParser
+from core.services.ml_analyzer import AnalysisOptions, MLLogAnalyzer
+from core.services.report_generator import ReportGenerator
+
+BENCHMARKS = (
+    "parse_log_files",
+    "analyze_logs_basic",
+    "analyze_logs_with_ml",
+    "create_excel_report",
+    "log_visualization",
+    "timeline_visualization",
+    "anomaly_graph",
+)
+CHART_BENCHMARKS = ("log_visualization", "timeline_visualization", "anomaly_graph")
+# Графики API при ошибке возвращают HTML с текстом ошибки вместо исключения
+CHART_ERROR_MARKER = "Ошибка"
+
+
+def measure(function: Callable[[], object], repeats: int, warmup: int) -> Dict:
+    """Время вызовов function: прогревы не учитываются, перед каждым замером - gc."""
+    for _ in range(warmup):
+        function()
+    timings = []
+    for _ in range(repeats):
+        gc.collect()
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return {
+        "repeats": repeats,
+        "min_seconds": min(timings),
+        "median_seconds": statistics.median(timings),
+        "mean_seconds": statistics.fmean(timings),
+        "stdev_seconds": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+    }
+
+
+def _chart_builders():
+    """Графики живут в api.main: импортируем его без фоновой загрузки модели и без общего индекса."""
+    os.environ.setdefault("API_PRELOAD_MODEL", "false")
+    os.environ.setdefault("API_ARTIFACT_DB_PATH", os.path.join(tempfile.mkdtemp(), "artifacts.db"))
+    import api.main as api_main
+    return api_main
+
+
+def environment() -> Dict:
+    """Окружение прогона для сравнения результатов между машинами и коммитами."""
+    import numpy
+    import pandas
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "pandas": pandas.__version__,
+        "commit": commit,
+    }
+
+
+def compare(results: Dict, baseline: Dict, max_slowdown: float) -> List[str]:
+    """Этапы, медиана которых выросла больше чем в max_slowdown раз."""
+    failures = []
+    for name, result in results.items():
+        expected = baseline.get("benchmarks", {}).get(name, {}).get("median_seconds")
+        if expected and "median_seconds" in result and result["median_seconds"] > expected * max_slowdown:
+            failures.append(
+                f"{name}: {result['median_seconds']:.3f} сек > {expected:.3f} сек x{max_slowdown}"
+            )
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Микробенчмарки парсера, сопоставления, отчета и графиков")
+    # Как в memory_profile.py: находок ~2% строк, чтобы Excel не занимал весь прогон
+    add_spec_arguments(parser, warning_share=0.1, error_share=0.002, cardinality=2000, dictionary_size=100)
+    parser.add_argument("--benchmarks", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--encoder", default=HashingEncoder.name, choices=list(ENCODER_BACKENDS),
+                        help="Бэкенд кодирования для analyze_logs_with_ml (hashing - без модели)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения медиан")
+    parser.add_argument("--max-slowdown", type=float, default=1.5, help="Допустимое замедление медианы (раз)")
+    parser.add_argument("--output", help="Сохранить JSON результат в файл")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    spec = spec_from_args(args)
+    repeats = max(1, args.repeats)
+    warmup = max(0, args.warmup)
+    results: Dict[str, Dict] = {}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_paths = write_logs(spec, tmp_dir)
+        input_bytes = sum(os.path.getsize(path) for path in log_paths)
+        anomalies_df = build_dictionary(spec)
+
+        log_parser = LogParser()
+        analyzer = MLLogAnalyzer(encoder_backend=args.encoder)
+        report_generator = ReportGenerator()
+        options = AnalysisOptions()
+
+        # Входы этапов считаются один раз (вне замеров)
+        logs_df = log_parser.parse_log_files(log_paths)
+        results_df = analyzer.analyze_logs_with_ml(logs_df, anomalies_df, options)
+        report_rows = results_df.assign(**{"Сценарий": 1}).to_dict("records")
+        report_path = os.path.join(tmp_dir, "report.xlsx")
+        dataset = {
+            "input_mb": round(input_bytes / 2 ** 20, 3),
+            "log_rows": len(logs_df),
+            "warnings": int((logs_df["level"] == "WARNING").sum()) if not logs_df.empty else 0,
+            "findings": len(results_df),
+        }
+
+        api_main = _chart_builders() if set(args.benchmarks) & set(CHART_BENCHMARKS) else None
+        cases: Dict[str, tuple] = {
+            "parse_log_files": (lambda: log_parser.parse_log_files(log_paths), spec.lines, "lines"),
+            "analyze_logs_basic": (lambda: log_parser.analyze_logs_basic(logs_df), len(logs_df), "rows"),
+            "analyze_logs_with_ml": (
+                lambda: analyzer.analyze_logs_with_ml(logs_df, anomalies_df, options), dataset["warnings"], "warnings"
+            ),
+            "create_excel_report": (
+                lambda: report_generator.create_excel_report([{"results": report_rows}], report_path),
+                len(report_rows), "findings",
+            ),
+        }
+        if api_main is not None:
+            cases.update({
+                "log_visualization": (lambda: api_main.generate_log_visualization(logs_df), len(logs_df), "rows"),
+                "timeline_visualization": (
+                    lambda: api_main.generate_timeline_visualization_from_df(logs_df), len(logs_df), "rows"
+                ),
+                "anomaly_graph": (
+                    lambda: api_main.generate_anomaly_graph(results_df, anomalies_df), len(results_df), "findings"
+                ),
+            })
+
+        for name in args.benchmarks:
+            if name == "anomaly_graph" and not all(
+                importlib.util.find_spec(module) for module in ("networkx", "pyvis")
+            ):
+                results[name] = {"skipped": "networkx или pyvis не установлены"}
+                continue
+            function, items, unit = cases[name]
+            if name in CHART_BENCHMARKS:
+                html = function()
+                if html is None or CHART_ERROR_MARKER in html[:500]:
+                    results[name] = {"error": html}
+                    print(f"❌ {name}: график не построен", file=sys.stderr)
+                    continue
+            result = measure(function, repeats, warmup)
+            result["items"] = items
+            result["unit"] = unit
+            result[f"{unit}_per_second"] = items / result["median_seconds"] if result["median_seconds"] else None
+            results[name] = result
+            print(f"{name}: {result['median_seconds']:.3f} сек (медиана)", file=sys.stderr)
+
+    report = {
+        "spec": spec.to_dict(),
+        "encoder": args.encoder,
+        "dataset": dataset,
+        "environment": environment(),
+        "benchmarks": results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+
+    failures: List[str] = []
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        failures = compare(results, baseline, args.max_slowdown)
+    for failure in failures:
+        print(f"❌ {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
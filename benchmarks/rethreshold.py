@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк повторного применения порога к сохраненному анализу.
+
+Строит синтетический MatchState (WARNING строки с top-k совпадениями,
+словарь аномалий, ERROR строки), сохраняет его на диск и замеряет:
+- загрузку состояния с диска;
+- MatchState.build_findings для нескольких порогов.
+
+Скрипт возвращает код 1, если пересборка для одного порога дольше --max-seconds.
+
+Пример:
+    python benchmarks/rethreshold.py --warnings 1000000 --max-seconds 1.0
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from core.services.findings import MatchState
+from core.services.ml_analyzer import AnalysisOptions
+
+
+def build_state(warnings: int, errors: int, dictionary_size: int, top_k: int, seed: int) -> MatchState:
+    """Синтетический анализ: случайные score и ERROR строки с текстами проблем словаря."""
+    rng = np.random.default_rng(seed)
+    problems = [f"Problem {i % (dictionary_size // 2 or 1)}" for i in range(dictionary_size)]
+    anomalies_df = pd.DataFrame({
+        "ID аномалии": np.arange(1, dictionary_size + 1),
+        "ID проблемы": np.arange(dictionary_size) % 50 + 1,
+        "Аномалия": [f"Anomaly {i % (dictionary_size - dictionary_size // 10 or 1)}" for i in range(dictionary_size)],
+        "Проблема": problems,
+    })
+
+    total = warnings + errors
+    levels = np.array(["WARNING"] * warnings + ["ERROR"] * errors, dtype=object)
+    rng.shuffle(levels)
+    texts = np.where(levels == "ERROR", np.array(problems, dtype=object)[rng.integers(0, dictionary_size, total)], "warning")
+    logs_df = pd.DataFrame({
+        "datetime": "2025-10-02T13:00:00",
+        "level": levels,
+        "source": "hardware",
+        "text": texts,
+        "full_line": "2025-10-02T13:00:00 " + levels + " hardware: " + texts,
+        "filename": "synthetic.log",
+        "line_number": np.arange(1, total + 1),
+    })
+
+    top_scores = np.sort(rng.random((warnings, top_k), dtype=np.float32), axis=1)[:, ::-1]
+    top_indices = rng.integers(0, dictionary_size, (warnings, top_k)).astype(np.int32)
+    return MatchState.from_frames(top_indices, np.ascontiguousarray(top_scores), logs_df, anomalies_df,
+                                  AnalysisOptions(top_k=top_k))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк пересборки находок для нового порога")
+    parser.add_argument("--warnings", type=int, default=1_000_000, help="Число WARNING строк")
+    parser.add_argument("--errors", type=int, default=2_000, help="Число ERROR строк")
+    parser.add_argument("--dictionary-size", type=int, default=1_000, help="Размер словаря аномалий")
+    parser.add_argument("--top-k", type=int, default=1)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.7, 0.9, 0.99])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-seconds", type=float, default=1.0,
+                        help="Бюджет на пересборку для одного порога")
+    parser.add_argument("--output", help="Сохранить JSON результат в файл")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    state = build_state(args.warnings, args.errors, args.dictionary_size, args.top_k, args.seed)
+    build_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "analysis.pkl")
+        start = time.perf_counter()
+        state.save(path)
+        save_seconds = time.perf_counter() - start
+        state_bytes = os.path.getsize(path)
+        start = time.perf_counter()
+        state = MatchState.load(path)
+        load_seconds = time.perf_counter() - start
+
+    runs = []
+    failures = []
+    for threshold in args.thresholds:
+        start = time.perf_counter()
+        results_df = state.build_findings(threshold, new_anomaly_floor=0.5)
+        seconds = time.perf_counter() - start
+        runs.append({"threshold": threshold, "seconds": seconds, "findings": len(results_df)})
+        if seconds > args.max_seconds:
+            failures.append(f"порог {threshold}: {seconds:.2f} сек > {args.max_seconds} сек")
+
+    report = {
+        "warnings": args.warnings,
+        "errors": args.errors,
+        "dictionary_size": args.dictionary_size,
+        "top_k": args.top_k,
+        "state_build_seconds": build_seconds,
+        "state_save_seconds": save_seconds,
+        "state_load_seconds": load_seconds,
+        "state_bytes": state_bytes,
+        "rethreshold": runs,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+
+    for failure in failures:
+        print(f"❌ {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+Детерминированный генератор синтетических логов и словаря аномалий для бенчмарков.
+
+Один и тот же SyntheticSpec (включая seed) всегда дает одинаковые файлы.
+Управляемые параметры:
+- lines / files - число строк (всего) и файлов;
+- warning_share / error_share - доли WARNING и ERROR строк (остальное INFO);
+- cardinality - число различных WARNING сообщений (без учета числовых параметров);
+- dictionary_size - размер словаря аномалий (первые сообщения пула WARNING,
+  поэтому часть WARNING строк совпадает со словарем, остальные - новые).
+
+Формат строк - как у тест-кейсов: "2025-10-02T13:18:00 WARNING hardware: ...".
+"""
+
+import argparse
+import os
+import random
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+
+import pandas as pd
+
+SOURCES = ("hardware", "network", "storage", "kernel", "app")
+_VOCABULARY_SIZE = 400
+_START = datetime(2025, 10, 2, 13, 0, 0)
+
+
+@dataclass(frozen=True)
+class SyntheticSpec:
+    """Параметры синтетического набора логов."""
+
+    lines: int = 100_000
+    files: int = 1
+    warning_share: float = 0.2
+    error_share: float = 0.02
+    cardinality: int = 500
+    dictionary_size: int = 200
+    seed: int = 42
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def _vocabulary(rng: random.Random) -> List[str]:
+    """Псевдослова из букв (без цифр - маскирование чисел их не склеивает)."""
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < _VOCABULARY_SIZE:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(3, 9))))
+    return sorted(words)
+
+
+def message_pool(spec: SyntheticSpec) -> List[str]:
+    """WARNING сообщения: cardinality + dictionary_size различных текстов.
+
+    Первые dictionary_size сообщений - аномалии словаря, WARNING строки
+    берутся из первых cardinality.
+    """
+    rng = random.Random(spec.seed)
+    vocabulary = _vocabulary(rng)
+    pool: List[str] = []
+    seen = set()
+    while len(pool) < max(spec.cardinality, spec.dictionary_size):
+        message = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(4, 8)))
+        if message not in seen:
+            seen.add(message)
+            pool.append(message)
+    return pool
+
+
+def problem_texts(spec: SyntheticSpec) -> List[str]:
+    """Тексты проблем (ERROR строки), на одну проблему - несколько аномалий."""
+    return [f"Problem {chr(ord('A') + index % 26)}{'x' * (index // 26)} detected"
+            for index in range(max(1, spec.dictionary_size // 4))]
+
+
+def build_dictionary(spec: SyntheticSpec) -> pd.DataFrame:
+    """Словарь аномалий в формате anomalies_problems.csv."""
+    pool = message_pool(spec)
+    problems = problem_texts(spec)
+    return pd.DataFrame({
+        "ID аномалии": range(1, spec.dictionary_size + 1),
+        "ID проблемы": [index % len(problems) + 1 for index in range(spec.dictionary_size)],
+        "Аномалия": pool[:spec.dictionary_size],
+        "Проблема": [problems[index % len(problems)] for index in range(spec.dictionary_size)],
+    })
+
+
+def generate_lines(spec: SyntheticSpec, file_index: int = 0) -> Iterator[str]:
+    """Строки одного файла (файл file_index из spec.files)."""
+    rng = random.Random(spec.seed * 1_000_003 + file_index)
+    pool = message_pool(spec)[:spec.cardinality]
+    problems = problem_texts(spec)
+    count = spec.lines // spec.files + (1 if file_index < spec.lines % spec.files else 0)
+    warning_bound = spec.warning_share
+    error_bound = spec.warning_share + spec.error_share
+    for offset in range(count):
+        timestamp = (_START + timedelta(seconds=offset)).strftime("%Y-%m-%dT%H:%M:%S")
+        source = SOURCES[rng.randrange(len(SOURCES))]
+        roll = rng.random()
+        if roll < warning_bound:
+            text = f"{pool[rng.randrange(len(pool))]} value {rng.randrange(10_000)}"
+            level = "WARNING"
+        elif roll < error_bound:
+            text = problems[rng.randrange(len(problems))]
+            level = "ERROR"
+        else:
+            text = f"heartbeat ok latency {rng.randrange(1_000)} ms"
+            level = "INFO"
+        yield f"{timestamp} {level} {source}: {text}"
+
+
+def write_logs(spec: SyntheticSpec, directory: str) -> List[str]:
+    """Записывает spec.files файлов логов в directory.
+
+    Returns:
+        Пути к файлам
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for file_index in range(spec.files):
+        path = os.path.join(directory, f"synthetic_{file_index + 1}.log")
+        with open(path, "w", encoding="utf-8") as f:
+            for line in generate_lines(spec, file_index):
+                f.write(line)
+                f.write("\n")
+        paths.append(path)
+    return paths
+
+
+def write_dictionary(spec: SyntheticSpec, path: str) -> str:
+    """Записывает словарь аномалий как anomalies_problems.csv (разделитель ;)."""
+    build_dictionary(spec).to_csv(path, sep=";", index=False, encoding="utf-8")
+    return path
+
+
+def add_spec_arguments(parser: argparse.ArgumentParser, **defaults) -> None:
+    """Аргументы командной строки для SyntheticSpec (defaults переопределяют умолчания)."""
+    spec = SyntheticSpec(**defaults)
+    parser.add_argument("--lines", type=int, default=spec.lines, help="Строк логов всего")
+    parser.add_argument("--files", type=int, default=spec.files, help="Число файлов логов")
+    parser.add_argument("--warning-share", type=float, default=spec.warning_share, help="Доля WARNING строк")
+    parser.add_argument("--error-share", type=float, default=spec.error_share, help="Доля ERROR строк")
+    parser.add_argument("--cardinality", type=int, default=spec.cardinality,
+                        help="Различных WARNING сообщений (без числовых параметров)")
+    parser.add_argument("--dictionary-size", type=int, default=spec.dictionary_size, help="Размер словаря аномалий")
+    parser.add_argument("--seed", type=int, default=spec.seed)
+
+
+def spec_from_args(args: argparse.Namespace) -> SyntheticSpec:
+    return SyntheticSpec(
+        lines=args.lines,
+        files=max(1, args.files),
+        warning_share=args.warning_share,
+        error_share=args.error_share,
+        cardinality=max(1, args.cardinality),
+        dictionary_size=max(1, args.dictionary_size),
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    import json
+
+    cli = argparse.ArgumentParser(description="Генерация синтетических логов и словаря аномалий")
+    add_spec_arguments(cli)
+    cli.add_argument("--output-dir", required=True, help="Куда записать логи и anomalies_problems.csv")
+    cli_args = cli.parse_args()
+    cli_spec = spec_from_args(cli_args)
+    log_paths = write_logs(cli_spec, cli_args.output_dir)
+    dictionary_path = write_dictionary(cli_spec, os.path.join(cli_args.output_dir, "anomalies_problems.csv"))
+    print(json.dumps({"spec": cli_spec.to_dict(), "logs": log_paths, "dictionary": dictionary_path},
+                     indent=2, ensure_ascii=False))
@@ -1,8 +1,13 @@
 """Сервисы для анализа логов."""
 
-from .ml_analyzer import MLLogAnalyzer
+from .ml_analyzer import AnalysisOptions, MLLogAnalyzer
 from .log_parser import LogParser
 from .report_generator import ReportGenerator
+from .encoders import EncoderBackend, create_encoder
+from .findings import FindingsStream, MatchState
+from .template_miner import TemplateMiner
+from .text_normalizer import TextNormalizer
+from .log_tailer import LogTailer
 
-__all__ = ['MLLogAnalyzer', 'LogParser', 'ReportGenerator']
+__all__ = ['AnalysisOptions', 'MLLogAnalyzer', 'LogParser', 'ReportGenerator', 'EncoderBackend', 'create_encoder', 'MatchState', 'FindingsStream', 'TemplateMiner', 'TextNormalizer', 'LogTailer']
 
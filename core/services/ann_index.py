@@ -0,0 +1,221 @@
+"""Приближенный поиск ближайших аномалий (IVF индекс на NumPy).
+
+Для больших словарей (десятки тысяч аномалий) точное сравнение каждой
+WARNING строки со всем словарем становится узким местом. IVF индекс
+разбивает нормализованные эмбеддинги словаря на n_lists кластеров
+(сферический k-means) и при поиске сравнивает запрос только с
+аномалиями из n_probe ближайших кластеров.
+
+Ручки точности/скорости:
+    n_lists - число кластеров (0 - автоматически, ~sqrt(размер словаря));
+    n_probe - сколько кластеров просматривать (больше - точнее и медленнее).
+"""
+
+import logging
+import os
+import tempfile
+from typing import Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Сколько векторов на кластер использовать для обучения k-means
+TRAIN_POINTS_PER_LIST = 256
+# Сколько запросов обрабатывать за один проход по кластерам
+SEARCH_CHUNK_SIZE = 4096
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = SEARCH_CHUNK_SIZE) -> np.ndarray:
+    """Номер ближайшего центроида для каждого вектора."""
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        assignments[start:start + chunk_size] = (vectors[start:start + chunk_size] @ centroids.T).argmax(axis=1)
+    return assignments
+
+
+def _merge_top_k(indices: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Оставляет k лучших кандидатов в каждой строке (при равенстве - меньший индекс)."""
+    # Пустые слоты (-1) сортируются в конец за счет score = -inf
+    order = np.lexsort((np.where(indices < 0, np.iinfo(np.int32).max, indices), -scores), axis=1)[:, :k]
+    return np.take_along_axis(indices, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+class IVFIndex:
+    """Inverted file индекс по нормализованным эмбеддингам (косинусное сходство)."""
+
+    def __init__(self, centroids: np.ndarray, list_ptr: np.ndarray, list_ids: np.ndarray,
+                 embeddings: np.ndarray, n_probe: int = 8):
+        """Инициализация (обычно через build или load).
+
+        Args:
+            centroids: Нормализованные центроиды кластеров (n_lists, dim)
+            list_ptr: Границы кластеров в list_ids (n_lists + 1)
+            list_ids: Индексы строк словаря, упорядоченные по кластерам
+            embeddings: Эмбеддинги словаря (size, dim)
+            n_probe: Сколько кластеров просматривать по умолчанию
+        """
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.list_ptr = np.asarray(list_ptr, dtype=np.int64)
+        self.list_ids = np.asarray(list_ids, dtype=np.int64)
+        # Векторы в порядке кластеров - каждый кластер лежит в памяти подряд
+        self.list_vectors = np.ascontiguousarray(embeddings[self.list_ids], dtype=np.float32)
+        self.size = len(embeddings)
+        self.n_probe = n_probe
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, n_lists: int = 0, n_probe: int = 8,
+              iterations: int = 10, seed: int = 0) -> "IVFIndex":
+        """Строит индекс сферическим k-means по эмбеддингам словаря.
+
+        Args:
+            embeddings: Нормализованные эмбеддинги словаря (size, dim)
+            n_lists: Число кластеров (0 - ~sqrt(size))
+            n_probe: Сколько кластеров просматривать при поиске
+            iterations: Итераций k-means
+            seed: Seed генератора (индекс воспроизводим)
+
+        Returns:
+            IVFIndex
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        size = len(embeddings)
+        if n_lists <= 0:
+            n_lists = int(round(np.sqrt(size)))
+        n_lists = max(1, min(n_lists, size))
+        rng = np.random.default_rng(seed)
+
+        train = embeddings
+        if size > n_lists * TRAIN_POINTS_PER_LIST:
+            train = embeddings[rng.choice(size, n_lists * TRAIN_POINTS_PER_LIST, replace=False)]
+
+        centroids = train[rng.choice(len(train), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = _assign(train, centroids)
+            order = np.argsort(assignments, kind="stable")
+            counts = np.bincount(assignments, minlength=n_lists)
+            nonempty = np.nonzero(counts)[0]
+            starts = (np.cumsum(counts) - counts)[nonempty]
+            centroids[nonempty] = np.add.reduceat(train[order], starts, axis=0)
+            # Пустые кластеры переинициализируем случайными точками
+            empty = np.nonzero(counts == 0)[0]
+            if len(empty):
+                centroids[empty] = train[rng.choice(len(train), len(empty), replace=False)]
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            centroids /= np.where(norms > 0, norms, 1.0)
+
+        assignments = _assign(embeddings, centroids)
+        list_ids = np.argsort(assignments, kind="stable")
+        list_ptr = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))])
+        return cls(centroids, list_ptr, list_ids, embeddings, n_probe=n_probe)
+
+    def search(self, queries: np.ndarray, top_k: int = 1,
+               n_probe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Ищет top_k ближайших строк словаря для каждого запроса.
+
+        Args:
+            queries: Нормализованные эмбеддинги запросов (n, dim)
+            top_k: Сколько соседей вернуть
+            n_probe: Сколько кластеров просматривать (None - значение индекса)
+
+        Returns:
+            (индексы, score) формы (n, k), по убыванию score
+        """
+        n = len(queries)
+        k = min(top_k, self.size)
+        n_probe = max(1, min(n_probe or self.n_probe, self.n_lists))
+        indices = np.full((n, k), -1, dtype=np.int64)
+        scores = np.full((n, k), -np.inf, dtype=np.float32)
+        if n == 0 or k == 0:
+            return indices.astype(np.int32), scores
+
+        for start in range(0, n, SEARCH_CHUNK_SIZE):
+            end = min(start + SEARCH_CHUNK_SIZE, n)
+            self._search_chunk(queries[start:end], indices[start:end], scores[start:end], k, n_probe)
+
+        # Если в просмотренных кластерах оказалось меньше k строк - добираем точным поиском
+        missing = np.nonzero(indices[:, -1] < 0)[0]
+        if len(missing):
+            similarity = queries[missing] @ self.list_vectors.T
+            order = np.lexsort((np.broadcast_to(self.list_ids, similarity.shape), -similarity), axis=1)[:, :k]
+            indices[missing] = self.list_ids[order]
+            scores[missing] = np.take_along_axis(similarity, order, axis=1)
+        return indices.astype(np.int32), scores
+
+    def _search_chunk(self, queries: np.ndarray, indices: np.ndarray, scores: np.ndarray,
+                      k: int, n_probe: int) -> None:
+        """Поиск для куска запросов: проход по кластерам, каждый - одним умножением матриц."""
+        centroid_scores = queries @ self.centroids.T
+        if n_probe < self.n_lists:
+            probes = np.argpartition(-centroid_scores, n_probe - 1, axis=1)[:, :n_probe]
+        else:
+            probes = np.broadcast_to(np.arange(self.n_lists), centroid_scores.shape)
+
+        # Группируем пары (запрос, кластер) по кластеру
+        query_ids = np.repeat(np.arange(len(queries)), probes.shape[1])
+        lists = probes.ravel()
+        order = np.argsort(lists, kind="stable")
+        query_ids, lists = query_ids[order], lists[order]
+        bounds = np.flatnonzero(np.diff(lists)) + 1
+        for group in np.split(np.arange(len(lists)), bounds):
+            if not len(group):
+                continue
+            list_no = lists[group[0]]
+            lo, hi = self.list_ptr[list_no], self.list_ptr[list_no + 1]
+            if lo == hi:
+                continue
+            rows = query_ids[group]
+            similarity = queries[rows] @ self.list_vectors[lo:hi].T
+            if k == 1:
+                # Строки словаря внутри кластера упорядочены - argmax берет меньший индекс
+                best = similarity.argmax(axis=1)
+                candidate_scores = similarity[np.arange(len(rows)), best]
+                candidate_ids = self.list_ids[lo + best]
+                current_scores, current_ids = scores[rows, 0], indices[rows, 0]
+                better = (candidate_scores > current_scores) | (
+                    (candidate_scores == current_scores) & (candidate_ids < current_ids)
+                )
+                scores[rows[better], 0] = candidate_scores[better]
+                indices[rows[better], 0] = candidate_ids[better]
+                continue
+
+            # Кластеры небольшие (~sqrt словаря) - полная стабильная сортировка дешева
+            # и при равных score оставляет меньшие индексы, как точный поиск
+            local = np.argsort(-similarity, axis=1, kind="stable")[:, :min(k, hi - lo)]
+            merged_ids, merged_scores = _merge_top_k(
+                np.concatenate([indices[rows], self.list_ids[lo + local]], axis=1),
+                np.concatenate([scores[rows], np.take_along_axis(similarity, local, axis=1)], axis=1),
+                k,
+            )
+            indices[rows], scores[rows] = merged_ids, merged_scores
+
+    def save(self, path: str) -> None:
+        """Атомарно сохраняет структуру индекса (без векторов - они в кэше эмбеддингов)."""
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".npz")
+        os.close(fd)
+        try:
+            np.savez(tmp_path, centroids=self.centroids, list_ptr=self.list_ptr,
+                     list_ids=self.list_ids, size=np.int64(self.size))
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str, embeddings: np.ndarray, n_probe: int = 8) -> "IVFIndex":
+        """Загружает индекс, сохраненный save(), для тех же эмбеддингов словаря.
+
+        Raises:
+            ValueError: Если индекс построен для словаря другого размера
+        """
+        with np.load(path) as data:
+            if int(data["size"]) != len(embeddings):
+                raise ValueError(f"Индекс {path} построен для другого словаря")
+            return cls(data["centroids"], data["list_ptr"], data["list_ids"], embeddings, n_probe=n_probe)
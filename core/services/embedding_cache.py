@@ -0,0 +1,98 @@
+"""LRU кэш эмбеддингов текстов между анализами.
+
+Ключ - (модель, текст для кодирования). С маскированием параметров
+(TextNormalizer) или шаблонами сообщений повторяющиеся WARNING разных
+загрузок сводятся к небольшому набору ключей, и модель для них больше
+не вызывается.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """Потокобезопасный LRU кэш векторов по (модель, ключ)."""
+
+    def __init__(self, max_entries: int = 20000):
+        """Инициализация.
+
+        Args:
+            max_entries: Максимум векторов в кэше
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Статистика для мониторинга
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def encode(self, model_name: str, keys: List[str],
+               encode: Callable[[List[str]], np.ndarray]) -> Tuple[np.ndarray, int]:
+        """Возвращает эмбеддинги ключей, кодируя только отсутствующие в кэше.
+
+        Args:
+            model_name: Модель кодирования (часть ключа кэша)
+            keys: Уникальные тексты для кодирования
+            encode: Функция кодирования списка текстов
+
+        Returns:
+            (матрица эмбеддингов в порядке keys, число попаданий в кэш)
+        """
+        cached: List[Tuple[int, np.ndarray]] = []
+        missing: List[int] = []
+        with self._lock:
+            for position, key in enumerate(keys):
+                vector = self._entries.get((model_name, key))
+                if vector is None:
+                    missing.append(position)
+                else:
+                    self._entries.move_to_end((model_name, key))
+                    cached.append((position, vector))
+            hits = len(cached)
+            self.hits += hits
+            self.misses += len(missing)
+
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32), 0
+
+        encoded = None
+        if missing:
+            # Кодируем вне блокировки - параллельные анализы не ждут друг друга
+            encoded = encode([keys[position] for position in missing])
+        dimension = encoded.shape[1] if encoded is not None else cached[0][1].shape[0]
+
+        # Результат заполняется по индексам: без списка копий строк и vstack,
+        # которые на больших загрузках в разы увеличивали пик памяти
+        if not cached:
+            # Промахи по всем ключам - матрица кодировщика уже в порядке keys
+            out = np.asarray(encoded, dtype=np.float32)
+        else:
+            out = np.empty((len(keys), dimension), dtype=np.float32)
+            for position, vector in cached:
+                out[position] = vector
+            if encoded is not None:
+                out[missing] = encoded
+        if encoded is not None:
+            # В кэш попадут не больше max_entries последних промахов - остальные
+            # все равно были бы вытеснены
+            stored = missing[-self.max_entries:] if self.max_entries > 0 else []
+            with self._lock:
+                for position in stored:
+                    key = (model_name, keys[position])
+                    # Копия строки - кэш не должен держать живой всю матрицу
+                    self._entries[key] = out[position].copy()
+                    self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        return out, hits
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
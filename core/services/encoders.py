@@ -0,0 +1,275 @@
+"""Бэкенды кодирования текстов в эмбеддинги для MLLogAnalyzer.
+
+Все бэкенды возвращают L2-нормализованные эмбеддинги float32 (numpy),
+поэтому косинусное сходство считается простым скалярным произведением.
+
+Доступные бэкенды:
+- torch       - SentenceTransformer в fp32 (исходное поведение)
+- torch-int8  - та же модель с динамической int8 квантизацией Linear слоев
+- onnx        - экспорт трансформера в ONNX и инференс через ONNX Runtime
+- onnx-int8   - ONNX модель с динамической int8 квантизацией весов
+- hashing     - хеширование слов в вектор без модели (бенчмарки и нагрузочные
+                тесты: не требует сети и torch, сходство - по общим словам)
+
+ONNX модели экспортируются один раз и кэшируются на диске.
+"""
+
+import logging
+import os
+import re
+import zlib
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+DEFAULT_ONNX_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "atomichack", "onnx")
+
+# Максимальная длина последовательности all-MiniLM-L6-v2 в sentence-transformers
+DEFAULT_MAX_SEQ_LENGTH = 256
+
+# Размерность эмбеддингов hashing бэкенда (как у all-MiniLM-L6-v2)
+HASHING_DIMENSION = 384
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class EncoderBackend:
+    """Базовый интерфейс бэкенда кодирования."""
+
+    name = "base"
+
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME):
+        self.model_name = model_name
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """Кодирует тексты в нормализованные эмбеддинги.
+
+        Args:
+            texts: Список текстов
+            batch_size: Размер батча инференса
+
+        Returns:
+            Массив (len(texts), dim) float32 с L2-нормой 1
+        """
+        raise NotImplementedError
+
+    def warm_up(self):
+        """Пробный encode для инициализации сессии/аллокаторов."""
+        self.encode(["warm-up"])
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    """L2-нормализация строк матрицы."""
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return (embeddings / np.clip(norms, 1e-12, None)).astype(np.float32, copy=False)
+
+
+class TorchEncoder(EncoderBackend):
+    """SentenceTransformer на PyTorch (fp32)."""
+
+    name = "torch"
+
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME):
+        super().__init__(model_name)
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        if len(texts) == 0:
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        embeddings = self.model.encode(
+            texts,
+            batch_size=batch_size,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+        )
+        return embeddings.astype(np.float32, copy=False)
+
+
+class TorchInt8Encoder(TorchEncoder):
+    """SentenceTransformer с динамической int8 квантизацией Linear слоев (только CPU)."""
+
+    name = "torch-int8"
+
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME):
+        super().__init__(model_name)
+        import torch
+        self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxEncoder(EncoderBackend):
+    """Трансформер в ONNX Runtime с mean pooling (как в sentence-transformers)."""
+
+    name = "onnx"
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL_NAME,
+        cache_dir: Optional[str] = None,
+        quantize: bool = False,
+        max_seq_length: int = DEFAULT_MAX_SEQ_LENGTH,
+        num_threads: Optional[int] = None,
+    ):
+        super().__init__(model_name)
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.max_seq_length = max_seq_length
+        self.cache_dir = os.path.join(cache_dir or DEFAULT_ONNX_CACHE_DIR, model_name.replace("/", "__"))
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        model_path = self._export_model()
+        if quantize:
+            model_path = self._quantize_model(model_path)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(self._hf_model_name())
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {node.name for node in self.session.get_inputs()}
+        logger.info(f"ONNX модель загружена: {model_path}")
+
+    def _hf_model_name(self) -> str:
+        """Имя модели в HuggingFace Hub (у sentence-transformers свой namespace)."""
+        if "/" in self.model_name:
+            return self.model_name
+        return f"sentence-transformers/{self.model_name}"
+
+    def _export_model(self) -> str:
+        """Экспортирует трансформер в ONNX (один раз, результат кэшируется)."""
+        model_path = os.path.join(self.cache_dir, "model.onnx")
+        if os.path.exists(model_path):
+            return model_path
+
+        logger.info(f"Экспорт {self.model_name} в ONNX: {model_path}")
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(self._hf_model_name())
+        model = AutoModel.from_pretrained(self._hf_model_name())
+        model.eval()
+
+        sample = tokenizer(["warm-up"], return_tensors="pt")
+        input_names = ["input_ids", "attention_mask", "token_type_ids"]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+        tmp_path = model_path + ".tmp"
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+                tmp_path,
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14,
+            )
+        os.replace(tmp_path, model_path)
+        return model_path
+
+    def _quantize_model(self, model_path: str) -> str:
+        """Динамическая int8 квантизация весов ONNX модели (кэшируется)."""
+        quantized_path = os.path.join(self.cache_dir, "model.int8.onnx")
+        if os.path.exists(quantized_path):
+            return quantized_path
+
+        logger.info(f"Квантизация ONNX модели в int8: {quantized_path}")
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        tmp_path = quantized_path + ".tmp"
+        quantize_dynamic(model_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, quantized_path)
+        return quantized_path
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            tokens = self.tokenizer(
+                batch,
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            feed = {name: tokens[name].astype(np.int64) for name in self._input_names if name in tokens}
+            if "token_type_ids" in self._input_names and "token_type_ids" not in feed:
+                feed["token_type_ids"] = np.zeros_like(feed["input_ids"])
+            hidden = self.session.run(["last_hidden_state"], feed)[0]
+
+            # Mean pooling по токенам с учетом маски (как Pooling слой sentence-transformers)
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            batches.append(_normalize(pooled))
+
+        if not batches:
+            dim = self.session.get_outputs()[0].shape[-1]
+            return np.zeros((0, dim if isinstance(dim, int) else 0), dtype=np.float32)
+        return np.vstack(batches)
+
+
+class OnnxInt8Encoder(OnnxEncoder):
+    """ONNX модель с динамической int8 квантизацией."""
+
+    name = "onnx-int8"
+
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME, **kwargs):
+        kwargs["quantize"] = True
+        super().__init__(model_name, **kwargs)
+
+
+class HashingEncoder(EncoderBackend):
+    """Мешок слов, хешированный в вектор фиксированной длины (без модели).
+
+    Детерминирован и не требует torch/сети: для бенчмарков и нагрузочных
+    тестов, где важна скорость обслуживания, а не качество сопоставления.
+    """
+
+    name = "hashing"
+
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME, dimension: int = HASHING_DIMENSION):
+        super().__init__(model_name)
+        self.dimension = dimension
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        rows: List[int] = []
+        columns: List[int] = []
+        for row, text in enumerate(texts):
+            for token in _TOKEN_PATTERN.findall(str(text).lower()):
+                rows.append(row)
+                columns.append(zlib.crc32(token.encode("utf-8")) % self.dimension)
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        np.add.at(embeddings, (np.asarray(rows, dtype=np.int64), np.asarray(columns, dtype=np.int64)), 1.0)
+        return _normalize(embeddings)
+
+
+ENCODER_BACKENDS = {
+    TorchEncoder.name: TorchEncoder,
+    TorchInt8Encoder.name: TorchInt8Encoder,
+    OnnxEncoder.name: OnnxEncoder,
+    OnnxInt8Encoder.name: OnnxInt8Encoder,
+    HashingEncoder.name: HashingEncoder,
+}
+
+
+def create_encoder(backend: str = "torch", model_name: str = DEFAULT_MODEL_NAME, **kwargs) -> EncoderBackend:
+    """Создает бэкенд кодирования по имени.
+
+    Args:
+        backend: Имя бэкенда (torch, torch-int8, onnx, onnx-int8, hashing - без модели)
+        model_name: Имя модели sentence-transformers
+        **kwargs: Дополнительные параметры бэкенда (например, cache_dir для ONNX)
+
+    Returns:
+        Экземпляр EncoderBackend
+    """
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд кодирования: {backend}. Доступны: {', '.join(ENCODER_BACKENDS)}")
+    logger.info(f"Загружаю бэкенд кодирования {backend} ({model_name})...")
+    return ENCODER_BACKENDS[backend](model_name, **kwargs)
@@ -0,0 +1,387 @@
+"""Сборка находок из сохраненных результатов сопоставления.
+
+Дорогая часть ML анализа - кодирование WARNING строк и поиск ближайших
+аномалий словаря - не зависит от порога. MatchState хранит ее результат
+(индексы и score top-k совпадений для каждой WARNING строки) вместе с
+заранее разложенными блоками ERROR строк для каждой аномалии, поэтому
+находки для любого порога собираются только фильтрацией массивов -
+без повторного парсинга и инференса.
+"""
+
+import logging
+import os
+import pickle
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+RESULT_COLUMNS = ['ID аномалии', 'ID проблемы', 'Файл с проблемой', '№ строки', 'Строка из лога']
+
+# Версия формата сохраненного состояния - старые файлы не загружаются
+STATE_VERSION = 1
+
+
+def full_log_lines(df: pd.DataFrame, texts: Optional[pd.Series] = None) -> np.ndarray:
+    """Полные строки лога: full_line, а если его нет - дата, уровень, источник и текст.
+
+    Args:
+        df: DataFrame с логами
+        texts: Тексты для сборки строки (по умолчанию колонка text)
+
+    Returns:
+        Массив строк в порядке df
+    """
+    if df.empty:
+        return np.array([], dtype=object)
+    texts = df["text"].astype(str) if texts is None else texts
+    prefix = df["datetime"].astype(str) + " " + df["level"].astype(str)
+    if "source" in df.columns:
+        source = df["source"]
+        has_source = source.notna() & (source.astype(str) != "") & (source != "unknown")
+        built = prefix.where(~has_source, prefix + " " + source.astype(str) + ":") + " " + texts
+    else:
+        built = prefix + " " + texts
+    if "full_line" in df.columns:
+        built = df["full_line"].where(df["full_line"].notna(), built)
+    return built.to_numpy(dtype=object)
+
+
+@dataclass
+class MatchState:
+    """Результат сопоставления WARNING строк со словарем, не зависящий от порога."""
+
+    # top-k совпадений каждой WARNING строки, по убыванию score
+    top_indices: np.ndarray
+    top_scores: np.ndarray
+    # Локации WARNING строк (для новых аномалий)
+    warning_files: np.ndarray
+    warning_lines: np.ndarray
+    warning_full_lines: np.ndarray
+    # Словарь: ID и номер группы (одинаковый текст аномалии) для каждой строки
+    anomaly_ids: np.ndarray
+    problem_ids: np.ndarray
+    dictionary_groups: np.ndarray
+    # Блоки находок по группам в формате CSR: пары (строка словаря, ERROR строка)
+    group_ptr: np.ndarray
+    block_dictionary_rows: np.ndarray
+    block_error_rows: np.ndarray
+    # Локации ERROR строк
+    error_files: np.ndarray
+    error_lines: np.ndarray
+    error_full_lines: np.ndarray
+    options: object = None
+    stage_counts: Dict[str, int] = field(default_factory=dict)
+
+    @classmethod
+    def from_frames(
+        cls,
+        top_indices: np.ndarray,
+        top_scores: np.ndarray,
+        logs_df: pd.DataFrame,
+        anomalies_problems_df: pd.DataFrame,
+        options=None,
+        stage_counts: Optional[Dict[str, int]] = None,
+    ) -> "MatchState":
+        """Собирает состояние из результатов поиска и исходных таблиц.
+
+        Args:
+            top_indices: Индексы строк словаря (n_warnings, k)
+            top_scores: Сходство для top_indices (n_warnings, k)
+            logs_df: DataFrame с логами (WARNING и ERROR)
+            anomalies_problems_df: DataFrame со словарем аномалий
+            options: AnalysisOptions анализа
+            stage_counts: Статистика этапов сопоставления
+
+        Returns:
+            MatchState
+        """
+        warning_logs = logs_df[logs_df["level"] == "WARNING"]
+        error_logs = logs_df[logs_df["level"] == "ERROR"]
+
+        # Группа = одинаковый текст аномалии; NaN ни с чем не совпадает - пустой блок
+        groups, uniques = pd.factorize(anomalies_problems_df["Аномалия"])
+        empty_group = len(uniques)
+        groups = np.where(groups < 0, empty_group, groups).astype(np.int64)
+
+        # Позиции ERROR строк по точному тексту (в порядке логов)
+        error_positions = error_logs.groupby("text", sort=False).indices if len(error_logs) else {}
+        problem_texts = anomalies_problems_df["Проблема"].tolist()
+
+        group_ptr = np.zeros(empty_group + 2, dtype=np.int64)
+        dictionary_rows, error_rows = [], []
+        total = 0
+        for row in np.argsort(groups, kind="stable"):
+            group = groups[row]
+            positions = error_positions.get(problem_texts[row])
+            if positions is not None and group != empty_group:
+                dictionary_rows.append(np.full(len(positions), row, dtype=np.int64))
+                error_rows.append(np.asarray(positions, dtype=np.int64))
+                total += len(positions)
+            group_ptr[group + 1] = total
+        # Группы без строк словаря не встречаются, но пустой блок NaN - тоже закрываем
+        group_ptr = np.maximum.accumulate(group_ptr)
+
+        return cls(
+            top_indices=np.asarray(top_indices, dtype=np.int32),
+            top_scores=np.asarray(top_scores, dtype=np.float32),
+            warning_files=warning_logs["filename"].to_numpy(dtype=object),
+            warning_lines=warning_logs["line_number"].to_numpy(),
+            warning_full_lines=full_log_lines(warning_logs, warning_logs["text"].astype(str).str.strip()),
+            anomaly_ids=anomalies_problems_df["ID аномалии"].to_numpy(),
+            problem_ids=anomalies_problems_df["ID проблемы"].to_numpy(),
+            dictionary_groups=groups,
+            group_ptr=group_ptr,
+            block_dictionary_rows=np.concatenate(dictionary_rows) if dictionary_rows else np.zeros(0, dtype=np.int64),
+            block_error_rows=np.concatenate(error_rows) if error_rows else np.zeros(0, dtype=np.int64),
+            error_files=error_logs["filename"].to_numpy(dtype=object),
+            error_lines=error_logs["line_number"].to_numpy(),
+            error_full_lines=full_log_lines(error_logs),
+            options=options,
+            stage_counts=dict(stage_counts or {}),
+        )
+
+    @property
+    def warning_count(self) -> int:
+        return len(self.top_scores)
+
+    def build_findings(
+        self,
+        threshold: float,
+        new_anomaly_floor: float,
+        top_k: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """Собирает находки для заданного порога фильтрацией сохраненных массивов.
+
+        Порядок совпадает с исходным построчным алгоритмом: сначала блоки
+        ERROR строк сопоставленных WARNING (в порядке логов), затем новые
+        аномалии с new_anomaly_floor < score < threshold по убыванию score.
+
+        Args:
+            threshold: Порог сходства
+            new_anomaly_floor: Нижняя граница score для новых аномалий
+            top_k: Сколько совпадений учитывать (не больше сохраненных)
+
+        Returns:
+            DataFrame с найденными проблемами и их локациями
+        """
+        if self.top_scores.size == 0:
+            return pd.DataFrame()
+
+        k = self.top_scores.shape[1] if top_k is None else max(1, min(int(top_k), self.top_scores.shape[1]))
+        dictionary_rows, error_rows = self.known_pairs(self.top_indices[:, :k], self.top_scores[:, :k], threshold)
+        new_rows = self.new_anomaly_rows(threshold, new_anomaly_floor)
+        return self.findings_frame(dictionary_rows, error_rows, new_rows)
+
+    def known_pairs(self, top_indices: np.ndarray, top_scores: np.ndarray, threshold: float):
+        """Пары (строка словаря, ERROR строка) для совпадений WARNING строк выше порога.
+
+        Args:
+            top_indices: Индексы строк словаря (n, k) - этого состояния или батча WARNING строк
+            top_scores: Сходство для top_indices (n, k)
+            threshold: Порог сходства
+
+        Returns:
+            (строки словаря, ERROR строки) в порядке WARNING строк
+        """
+        # Совпадения выше порога: построчно, внутри строки - по убыванию score
+        warning_idx, rank_idx = np.nonzero(top_scores >= threshold)
+        groups = self.dictionary_groups[top_indices[warning_idx, rank_idx]]
+        if top_scores.shape[1] > 1 and len(groups):
+            # Одна группа (текст аномалии) - один раз на WARNING строку
+            keys = warning_idx.astype(np.int64) * (len(self.group_ptr) + 1) + groups
+            _, first = np.unique(keys, return_index=True)
+            groups = groups[np.sort(first)]
+
+        # Разворачиваем блоки групп в позиции пар (строка словаря, ERROR строка)
+        starts = self.group_ptr[groups]
+        lengths = self.group_ptr[groups + 1] - starts
+        total = int(lengths.sum())
+        block_offsets = np.cumsum(lengths) - lengths
+        positions = np.repeat(starts - block_offsets, lengths) + np.arange(total)
+        return self.block_dictionary_rows[positions], self.block_error_rows[positions]
+
+    def new_anomaly_rows(self, threshold: float, new_anomaly_floor: float) -> np.ndarray:
+        """WARNING строки новых аномалий (new_anomaly_floor < score < threshold) по убыванию score."""
+        best = self.top_scores[:, 0] if self.top_scores.size else np.zeros(0, dtype=np.float32)
+        candidates = np.nonzero((best < threshold) & (best > new_anomaly_floor))[0]
+        return candidates[np.argsort(-best[candidates], kind="stable")]
+
+    def findings_frame(self, dictionary_rows: np.ndarray, error_rows: np.ndarray,
+                       new_rows: np.ndarray) -> pd.DataFrame:
+        """Таблица находок: сначала пары ERROR строк, затем новые аномалии.
+
+        Args:
+            dictionary_rows: Строки словаря пар из known_pairs
+            error_rows: ERROR строки пар из known_pairs
+            new_rows: WARNING строки новых аномалий из new_anomaly_rows
+
+        Returns:
+            DataFrame с колонками RESULT_COLUMNS (пустой, если находок нет)
+        """
+        if len(error_rows) == 0 and len(new_rows) == 0:
+            return pd.DataFrame()
+
+        new_dictionary_rows = self.top_indices[new_rows, 0]
+        return pd.DataFrame({
+            'ID аномалии': np.concatenate([self.anomaly_ids[dictionary_rows], self.anomaly_ids[new_dictionary_rows]]),
+            'ID проблемы': np.concatenate([self.problem_ids[dictionary_rows], self.problem_ids[new_dictionary_rows]]),
+            'Файл с проблемой': np.concatenate([self.error_files[error_rows], self.warning_files[new_rows]]),
+            '№ строки': np.concatenate([self.error_lines[error_rows], self.warning_lines[new_rows]]),
+            'Строка из лога': np.concatenate([self.error_full_lines[error_rows], self.warning_full_lines[new_rows]]),
+        })
+
+    def warning_matches(self, threshold: float, new_anomaly_floor: float) -> pd.DataFrame:
+        """Лучшее совпадение каждой WARNING строки (для потоковой выдачи).
+
+        Args:
+            threshold: Порог сходства (известная аномалия)
+            new_anomaly_floor: Нижняя граница score для новых аномалий
+
+        Returns:
+            DataFrame: filename, line_number, line, anomaly_id, problem_id, score, kind
+            (kind - "known" или "new"); строки ниже new_anomaly_floor не попадают
+        """
+        if self.top_scores.size == 0:
+            return pd.DataFrame(columns=["filename", "line_number", "line", "anomaly_id", "problem_id", "score", "kind"])
+
+        best = self.top_scores[:, 0]
+        known = best >= threshold
+        rows = np.nonzero(known | (best > new_anomaly_floor))[0]
+        dictionary_rows = self.top_indices[rows, 0]
+        return pd.DataFrame({
+            "filename": self.warning_files[rows],
+            "line_number": self.warning_lines[rows],
+            "line": self.warning_full_lines[rows],
+            "anomaly_id": self.anomaly_ids[dictionary_rows],
+            "problem_id": self.problem_ids[dictionary_rows],
+            "score": best[rows].round(4),
+            "kind": np.where(known[rows], "known", "new"),
+        })
+
+    def save(self, path: str) -> None:
+        """Атомарно сохраняет состояние в файл."""
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump({"version": STATE_VERSION, "state": self}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "MatchState":
+        """Загружает состояние, сохраненное save().
+
+        Raises:
+            FileNotFoundError: Если файла нет
+            ValueError: Если формат файла устарел
+        """
+        with open(path, "rb") as f:
+            payload = pickle.load(f)
+        if not isinstance(payload, dict) or payload.get("version") != STATE_VERSION:
+            raise ValueError(f"Неподдерживаемый формат сохраненного анализа: {path}")
+        return payload["state"]
+
+
+class FindingsStream:
+    """Потоковая сборка находок по батчам WARNING строк.
+
+    Находки известных аномалий отдаются сразу для каждого батча - в том же
+    порядке, что и у build_findings. Новые аномалии упорядочены по score
+    среди всех WARNING строк, поэтому отдаются после последнего батча.
+    Между батчами хранятся только top-k массивы и счетчики сводки - таблица
+    находок целиком не собирается.
+    """
+
+    def __init__(self, logs_df: pd.DataFrame, anomalies_problems_df: pd.DataFrame, options=None,
+                 threshold: float = 0.7, new_anomaly_floor: float = 0.5):
+        """Инициализация.
+
+        Args:
+            logs_df: DataFrame с логами (WARNING и ERROR)
+            anomalies_problems_df: DataFrame со словарем аномалий
+            options: AnalysisOptions анализа
+            threshold: Порог сходства
+            new_anomaly_floor: Нижняя граница score для новых аномалий
+        """
+        self.logs_df = logs_df
+        self.anomalies_problems_df = anomalies_problems_df
+        self.options = options
+        self.threshold = threshold
+        self.new_anomaly_floor = new_anomaly_floor
+        self.top_k = max(1, int(getattr(options, "top_k", 1)))
+        # Блоки ERROR строк по группам словаря - общие для всех батчей
+        self._errors = MatchState.from_frames(
+            np.zeros((0, self.top_k), dtype=np.int32), np.zeros((0, self.top_k), dtype=np.float32),
+            logs_df[logs_df["level"] == "ERROR"], anomalies_problems_df, options,
+        )
+        self._top_indices: List[np.ndarray] = []
+        self._top_scores: List[np.ndarray] = []
+        self.stage_counts: Dict[str, int] = {}
+        self.total_problems = 0
+        self._anomaly_ids: Set = set()
+        self._problem_ids: Set = set()
+        self._files: Set = set()
+
+    def _count(self, frame: pd.DataFrame) -> pd.DataFrame:
+        if not frame.empty:
+            self.total_problems += len(frame)
+            self._anomaly_ids.update(frame['ID аномалии'].unique().tolist())
+            self._problem_ids.update(frame['ID проблемы'].unique().tolist())
+            self._files.update(frame['Файл с проблемой'].unique().tolist())
+        return frame
+
+    def add(self, batch: MatchState) -> pd.DataFrame:
+        """Находки известных аномалий для батча WARNING строк (в порядке логов).
+
+        Args:
+            batch: MatchState батча (match_warnings только по его WARNING строкам)
+
+        Returns:
+            DataFrame с колонками RESULT_COLUMNS (пустой, если находок нет)
+        """
+        self._top_indices.append(batch.top_indices)
+        self._top_scores.append(batch.top_scores)
+        for name, value in batch.stage_counts.items():
+            self.stage_counts[name] = self.stage_counts.get(name, 0) + value
+        dictionary_rows, error_rows = self._errors.known_pairs(batch.top_indices, batch.top_scores, self.threshold)
+        return self._count(self._errors.findings_frame(dictionary_rows, error_rows, np.zeros(0, dtype=np.int64)))
+
+    def finish(self) -> MatchState:
+        """MatchState всех батчей - для сохранения и смены порога без повторного анализа."""
+        top_indices = np.concatenate(self._top_indices) if self._top_indices else self._errors.top_indices
+        top_scores = np.concatenate(self._top_scores) if self._top_scores else self._errors.top_scores
+        self._top_indices, self._top_scores = [], []
+        return MatchState.from_frames(
+            top_indices, top_scores, self.logs_df, self.anomalies_problems_df, self.options, self.stage_counts
+        )
+
+    def new_anomalies(self, state: MatchState, batch_size: int) -> Iterator[pd.DataFrame]:
+        """Находки новых аномалий частями по batch_size (по убыванию score).
+
+        Args:
+            state: Результат finish()
+            batch_size: Максимум строк в части
+        """
+        empty = np.zeros(0, dtype=np.int64)
+        rows = state.new_anomaly_rows(self.threshold, self.new_anomaly_floor)
+        for start in range(0, len(rows), batch_size):
+            yield self._count(state.findings_frame(empty, empty, rows[start:start + batch_size]))
+
+    def summary(self) -> Dict[str, int]:
+        """Сводка отданных находок (как MLLogAnalyzer.get_analysis_summary)."""
+        return {
+            'total_problems': self.total_problems,
+            'unique_anomalies': len(self._anomaly_ids),
+            'unique_problems': len(self._problem_ids),
+            'unique_files': len(self._files),
+        }
@@ -0,0 +1,287 @@
+"""Инкрементальный повторный анализ дописываемых логов.
+
+Серверы дописывают одни и те же файлы весь день, и их регулярно
+отправляют на анализ заново. Для каждого файла (ключ - его идентичность,
+например имя) сохраняется контрольная точка: смещение и число строк
+уже проанализированной части, хэши начала файла и последнего блока
+перед смещением, inode, а также WARNING/ERROR строки с top-k совпадениями.
+Повторный анализ парсит и кодирует только новый хвост, а находки
+собираются из объединенного состояния - так же, как при полном анализе.
+
+Если файл стал меньше смещения (усечение), изменилось начало или блок
+перед смещением, либо сменился inode того же пути (ротация), файл
+анализируется заново целиком.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from .findings import MatchState
+from .log_parser import LogParser
+from .ml_analyzer import AnalysisOptions, MLLogAnalyzer
+from .progress import NULL_PROGRESS, STAGE_PARSING, ProgressReporter
+
+logger = logging.getLogger(__name__)
+
+# Версия формата контрольной точки - старые файлы игнорируются (полный анализ)
+CHECKPOINT_VERSION = 1
+# Размер блоков для хэшей начала файла и блока перед смещением
+FINGERPRINT_BYTES = 4096
+# Колонки строк, которые нужны для сборки находок
+STATE_COLUMNS = ["datetime", "level", "source", "text", "filename", "line_number", "full_line"]
+
+MODE_FULL = "full"
+MODE_APPEND = "append"
+MODE_UNCHANGED = "unchanged"
+MODE_TRUNCATED = "truncated"
+MODE_ROTATED = "rotated"
+
+
+def _hash_range(file, start: int, length: int) -> str:
+    file.seek(start)
+    return hashlib.sha1(file.read(length)).hexdigest()
+
+
+def file_fingerprint(path: str, offset: int) -> Dict[str, str]:
+    """Хэши начала файла и блока перед смещением.
+
+    Args:
+        path: Путь к файлу
+        offset: Смещение конца проанализированной части
+
+    Returns:
+        {"head_hash", "boundary_hash"}
+    """
+    with open(path, "rb") as file:
+        head_length = min(FINGERPRINT_BYTES, offset)
+        boundary_start = max(0, offset - FINGERPRINT_BYTES)
+        return {
+            "head_hash": _hash_range(file, 0, head_length),
+            "boundary_hash": _hash_range(file, boundary_start, offset - boundary_start),
+        }
+
+
+def default_source_key(filename: str, path: str) -> str:
+    """Ключ контрольной точки по умолчанию: имя файла и хэш его первой строки.
+
+    Одно имя (app.log, syslog.txt) у разных источников не делит контрольную
+    точку: первая строка дописываемого лога не меняется, а у разных файлов
+    (время, хост) почти всегда отличается.
+    """
+    with open(path, "rb") as file:
+        head = file.read(FINGERPRINT_BYTES)
+    newline = head.find(b"\n")
+    first_line = head[:newline] if newline >= 0 else head
+    return f"{filename}#{hashlib.sha1(first_line).hexdigest()[:16]}"
+
+
+@dataclass
+class FileCheckpoint:
+    """Проанализированная часть файла и состояние сопоставления для нее."""
+
+    key: str
+    path: str
+    inode: int
+    offset: int
+    line_number: int
+    head_hash: str
+    boundary_hash: str
+    dictionary_key: str
+    model_name: Optional[str]
+    top_k: int
+    # WARNING и ERROR строки проанализированной части (STATE_COLUMNS)
+    logs: pd.DataFrame
+    # top-k совпадения WARNING строк logs, в их порядке
+    top_indices: np.ndarray
+    top_scores: np.ndarray
+    updated_at: float = field(default_factory=time.time)
+
+    def detect_change(self, path: str) -> str:
+        """Как изменился файл с момента контрольной точки.
+
+        Returns:
+            MODE_APPEND, MODE_UNCHANGED, MODE_TRUNCATED или MODE_ROTATED
+        """
+        stat = os.stat(path)
+        if stat.st_size < self.offset:
+            return MODE_TRUNCATED
+        # inode сравнимы только для одного и того же пути (загрузки сохраняются в новые файлы)
+        if os.path.abspath(path) == os.path.abspath(self.path) and stat.st_ino != self.inode:
+            return MODE_ROTATED
+        fingerprint = file_fingerprint(path, self.offset)
+        if fingerprint["head_hash"] != self.head_hash or fingerprint["boundary_hash"] != self.boundary_hash:
+            return MODE_ROTATED
+        return MODE_UNCHANGED if stat.st_size == self.offset else MODE_APPEND
+
+    def save(self, path: str) -> None:
+        """Атомарно сохраняет контрольную точку в файл."""
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump({"version": CHECKPOINT_VERSION, "checkpoint": self}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> Optional["FileCheckpoint"]:
+        """Загружает контрольную точку (None, если ее нет или формат устарел)."""
+        try:
+            with open(path, "rb") as f:
+                payload = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError) as e:
+            logger.warning(f"Поврежденная контрольная точка {path}: {e}")
+            return None
+        if not isinstance(payload, dict) or payload.get("version") != CHECKPOINT_VERSION:
+            return None
+        return payload["checkpoint"]
+
+
+@dataclass
+class IncrementalResult:
+    """Итог инкрементального анализа."""
+
+    match_state: MatchState
+    # Новые (впервые проанализированные) строки - для базовой статистики
+    new_logs: pd.DataFrame
+    mode: str
+    from_line: int
+    reused_warnings: int
+    checkpoint: FileCheckpoint
+
+
+class IncrementalAnalyzer:
+    """Анализ хвоста файла с объединением с предыдущей контрольной точкой."""
+
+    def __init__(self, analyzer: MLLogAnalyzer, parser: LogParser, checkpoint_dir: str):
+        """Инициализация.
+
+        Args:
+            analyzer: ML анализатор
+            parser: Парсер логов
+            checkpoint_dir: Директория контрольных точек
+        """
+        self.analyzer = analyzer
+        self.parser = parser
+        self.checkpoint_dir = checkpoint_dir
+
+    def checkpoint_path(self, key: str) -> str:
+        """Файл контрольной точки для ключа (хэш - ключ может быть любой строкой)."""
+        return os.path.join(self.checkpoint_dir, hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + ".ckpt")
+
+    def analyze(self, key: str, path: str, anomalies_df: pd.DataFrame, options: AnalysisOptions,
+                progress: Optional[ProgressReporter] = None) -> IncrementalResult:
+        """Анализирует файл, переиспользуя контрольную точку ключа, если файл только дописан.
+
+        Args:
+            key: Идентичность файла (например, имя файла на сервере-источнике)
+            path: Текущее содержимое файла
+            anomalies_df: Словарь аномалий
+            options: Параметры анализа
+            progress: Получатель событий прогресса
+
+        Returns:
+            IncrementalResult с объединенным MatchState и новой контрольной точкой
+        """
+        checkpoint_path = self.checkpoint_path(key)
+        checkpoint = FileCheckpoint.load(checkpoint_path)
+        dictionary_key = self.analyzer.dictionary_key(anomalies_df["Аномалия"].astype(str).tolist())
+        top_k = max(1, int(options.top_k))
+        # Модель по умолчанию (model не указан) и она же, указанная явно - один и тот же энкодер
+        model_name = options.model_name or self.analyzer.model_name
+
+        mode = MODE_FULL
+        if checkpoint is not None:
+            if (checkpoint.dictionary_key, checkpoint.model_name, checkpoint.top_k) != (
+                dictionary_key, model_name, top_k
+            ):
+                logger.info(f"Контрольная точка {key}: другой словарь, модель или top_k - полный анализ")
+                checkpoint = None
+            else:
+                mode = checkpoint.detect_change(path)
+                if mode in (MODE_TRUNCATED, MODE_ROTATED):
+                    logger.info(f"🔄 {key}: {mode}, полный анализ")
+                    checkpoint = None
+
+        offset = checkpoint.offset if checkpoint else 0
+        line_number = checkpoint.line_number if checkpoint else 0
+        progress = progress or NULL_PROGRESS
+        progress.stage(STAGE_PARSING, mode=mode, from_line=line_number + 1)
+        new_logs, end_offset, end_line = self.parser.parse_log_file_from(path, offset, line_number + 1)
+        filename = os.path.basename(path)
+
+        # Предыдущие строки - с именем текущего файла (загрузки сохраняются под новыми именами)
+        previous_logs = checkpoint.logs.assign(filename=filename) if checkpoint else None
+        relevant = (
+            new_logs[new_logs["level"].isin(["WARNING", "ERROR"])]
+            if not new_logs.empty else pd.DataFrame(columns=STATE_COLUMNS)
+        )
+        if not relevant.empty and (relevant["level"] == "WARNING").any():
+            tail_state = self.analyzer.match_warnings(relevant, anomalies_df, options, progress)
+            tail_indices, tail_scores = tail_state.top_indices, tail_state.top_scores
+            stage_counts = dict(tail_state.stage_counts)
+        else:
+            tail_indices = np.zeros((0, top_k), dtype=np.int32)
+            tail_scores = np.zeros((0, top_k), dtype=np.float32)
+            stage_counts = {}
+
+        if checkpoint is not None:
+            logs = pd.concat([previous_logs, relevant[STATE_COLUMNS]], ignore_index=True)
+            top_indices = np.concatenate([checkpoint.top_indices, tail_indices])
+            top_scores = np.concatenate([checkpoint.top_scores, tail_scores])
+        else:
+            logs = relevant[STATE_COLUMNS].reset_index(drop=True)
+            top_indices, top_scores = tail_indices, tail_scores
+
+        reused = len(checkpoint.top_scores) if checkpoint else 0
+        stage_counts["reused"] = reused
+        match_state = MatchState.from_frames(top_indices, top_scores, logs, anomalies_df, options, stage_counts)
+
+        # В контрольную точку - только завершенные строки (незавершенная будет прочитана снова)
+        complete = (logs["line_number"] <= end_line).to_numpy()
+        complete_warnings = complete[(logs["level"] == "WARNING").to_numpy()]
+        fingerprint = file_fingerprint(path, end_offset)
+        new_checkpoint = FileCheckpoint(
+            key=key,
+            path=os.path.abspath(path),
+            inode=os.stat(path).st_ino,
+            offset=end_offset,
+            line_number=end_line,
+            head_hash=fingerprint["head_hash"],
+            boundary_hash=fingerprint["boundary_hash"],
+            dictionary_key=dictionary_key,
+            model_name=model_name,
+            top_k=top_k,
+            logs=logs[complete].reset_index(drop=True),
+            top_indices=top_indices[complete_warnings],
+            top_scores=top_scores[complete_warnings],
+        )
+        new_checkpoint.save(checkpoint_path)
+
+        logger.info(
+            f"📌 {key}: режим {mode}, с строки {line_number + 1}, новых строк {end_line - line_number}, "
+            f"переиспользовано {reused} WARNING"
+        )
+        return IncrementalResult(
+            match_state=match_state,
+            new_logs=new_logs,
+            mode=mode,
+            from_line=line_number + 1,
+            reused_warnings=reused,
+            checkpoint=new_checkpoint,
+        )
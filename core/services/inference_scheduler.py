@@ -0,0 +1,198 @@
+"""Планировщик инференса с динамическим батчингом между запросами.
+
+Параллельные анализы отправляют сюда свои тексты, а единственный поток
+инференса собирает их в общие батчи (до max_batch_size текстов или пока
+не истечет max_wait_ms с момента первого запроса в очереди) и прогоняет
+через модель. Так маленькие запросы получают выгоду от батчинга, а модель
+используется только из одного потока.
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional
+
+import numpy as np
+
+from .metrics import ENCODER_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+_SCHEDULER_BATCH_SIZE = ENCODER_BATCH_SIZE.labels("scheduler")
+
+
+class _EncodeRequest:
+    """Запрос на кодирование: тексты и future с результатом."""
+
+    __slots__ = ("texts", "future", "created_at")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.future: Future = Future()
+        self.created_at = time.monotonic()
+
+
+class InferenceScheduler:
+    """Собирает запросы на encode в динамические батчи и выполняет их в одном потоке."""
+
+    def __init__(self, encoder, max_batch_size: int = 64, max_wait_ms: float = 5.0, encode_batch_size: int = 32):
+        """Инициализация.
+
+        Args:
+            encoder: Бэкенд кодирования с методом encode(texts, batch_size)
+            max_batch_size: Максимум текстов в одном динамическом батче
+            max_wait_ms: Сколько ждать других запросов после первого в батче
+            encode_batch_size: batch_size, передаваемый в encoder.encode
+        """
+        self.encoder = encoder
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.encode_batch_size = encode_batch_size
+        self._queue: "queue.Queue[Optional[_EncodeRequest]]" = queue.Queue()
+        # Запрос, не поместившийся в прошлый батч - первый в следующем (только поток инференса)
+        self._carry: Optional[_EncodeRequest] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # Статистика для мониторинга
+        self.batches = 0
+        self.texts = 0
+
+    def start(self) -> None:
+        """Запускает поток инференса (идемпотентно)."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Останавливает поток инференса после обработки очереди."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def submit(self, texts: List[str]) -> Future:
+        """Ставит тексты в очередь на кодирование.
+
+        Returns:
+            Future с матрицей эмбеддингов в порядке texts
+        """
+        request = _EncodeRequest(list(texts))
+        if not request.texts:
+            request.future.set_result(np.zeros((0, 0), dtype=np.float32))
+            return request.future
+        self.start()
+        self._queue.put(request)
+        return request.future
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """Блокирующий encode через планировщик (совместим с интерфейсом бэкенда).
+
+        Большие запросы режутся на куски по max_batch_size, и следующий кусок
+        ставится в очередь только после готовности предыдущего: маленькие
+        запросы, пришедшие в это время, проходят между кусками, а не ждут
+        весь большой запрос.
+        """
+        parts = [
+            self.submit(texts[start:start + self.max_batch_size]).result()
+            for start in range(0, len(texts), self.max_batch_size)
+        ]
+        if not parts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack(parts)
+
+    def _next_request(self) -> Optional[_EncodeRequest]:
+        """Следующий запрос: отложенный из прошлого батча или из очереди."""
+        if self._carry is not None:
+            request, self._carry = self._carry, None
+            return request
+        return self._queue.get()
+
+    def _collect_batch(self, first: _EncodeRequest) -> List[_EncodeRequest]:
+        """Добирает запросы в батч до лимита размера или дедлайна.
+
+        Запрос, с которым батч превысил бы max_batch_size, откладывается
+        в следующий батч.
+        """
+        batch = [first]
+        size = len(first.texts)
+        deadline = first.created_at + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                request = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                # Сигнал остановки - вернем его в очередь после обработки батча
+                self._queue.put(None)
+                break
+            if size + len(request.texts) > self.max_batch_size:
+                self._carry = request
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first = self._next_request()
+            if first is None:
+                break
+            batch = self._collect_batch(first)
+            texts = [text for request in batch for text in request.texts]
+            _SCHEDULER_BATCH_SIZE.observe(len(texts))
+            try:
+                embeddings = self.encoder.encode(texts, batch_size=self.encode_batch_size)
+            except Exception as e:
+                if len(batch) == 1:
+                    logger.error(f"Ошибка инференса батча из {len(texts)} текстов: {e}", exc_info=True)
+                    batch[0].future.set_exception(e)
+                else:
+                    logger.warning(
+                        f"⚠️ Ошибка инференса батча из {len(texts)} текстов ({len(batch)} запросов): {e}, "
+                        f"повторяю запросы по одному"
+                    )
+                    self._encode_separately(batch)
+                continue
+
+            self.batches += 1
+            self.texts += len(texts)
+            offset = 0
+            for request in batch:
+                count = len(request.texts)
+                request.future.set_result(embeddings[offset:offset + count])
+                offset += count
+
+        # Завершаем оставшиеся запросы, чтобы никто не ждал вечно
+        if self._carry is not None:
+            self._carry.future.set_exception(RuntimeError("Планировщик инференса остановлен"))
+            self._carry = None
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                request.future.set_exception(RuntimeError("Планировщик инференса остановлен"))
+
+    def _encode_separately(self, batch: List[_EncodeRequest]) -> None:
+        """Повторяет запросы упавшего батча по одному.
+
+        Ошибка одного запроса (например, нехватка памяти на огромном) не должна
+        проваливать чужие запросы, попавшие с ним в один батч.
+        """
+        for request in batch:
+            try:
+                embeddings = self.encoder.encode(request.texts, batch_size=self.encode_batch_size)
+            except Exception as e:
+                logger.error(f"Ошибка инференса запроса из {len(request.texts)} текстов: {e}")
+                request.future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(request.texts)
+            request.future.set_result(embeddings)
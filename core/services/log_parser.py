@@ -7,14 +7,22 @@
 import logging
 import os
 import re
+import time
 import zipfile
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 import pandas as pd
 
+from .metrics import LINES_PARSED, LINES_READ, STAGE_SECONDS
+from .progress import NULL_PROGRESS, STAGE_PARSING, ProgressReporter
+from .template_miner import TemplateMiner
+from .timing import span
+
 logger = logging.getLogger(__name__)
 
+_PARSE_SECONDS = STAGE_SECONDS.labels("parse")
+
 
 class LogParser:
     """Парсер логов для анализа аномалий.
@@ -22,59 +30,168 @@ class LogParser:
     Логика написана коллегой, поддерживает синхронный и асинхронный режимы.
     """
 
-    def __init__(self):
-        """Инициализация парсера."""
-        pass
+    def __init__(self, mine_templates: bool = False, template_similarity: float = 0.5, template_depth: int = 4):
+        """Инициализация парсера.
+
+        Args:
+            mine_templates: Выделять шаблоны сообщений (колонки template_id, template, params)
+            template_similarity: Порог сходства строки с шаблоном (доля совпавших токенов)
+            template_depth: Глубина дерева майнера шаблонов
+        """
+        self.mine_templates = mine_templates
+        self.template_similarity = template_similarity
+        self.template_depth = template_depth
 
-    def parse_log_files(self, file_paths: List[str]) -> pd.DataFrame:
+    def parse_log_files(self, file_paths: List[str], progress: Optional[ProgressReporter] = None) -> pd.DataFrame:
         """Парсит файлы логов в DataFrame (синхронная версия для API).
 
         Args:
             file_paths: Список путей к файлам логов
+            progress: Получатель событий прогресса (файлы, строки, строк/сек)
 
         Returns:
             DataFrame с распарсенными логами
         """
         all_logs = []
+        # Майнер свой на каждый вызов - шаблоны одного анализа не смешиваются с другими
+        miner = TemplateMiner(self.template_similarity, self.template_depth) if self.mine_templates else None
 
         logger.info(f"Начинаю парсинг {len(file_paths)} файлов")
+        started = time.perf_counter()
+        progress = progress or NULL_PROGRESS
+        progress.stage(STAGE_PARSING, files_total=len(file_paths), files_done=0, lines=0)
+        total_lines = 0
 
-        for file_path in file_paths:
+        for files_done, file_path in enumerate(file_paths):
             try:
                 logger.info(f"Парсинг файла: {file_path}")
 
                 # Читаем файл
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as file:
-                        content = file.read()
-                except UnicodeDecodeError:
-                    logger.warning(f"Ошибка кодировки файла {file_path}. Попробую другую кодировку.")
-                    with open(file_path, 'r', encoding='latin-1') as file:
-                        content = file.read()
-
-                lines = content.splitlines()
-                logger.info(f"Файл {Path(file_path).name} содержит {len(lines)} строк")
+                with span("read"):
+                    try:
+                        with open(file_path, 'r', encoding='utf-8') as file:
+                            content = file.read()
+                    except UnicodeDecodeError:
+                        logger.warning(f"Ошибка кодировки файла {file_path}. Попробую другую кодировку.")
+                        with open(file_path, 'r', encoding='latin-1') as file:
+                            content = file.read()
+
+                    lines = content.splitlines()
+                    logger.info(f"Файл {Path(file_path).name} содержит {len(lines)} строк")
 
                 parsed_lines = 0
 
                 # Парсим строки (логика коллеги)
-                for line_num, line in enumerate(lines, 1):
-                    parsed = self._parse_log_line(line.strip())
-                    if parsed:
-                        parsed['filename'] = Path(file_path).name
-                        parsed['line_number'] = line_num
-                        parsed['full_line'] = line.strip()  # Сохраняем полную строку
-                        all_logs.append(parsed)
-                        parsed_lines += 1
+                with span("parse_lines"):
+                    for line_num, line in enumerate(lines, 1):
+                        if progress.enabled and not line_num & 0xFFFF:
+                            progress.update(files_total=len(file_paths), files_done=files_done,
+                                            lines=total_lines + line_num, lines_per_sec=progress.rate(total_lines + line_num))
+                        parsed = self._parse_log_line(line.strip())
+                        if parsed:
+                            parsed['filename'] = Path(file_path).name
+                            parsed['line_number'] = line_num
+                            parsed['full_line'] = line.strip()  # Сохраняем полную строку
+                            if miner is not None:
+                                parsed['template_id'] = miner.add(parsed['text'])
+                            all_logs.append(parsed)
+                            parsed_lines += 1
 
                 logger.info(f"В файле {Path(file_path).name} найдено {parsed_lines} валидных строк логов")
+                total_lines += len(lines)
+                LINES_READ.inc(len(lines))
+                LINES_PARSED.inc(parsed_lines)
+                progress.update(files_total=len(file_paths), files_done=files_done + 1,
+                                lines=total_lines, lines_per_sec=progress.rate(total_lines))
 
             except Exception as e:
                 logger.warning(f"Ошибка при парсинге файла {file_path}: {e}")
                 continue
 
         logger.info(f"Всего распарсено {len(all_logs)} строк логов из всех файлов")
-        return pd.DataFrame(all_logs) if all_logs else pd.DataFrame()
+        if not all_logs:
+            _PARSE_SECONDS.observe(time.perf_counter() - started)
+            return pd.DataFrame()
+
+        with span("dataframe", rows=len(all_logs)):
+            df = pd.DataFrame(all_logs)
+        if miner is not None:
+            df['template'], df['params'] = miner.annotate(df['text'], df['template_id'])
+            logger.info(f"Выделено {len(miner)} шаблонов сообщений")
+        _PARSE_SECONDS.observe(time.perf_counter() - started)
+        return df
+
+    def parse_lines(self, lines: List[str], filename: str, first_line_number: int = 1,
+                    miner: Optional[TemplateMiner] = None) -> List[Dict]:
+        """Парсит уже прочитанные строки одного файла (для потокового чтения).
+
+        Args:
+            lines: Строки без символов перевода строки
+            filename: Имя файла для колонки filename
+            first_line_number: Номер первой строки в файле
+            miner: Майнер шаблонов (колонка template_id)
+
+        Returns:
+            Список распарсенных строк (как строки DataFrame из parse_log_files)
+        """
+        parsed_lines = []
+        for line_num, line in enumerate(lines, first_line_number):
+            parsed = self._parse_log_line(line.strip())
+            if parsed:
+                parsed['filename'] = filename
+                parsed['line_number'] = line_num
+                parsed['full_line'] = line.strip()
+                if miner is not None:
+                    parsed['template_id'] = miner.add(parsed['text'])
+                parsed_lines.append(parsed)
+        LINES_READ.inc(len(lines))
+        LINES_PARSED.inc(len(parsed_lines))
+        return parsed_lines
+
+    def parse_log_file_from(self, file_path: str, offset: int = 0,
+                            first_line_number: int = 1) -> Tuple[pd.DataFrame, int, int]:
+        """Парсит файл начиная с байтового смещения (хвост дописываемого лога).
+
+        Смещение должно указывать на начало строки (значение, возвращенное
+        предыдущим вызовом). Незавершенная последняя строка (без перевода
+        строки) парсится, но в возвращаемое смещение не входит - при следующем
+        вызове она будет прочитана целиком.
+
+        Args:
+            file_path: Путь к файлу логов
+            offset: Смещение начала чтения в байтах
+            first_line_number: Номер строки, с которой начинается смещение
+
+        Returns:
+            (DataFrame новых строк, смещение после последней завершенной строки,
+            число завершенных строк в файле)
+        """
+        with open(file_path, 'rb') as file:
+            file.seek(offset)
+            data = file.read()
+
+        complete_size = data.rfind(b'\n') + 1
+        try:
+            complete_text = data[:complete_size].decode('utf-8')
+            partial_text = data[complete_size:].decode('utf-8')
+        except UnicodeDecodeError:
+            logger.warning(f"Ошибка кодировки файла {file_path}. Попробую другую кодировку.")
+            complete_text = data[:complete_size].decode('latin-1')
+            partial_text = data[complete_size:].decode('latin-1')
+
+        complete_lines = complete_text.splitlines()
+        lines = complete_lines + partial_text.splitlines()
+        miner = TemplateMiner(self.template_similarity, self.template_depth) if self.mine_templates else None
+        parsed_lines = self.parse_lines(lines, Path(file_path).name, first_line_number, miner)
+        logger.info(
+            f"Файл {Path(file_path).name}: с байта {offset} прочитано {len(lines)} строк, "
+            f"найдено {len(parsed_lines)} валидных строк логов"
+        )
+
+        df = pd.DataFrame(parsed_lines)
+        if miner is not None and not df.empty:
+            df['template'], df['params'] = miner.annotate(df['text'], df['template_id'])
+        return df, offset + complete_size, first_line_number - 1 + len(complete_lines)
 
     def extract_zip(self, zip_path: str, extract_dir: Optional[str] = None) -> List[str]:
         """Извлекает файлы из ZIP архива (синхронная версия для API).
@@ -187,6 +304,7 @@ class LogParser:
                 'sources': [],
                 'time_range': None,
                 'top_messages': [],
+                'top_templates': [],
                 'level_distribution': {}
             }
 
@@ -217,6 +335,15 @@ class LogParser:
         # Топ сообщений
         top_messages = df['text'].value_counts().head(5).to_dict()
 
+        # Топ шаблонов (если парсер выделял шаблоны)
+        top_templates = []
+        if 'template_id' in df.columns:
+            template_counts = df.groupby(['template_id', 'template'], sort=False).size()
+            top_templates = [
+                {'template_id': int(template_id), 'template': template, 'count': int(count)}
+                for (template_id, template), count in template_counts.nlargest(10).items()
+            ]
+
         return {
             'total_lines': total_lines,
             'error_count': error_count,
@@ -225,6 +352,7 @@ class LogParser:
             'sources': sources,
             'time_range': time_range,
             'top_messages': top_messages,
+            'top_templates': top_templates,
             'level_distribution': level_distribution
         }
 
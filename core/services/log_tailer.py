@@ -0,0 +1,209 @@
+"""Чтение дописываемых логов (tail -f) для потокового анализа.
+
+LogTailer следит за файлом или директорией с логами: при каждом poll()
+читает только новые байты с сохраненного смещения и отдает распарсенные
+строки. Незавершенная последняя строка ждет следующего чтения (строка без
+перевода длиннее max_read_bytes обрезается, остаток до перевода строки
+пропускается). Чтение "с конца" начинается с последней полной строки. Усечение
+файла (размер меньше смещения) и ротация (сменился inode) начинают чтение
+заново с начала файла.
+
+Изменения отслеживаются опросом stat; если установлен watchdog, события
+файловой системы будят ожидание раньше интервала опроса (on_change).
+"""
+
+import logging
+import os
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .log_parser import LogParser
+
+logger = logging.getLogger(__name__)
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
+
+LOG_SUFFIXES = (".log", ".txt")
+
+
+@dataclass
+class _FileCursor:
+    """Позиция чтения файла."""
+
+    inode: int
+    offset: int = 0
+    line_number: int = 0
+    partial: bytes = b""
+    # Пропуск остатка обрезанной слишком длинной строки до перевода строки
+    skip_line: bool = False
+
+
+class LogTailer:
+    """Инкрементальное чтение новых строк файла или директории с логами."""
+
+    def __init__(
+        self,
+        path: str,
+        parser: Optional[LogParser] = None,
+        from_start: bool = False,
+        max_read_bytes: int = 1024 * 1024,
+        on_change: Optional[Callable[[], None]] = None,
+    ):
+        """Инициализация.
+
+        Args:
+            path: Файл или директория (файлы .log/.txt верхнего уровня)
+            parser: Парсер строк (по умолчанию LogParser())
+            from_start: Читать существующее содержимое (иначе - только новые строки)
+            max_read_bytes: Максимум байт за один poll() на файл (небольшие батчи)
+                и длина строки без перевода, после которой она обрезается
+            on_change: Вызывается из потока watchdog при изменении файлов
+
+        Raises:
+            FileNotFoundError: Если пути нет
+        """
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self.path = path
+        self.parser = parser or LogParser()
+        self.max_read_bytes = max_read_bytes
+        self.on_change = on_change
+        self._cursors: Dict[str, _FileCursor] = {}
+        self._observer = None
+
+        for file_path in self._files():
+            stat = os.stat(file_path)
+            cursor = _FileCursor(inode=stat.st_ino)
+            if not from_start:
+                cursor.line_number, cursor.offset = self._complete_lines(file_path, stat.st_size)
+            self._cursors[file_path] = cursor
+
+    @staticmethod
+    def _complete_lines(file_path: str, size: int) -> Tuple[int, int]:
+        """Число полных строк в первых size байтах и смещение после последней из них.
+
+        Недописанная последняя строка не пропускается: чтение начнется с ее
+        начала, и она придет целиком (номера новых строк продолжают файл).
+        """
+        count = 0
+        end = 0
+        position = 0
+        with open(file_path, "rb") as f:
+            remaining = size
+            while remaining > 0:
+                chunk = f.read(min(remaining, 1024 * 1024))
+                if not chunk:
+                    break
+                newlines = chunk.count(b"\n")
+                if newlines:
+                    count += newlines
+                    end = position + chunk.rfind(b"\n") + 1
+                position += len(chunk)
+                remaining -= len(chunk)
+        return count, end
+
+    def _files(self) -> List[str]:
+        if os.path.isdir(self.path):
+            return sorted(
+                entry.path for entry in os.scandir(self.path)
+                if entry.is_file() and entry.name.endswith(LOG_SUFFIXES)
+            )
+        return [self.path]
+
+    @property
+    def files(self) -> List[str]:
+        return list(self._cursors)
+
+    def poll(self) -> List[Dict]:
+        """Читает новые строки всех файлов.
+
+        Returns:
+            Распарсенные строки (filename, line_number, full_line, level, ...)
+        """
+        records = []
+        files = self._files() if os.path.isdir(self.path) else [self.path]
+        for file_path in files:
+            try:
+                records.extend(self._read_new(file_path))
+            except FileNotFoundError:
+                # Файл удален/переименован при ротации - новый появится под тем же именем
+                self._cursors.pop(file_path, None)
+            except OSError as e:
+                logger.warning(f"Ошибка чтения {file_path}: {e}")
+        return records
+
+    def _read_new(self, file_path: str) -> List[Dict]:
+        stat = os.stat(file_path)
+        cursor = self._cursors.get(file_path)
+        if cursor is None:
+            # Новый файл в директории (или после ротации) - читаем с начала
+            cursor = self._cursors[file_path] = _FileCursor(inode=stat.st_ino)
+        elif cursor.inode != stat.st_ino or stat.st_size < cursor.offset:
+            logger.info(f"🔄 {file_path}: ротация или усечение, читаю с начала")
+            cursor = self._cursors[file_path] = _FileCursor(inode=stat.st_ino)
+
+        if stat.st_size == cursor.offset:
+            return []
+
+        with open(file_path, "rb") as f:
+            f.seek(cursor.offset)
+            data = f.read(self.max_read_bytes)
+        cursor.offset += len(data)
+
+        data = cursor.partial + data
+        if cursor.skip_line:
+            newline = data.find(b"\n")
+            if newline < 0:
+                cursor.partial = b""
+                return []
+            data = data[newline + 1:]
+            cursor.skip_line = False
+        lines = data.split(b"\n")
+        # Последний элемент - незавершенная строка (или b"" после перевода строки)
+        cursor.partial = lines.pop()
+        if len(cursor.partial) > self.max_read_bytes:
+            # Строка без перевода (бинарный файл, бесконечная строка) не копится в памяти
+            logger.warning(
+                f"⚠️ {file_path}: строка длиннее {self.max_read_bytes} байт без перевода строки, обрезана"
+            )
+            lines.append(cursor.partial[:self.max_read_bytes])
+            cursor.partial = b""
+            cursor.skip_line = True
+        if not lines:
+            return []
+
+        first_line_number = cursor.line_number + 1
+        cursor.line_number += len(lines)
+        texts = [line.decode("utf-8", errors="replace").rstrip("\r") for line in lines]
+        return self.parser.parse_lines(texts, os.path.basename(file_path), first_line_number)
+
+    def start_watching(self) -> bool:
+        """Подписывается на события файловой системы (если установлен watchdog).
+
+        Returns:
+            True, если наблюдатель запущен
+        """
+        if not WATCHDOG_AVAILABLE or self.on_change is None or self._observer is not None:
+            return False
+        on_change = self.on_change
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                on_change()
+
+        directory = self.path if os.path.isdir(self.path) else os.path.dirname(os.path.abspath(self.path))
+        self._observer = Observer()
+        self._observer.schedule(_Handler(), directory, recursive=False)
+        self._observer.daemon = True
+        self._observer.start()
+        return True
+
+    def close(self) -> None:
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
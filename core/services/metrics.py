@@ -0,0 +1,320 @@
+"""Метрики производительности в формате Prometheus.
+
+Счетчики и гистограммы пишутся из горячих путей парсера и ML анализатора,
+поэтому запись сделана без блокировок: у каждого потока свои ячейки
+значений (threading.local), и пишет в них только этот поток. Блокировка
+берется один раз - при первом обращении потока к метрике, а при сборке
+(/metrics) ячейки всех потоков суммируются, ячейки завершившихся потоков
+сливаются в общую базу. Значения, которые дешевле
+прочитать в момент сборки (RSS, размер кэша), задаются функциями.
+"""
+
+import bisect
+import math
+import threading
+import weakref
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Границы гистограмм по умолчанию
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+SIZE_BUCKETS = (1, 8, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+BYTES_BUCKETS = tuple(1024 * 4 ** power for power in range(11))  # 1 KB .. 1 GB
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _Child:
+    """Значение метрики для одного набора меток: ячейки по потокам.
+
+    Ячейки завершившихся потоков (anyio закрывает простаивающие потоки
+    пула) сливаются в общую базу, поэтому число ячеек не растет со временем.
+    """
+
+    __slots__ = ("_size", "_local", "_cells", "_base", "_lock")
+
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._cells: List[Tuple[weakref.ref, List[float]]] = []
+        self._base = [0.0] * size
+        self._lock = threading.Lock()
+
+    def _cell(self) -> List[float]:
+        cell = getattr(self._local, "cell", None)
+        if cell is None:
+            cell = [0.0] * self._size
+            with self._lock:
+                self._merge_dead()
+                self._cells.append((weakref.ref(threading.current_thread()), cell))
+            self._local.cell = cell
+        return cell
+
+    def _merge_dead(self) -> None:
+        """Переносит ячейки завершившихся потоков в базу (под self._lock)."""
+        alive = []
+        for thread_ref, cell in self._cells:
+            thread = thread_ref()
+            if thread is not None and thread.is_alive():
+                alive.append((thread_ref, cell))
+                continue
+            # Поток завершился - в его ячейку больше никто не пишет
+            for position, value in enumerate(cell):
+                self._base[position] += value
+        self._cells = alive
+
+    def totals(self) -> List[float]:
+        """Суммы ячеек всех потоков (в том числе завершившихся)."""
+        with self._lock:
+            self._merge_dead()
+            totals = list(self._base)
+            cells = [cell for _, cell in self._cells]
+        for cell in cells:
+            for position, value in enumerate(cell):
+                totals[position] += value
+        return totals
+
+
+class CounterChild(_Child):
+    __slots__ = ()
+
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._cell()[0] += amount
+
+
+class GaugeChild(CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._cell()[0] -= amount
+
+    @contextmanager
+    def track(self):
+        """+1 на время блока (например, запросы в работе)."""
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+
+class HistogramChild(_Child):
+    __slots__ = ("buckets",)
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        # Ячейка: счетчики корзин (последняя - +Inf), сумма, число наблюдений
+        super().__init__(len(buckets) + 3)
+        self.buckets = buckets
+
+    def observe(self, value: float) -> None:
+        cell = self._cell()
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    @contextmanager
+    def time(self):
+        """Наблюдает длительность блока в секундах (работает и как декоратор)."""
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - started)
+
+
+class _Metric:
+    """Метрика с именем, описанием и (необязательно) метками."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], _Child] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self) -> _Child:
+        raise NotImplementedError
+
+    def labels(self, *values) -> _Child:
+        """Значение метрики для набора меток (создается при первом обращении)."""
+        key = tuple(map(str, values)) if values else ()
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}, получено {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _items(self) -> List[Tuple[Tuple[str, ...], _Child]]:
+        with self._lock:
+            return list(self._children.items())
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Монотонный счетчик."""
+
+    kind = "counter"
+
+    def _new_child(self) -> CounterChild:
+        return CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Увеличивает счетчик без меток."""
+        self.labels().inc(amount)
+
+    def samples(self) -> Iterable[str]:
+        for key, child in self._items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.totals()[0])}"
+
+
+class Gauge(_Metric):
+    """Текущее значение: inc/dec из кода или функция, вызываемая при сборке.
+
+    Функция возвращает число (метрика без меток) или словарь
+    {кортеж значений меток: число}.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], object]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def _new_child(self) -> GaugeChild:
+        return GaugeChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def samples(self) -> Iterable[str]:
+        if self.function is None:
+            values = [(key, child.totals()[0]) for key, child in self._items()]
+        else:
+            result = self.function()
+            if isinstance(result, dict):
+                values = [(tuple(str(value) for value in key), number) for key, number in result.items()]
+            else:
+                values = [((), result)]
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """Распределение наблюдений по корзинам (с суммой и числом)."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> HistogramChild:
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        """Наблюдение для метрики без меток."""
+        self.labels().observe(value)
+
+    def samples(self) -> Iterable[str]:
+        for key, child in self._items():
+            totals = child.totals()
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (math.inf,), totals):
+                cumulative += count
+                labels = _format_labels(self.labelnames + ("le",), key + (_format_value(bound),))
+                yield f"{self.name}_bucket{labels} {_format_value(cumulative)}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(totals[-2])}"
+            yield f"{self.name}_count{labels} {_format_value(totals[-1])}"
+
+
+class MetricsRegistry:
+    """Набор метрик процесса и их вывод в текстовом формате Prometheus."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Повторная регистрация (перезагрузка модуля) - та же метрика
+                if type(existing) is not type(metric):
+                    raise ValueError(f"Метрика {metric.name} уже зарегистрирована как {existing.kind}")
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              function: Optional[Callable[[], object]] = None) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DURATION_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus 0.0.4."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+# Реестр процесса: метрики парсера и анализатора регистрируются здесь, API добавляет свои
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "logmonitor_stage_duration_seconds", "Длительность этапов анализа", ("stage",)
+)
+STAGE_PEAK_BYTES = REGISTRY.histogram(
+    "logmonitor_stage_peak_memory_bytes", "Пик памяти этапа над уровнем на его начале (tracemalloc)",
+    ("stage",), BYTES_BUCKETS
+)
+LINES_READ = REGISTRY.counter("logmonitor_lines_read_total", "Прочитано строк логов")
+LINES_PARSED = REGISTRY.counter("logmonitor_lines_parsed_total", "Распознано строк логов")
+ENCODER_BATCH_SIZE = REGISTRY.histogram(
+    "logmonitor_encoder_batch_size", "Текстов в одном вызове энкодера", ("path",), SIZE_BUCKETS
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "logmonitor_cache_requests_total", "Обращения к кэшам (hit/miss)", ("cache", "result")
+)
@@ -1,221 +1,628 @@
-"""ML анализатор логов - логика коллеги без изменений.
-
-Этот модуль содержит точную копию логики из src/bot/services/ml_log_analyzer.py
-для использования как в боте, так и в API.
+"""ML анализатор логов для бота и API.
+
+Основа - логика из src/bot/services/ml_log_analyzer.py (семантическое
+сходство WARNING строк со словарем аномалий), переработанная под API:
+точные и нормализованные совпадения без модели, кодирование только
+уникальных текстов (с кэшами эмбеддингов словаря и WARNING), top-k поиск
+по матрице сходства или IVF индексу и результат в виде MatchState, из
+которого находки собираются для любого порога без повторного инференса.
 """
 
+import hashlib
 import logging
-from typing import Dict
-
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
 import pandas as pd
-from sentence_transformers import SentenceTransformer, util
+
+from .ann_index import IVFIndex
+from .embedding_cache import EmbeddingCache
+from .encoders import DEFAULT_MODEL_NAME, EncoderBackend, create_encoder
+from .findings import MatchState
+from .inference_scheduler import InferenceScheduler
+from .metrics import CACHE_REQUESTS, ENCODER_BATCH_SIZE, STAGE_SECONDS
+from .progress import NULL_PROGRESS, STAGE_ENCODING, STAGE_MATCHING, STAGE_SEARCH, ProgressReporter
+from .text_normalizer import TextNormalizer
+from .timing import span
 
 logger = logging.getLogger(__name__)
 
+# Сколько разных словарей аномалий держать закодированными в памяти
+DICTIONARY_CACHE_SIZE = 8
+
+# Сколько WARNING строк сопоставлять со словарем за одно матричное умножение
+MATCH_CHUNK_SIZE = 4096
+
+# По сколько текстов кодировать, когда нужен прогресс кодирования (иначе - одним вызовом)
+PROGRESS_ENCODE_CHUNK = 2048
+
+_ENCODE_SECONDS = STAGE_SECONDS.labels("encode")
+_MATCH_SECONDS = STAGE_SECONDS.labels("match")
+_DIRECT_BATCH_SIZE = ENCODER_BATCH_SIZE.labels("direct")
+_EMBEDDING_HITS = CACHE_REQUESTS.labels("embeddings", "hit")
+_EMBEDDING_MISSES = CACHE_REQUESTS.labels("embeddings", "miss")
+_DICTIONARY_HITS = CACHE_REQUESTS.labels("dictionary", "hit")
+_DICTIONARY_MISSES = CACHE_REQUESTS.labels("dictionary", "miss")
+
+
+@dataclass(frozen=True)
+class AnalysisOptions:
+    """Параметры одного анализа.
+
+    Передаются в analyze_logs_with_ml при каждом вызове, поэтому параллельные
+    запросы с разными порогами не мешают друг другу через общий анализатор.
+
+    Attributes:
+        similarity_threshold: Порог сходства для сопоставления WARNING с аномалией
+        new_anomaly_floor: Минимальный score новой аномалии (ниже порога), чтобы попасть в результат
+        model_name: Модель кодирования (None - модель анализатора по умолчанию)
+        top_k: Сколько ближайших аномалий словаря проверять для каждой WARNING строки
+    """
+
+    similarity_threshold: float = 0.7
+    new_anomaly_floor: float = 0.5
+    model_name: Optional[str] = None
+    top_k: int = 1
+
+
+def normalize_match_text(texts: pd.Series) -> pd.Series:
+    """Ключ нормализованного совпадения: схлопнутые пробелы и casefold."""
+    return texts.astype(str).str.replace(r"\s+", " ", regex=True).str.strip().str.casefold()
+
+
+def _save_array(path: str, array: np.ndarray) -> None:
+    """Атомарно сохраняет массив в .npy (параллельные воркеры не видят полузаписанный файл)."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".npy")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
 
 class MLLogAnalyzer:
     """ML анализатор логов с использованием трансформеров.
     
-    Логика написана коллегой и используется без изменений.
+    Сопоставление WARNING строк со словарем (match_warnings) дает MatchState
+    с top-k массивами совпадений, находки строятся из него. Анализатор не хранит состояние запроса: модели и кэши эмбеддингов общие,
+    а параметры анализа передаются через AnalysisOptions.
     """
 
-    def __init__(self, similarity_threshold: float = 0.7):
+    def __init__(
+        self,
+        similarity_threshold: float = 0.7,
+        encoder_backend: str = "torch",
+        model_name: str = DEFAULT_MODEL_NAME,
+        onnx_cache_dir: Optional[str] = None,
+        dynamic_batching: bool = False,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+        embedding_cache_dir: Optional[str] = None,
+        ann_index: bool = False,
+        ann_min_dictionary_size: int = 20000,
+        ann_lists: int = 0,
+        ann_probe: int = 8,
+        exact_match: bool = True,
+        normalized_match: bool = True,
+        encode_templates: bool = True,
+        text_normalizer: Optional[TextNormalizer] = None,
+        embedding_cache_size: int = 0,
+    ):
         """Инициализация ML анализатора.
 
         Args:
-            similarity_threshold: Порог уверенности для сопоставления аномалий
+            similarity_threshold: Порог по умолчанию, если AnalysisOptions не переданы
+            encoder_backend: Бэкенд кодирования (torch, torch-int8, onnx, onnx-int8, hashing)
+            model_name: Имя модели sentence-transformers по умолчанию
+            onnx_cache_dir: Директория кэша экспортированных ONNX моделей
+            dynamic_batching: Кодировать через общий планировщик инференса,
+                который объединяет запросы параллельных анализов в батчи
+            max_batch_size: Максимальный размер динамического батча
+            max_wait_ms: Максимальное ожидание добора батча (мс)
+            embedding_cache_dir: Директория дискового кэша эмбеддингов словарей
+                и ANN индексов (None - только в памяти)
+            ann_index: Искать по большим словарям через приближенный IVF индекс
+            ann_min_dictionary_size: С какого размера словаря использовать индекс
+            ann_lists: Число кластеров индекса (0 - ~sqrt(размер словаря))
+            ann_probe: Сколько кластеров просматривать (больше - точнее и медленнее)
+            exact_match: Сопоставлять дословные копии аномалий словаря без модели
+            normalized_match: То же с точностью до регистра и пробелов (модель
+                по умолчанию регистронезависима, поэтому результат не меняется)
+            encode_templates: Кодировать шаблоны сообщений вместо сырых строк,
+                если парсер выделил шаблоны (колонка template)
+            text_normalizer: Маскирование параметров в WARNING перед кодированием -
+                маскированный текст становится ключом дедупликации и кэша
+            embedding_cache_size: Размер LRU кэша эмбеддингов WARNING между
+                анализами (0 - без кэша)
         """
         self.similarity_threshold = similarity_threshold
-        self.model = None
-
-    def _load_model(self):
-        """Загружает модель трансформеров."""
-        if self.model is None:
-            logger.info("Загружаю модель sentence-transformers...")
+        self.encoder_backend = encoder_backend
+        self.model_name = model_name
+        self.onnx_cache_dir = onnx_cache_dir
+        self.dynamic_batching = dynamic_batching
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.embedding_cache_dir = embedding_cache_dir
+        self.ann_index = ann_index
+        self.ann_min_dictionary_size = ann_min_dictionary_size
+        self.ann_lists = ann_lists
+        self.ann_probe = ann_probe
+        self.exact_match = exact_match
+        self.normalized_match = normalized_match
+        self.encode_templates = encode_templates
+        self.text_normalizer = text_normalizer
+        self.embedding_cache = EmbeddingCache(embedding_cache_size) if embedding_cache_size > 0 else None
+        self._encoders: Dict[str, EncoderBackend] = {}
+        self._schedulers: Dict[str, InferenceScheduler] = {}
+        self._model_lock = threading.Lock()
+        # Эмбеддинги словарей аномалий по (модель, хэш текстов) - словарь обычно один и тот же
+        self._dictionary_cache: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        # Таблицы точного/нормализованного поиска по хэшу текстов словаря
+        self._lookup_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        # ANN индексы по тем же ключам - строятся один раз на словарь
+        self._index_cache: "OrderedDict[tuple, IVFIndex]" = OrderedDict()
+
+    @property
+    def model(self) -> Optional[EncoderBackend]:
+        """Бэкенд кодирования модели по умолчанию (None, если еще не загружен)."""
+        return self._encoders.get(self.model_name)
+
+    @model.setter
+    def model(self, encoder: Optional[EncoderBackend]):
+        if encoder is None:
+            self._encoders.pop(self.model_name, None)
+        else:
+            self._encoders[self.model_name] = encoder
+
+    def _get_encoder(self, model_name: Optional[str] = None) -> EncoderBackend:
+        """Возвращает бэкенд кодирования модели, загружая его при первом обращении."""
+        model_name = model_name or self.model_name
+        encoder = self._encoders.get(model_name)
+        if encoder is not None:
+            return encoder
+        with self._model_lock:
+            encoder = self._encoders.get(model_name)
+            if encoder is not None:
+                return encoder
+            logger.info(f"Загружаю модель {model_name} (бэкенд {self.encoder_backend})...")
             try:
-                self.model = SentenceTransformer("all-MiniLM-L6-v2")
+                # Бэкенды импортируют torch/onnxruntime только при создании,
+                # поэтому импорт модуля остается быстрым
+                options = {}
+                if self.encoder_backend.startswith("onnx") and self.onnx_cache_dir:
+                    options["cache_dir"] = self.onnx_cache_dir
+                encoder = create_encoder(self.encoder_backend, model_name, **options)
+                self._encoders[model_name] = encoder
                 logger.info("Модель загружена успешно")
             except Exception as e:
                 logger.error(f"Ошибка загрузки модели: {e}")
                 raise
+        return encoder
 
-    def analyze_logs_with_ml(self, logs_df: pd.DataFrame, anomalies_problems_df: pd.DataFrame) -> pd.DataFrame:
-        """Анализирует логи с использованием ML-модуля.
+    def _load_model(self):
+        """Загружает модель по умолчанию."""
+        self._get_encoder()
+
+    def warm_up(self):
+        """Загружает модель и выполняет пробный encode.
+
+        Первый encode инициализирует токенизатор и аллокаторы torch, поэтому
+        делаем его заранее, чтобы первый пользовательский запрос не платил за это.
+        """
+        self._get_encoder().warm_up()
+        logger.info("Модель прогрета")
+
+    def _encode(self, texts: List[str], batch_size: int = 32, model_name: Optional[str] = None,
+                stage: str = "warning_encode") -> np.ndarray:
+        """Кодирует тексты: через планировщик инференса или напрямую бэкендом.
+
+        stage - имя этапа в разбивке времени запроса (dictionary_encode или warning_encode).
+        """
+        model_name = model_name or self.model_name
+        encoder = self._get_encoder(model_name)
+        started = time.perf_counter()
+        try:
+            with span(stage, texts=len(texts)):
+                if not self.dynamic_batching:
+                    _DIRECT_BATCH_SIZE.observe(len(texts))
+                    return encoder.encode(texts, batch_size=batch_size)
+                return self._scheduler(encoder, model_name, batch_size).encode(texts, batch_size=batch_size)
+        finally:
+            _ENCODE_SECONDS.observe(time.perf_counter() - started)
+
+    def _scheduler(self, encoder: EncoderBackend, model_name: str, batch_size: int) -> InferenceScheduler:
+        """Планировщик инференса модели (создается при первом обращении)."""
+        scheduler = self._schedulers.get(model_name)
+        if scheduler is None:
+            with self._model_lock:
+                scheduler = self._schedulers.get(model_name)
+                if scheduler is None:
+                    scheduler = InferenceScheduler(
+                        encoder,
+                        max_batch_size=self.max_batch_size,
+                        max_wait_ms=self.max_wait_ms,
+                        encode_batch_size=batch_size,
+                    )
+                    self._schedulers[model_name] = scheduler
+        return scheduler
+
+    def stop_schedulers(self):
+        """Останавливает потоки планировщиков инференса (shutdown, перед fork)."""
+        with self._model_lock:
+            schedulers = list(self._schedulers.values())
+            self._schedulers.clear()
+        for scheduler in schedulers:
+            scheduler.stop()
+
+    @staticmethod
+    def dictionary_key(anomaly_texts: List[str]) -> str:
+        """Ключ словаря аномалий: хэш всех текстов в порядке строк."""
+        digest = hashlib.sha1()
+        for text in anomaly_texts:
+            digest.update(text.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _dictionary_cache_path(self, model_name: str, key: str, suffix: str) -> Optional[str]:
+        """Путь к файлу дискового кэша словаря (None, если кэш выключен)."""
+        if not self.embedding_cache_dir:
+            return None
+        return os.path.join(
+            self.embedding_cache_dir, self.encoder_backend, model_name.replace("/", "__"), f"{key}{suffix}"
+        )
+
+    def encode_dictionary(self, anomaly_texts: List[str], model_name: Optional[str] = None) -> np.ndarray:
+        """Возвращает эмбеддинги словаря аномалий, кодируя каждый словарь один раз.
+
+        Args:
+            anomaly_texts: Тексты аномалий из словаря (в порядке строк)
+            model_name: Модель кодирования (None - по умолчанию)
+
+        Returns:
+            Матрица нормализованных эмбеддингов
+        """
+        model_name = model_name or self.model_name
+        key = (model_name, self.dictionary_key(anomaly_texts))
+        embeddings = self._dictionary_cache.get(key)
+        if embeddings is not None:
+            _DICTIONARY_HITS.inc()
+        else:
+            _DICTIONARY_MISSES.inc()
+            cache_path = self._dictionary_cache_path(model_name, key[1], ".npy")
+            if cache_path and os.path.exists(cache_path):
+                embeddings = np.load(cache_path)
+                logger.info(f"Эмбеддинги словаря ({len(anomaly_texts)} записей) загружены из кэша")
+            else:
+                logger.info(f"Кодирую словарь аномалий ({len(anomaly_texts)} записей)")
+                embeddings = self._encode(anomaly_texts, model_name=model_name, stage="dictionary_encode")
+                if cache_path:
+                    _save_array(cache_path, embeddings)
+            with self._model_lock:
+                self._dictionary_cache[key] = embeddings
+                while len(self._dictionary_cache) > DICTIONARY_CACHE_SIZE:
+                    self._dictionary_cache.popitem(last=False)
+        return embeddings
+
+    def dictionary_index(
+        self,
+        anomaly_texts: List[str],
+        embeddings: np.ndarray,
+        model_name: Optional[str] = None,
+    ) -> Optional[IVFIndex]:
+        """Возвращает ANN индекс словаря (None, если индекс выключен или словарь мал).
+
+        Индекс строится один раз на словарь и сохраняется рядом с кэшем эмбеддингов.
+        """
+        if not self.ann_index or len(embeddings) < self.ann_min_dictionary_size:
+            return None
+        model_name = model_name or self.model_name
+        key = (model_name, self.dictionary_key(anomaly_texts))
+        index = self._index_cache.get(key)
+        if index is not None:
+            return index
+
+        cache_path = self._dictionary_cache_path(model_name, key[1], f".ivf{self.ann_lists or ''}.npz")
+        if cache_path and os.path.exists(cache_path):
+            try:
+                index = IVFIndex.load(cache_path, embeddings, n_probe=self.ann_probe)
+                logger.info(f"ANN индекс словаря загружен из кэша ({index.n_lists} кластеров)")
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Не удалось загрузить ANN индекс {cache_path}: {e}")
+        if index is None:
+            logger.info(f"Строю ANN индекс для словаря из {len(embeddings)} аномалий...")
+            index = IVFIndex.build(embeddings, n_lists=self.ann_lists, n_probe=self.ann_probe)
+            logger.info(f"ANN индекс построен: {index.n_lists} кластеров, n_probe={index.n_probe}")
+            if cache_path:
+                index.save(cache_path)
+        with self._model_lock:
+            self._index_cache[key] = index
+            while len(self._index_cache) > DICTIONARY_CACHE_SIZE:
+                self._index_cache.popitem(last=False)
+        return index
+
+    def _dictionary_lookup_tables(self, anomaly_texts: List[str]):
+        """Таблицы текст -> первая строка словаря: точная и нормализованная (кэшируются)."""
+        key = self.dictionary_key(anomaly_texts)
+        tables = self._lookup_cache.get(key)
+        if tables is None:
+            rows = np.arange(len(anomaly_texts))
+            texts = pd.Series(anomaly_texts)
+            # drop_duplicates оставляет первое вхождение - как argmax при равных score
+            exact = pd.Series(rows, index=texts).loc[~texts.duplicated().to_numpy()]
+            normalized_texts = normalize_match_text(texts)
+            normalized = pd.Series(rows, index=normalized_texts).loc[~normalized_texts.duplicated().to_numpy()]
+            tables = (exact, normalized)
+            with self._model_lock:
+                self._lookup_cache[key] = tables
+                while len(self._lookup_cache) > DICTIONARY_CACHE_SIZE:
+                    self._lookup_cache.popitem(last=False)
+        return tables
+
+    def _lookup_dictionary(self, warning_texts: pd.Series, anomaly_texts: List[str]):
+        """Находит строки словаря для WARNING по точному и нормализованному тексту.
+
+        Returns:
+            (номер строки словаря или -1 для каждой WARNING, число точных, число нормализованных)
+        """
+        rows = np.full(len(warning_texts), -1, dtype=np.int64)
+        if not self.exact_match:
+            return rows, 0, 0
+        exact_table, normalized_table = self._dictionary_lookup_tables(anomaly_texts)
+
+        rows[:] = warning_texts.map(exact_table).fillna(-1).to_numpy(dtype=np.int64)
+        exact_count = int((rows >= 0).sum())
+
+        normalized_count = 0
+        pending = np.nonzero(rows < 0)[0]
+        if self.normalized_match and len(pending):
+            normalized_rows = (
+                normalize_match_text(warning_texts.iloc[pending]).map(normalized_table).fillna(-1).to_numpy(dtype=np.int64)
+            )
+            rows[pending] = normalized_rows
+            normalized_count = int((normalized_rows >= 0).sum())
+        return rows, exact_count, normalized_count
+
+    def _encode_keys(self, warning_logs: pd.DataFrame, warning_texts: pd.Series, rows: np.ndarray) -> pd.Series:
+        """Ключи кодирования WARNING строк: шаблон, маскированный текст или сам текст."""
+        if self.encode_templates and "template" in warning_logs.columns:
+            return warning_logs["template"].iloc[rows].astype(str)
+        texts = warning_texts.iloc[rows]
+        if self.text_normalizer is not None:
+            sources = warning_logs["source"].iloc[rows] if "source" in warning_logs.columns else None
+            return self.text_normalizer.normalize(texts, sources)
+        return texts
+
+    def _encode_with_progress(self, texts: List[str], model_name: str, progress: ProgressReporter) -> np.ndarray:
+        """Кодирует тексты; при включенном прогрессе - частями с отчетом после каждой."""
+        if not progress.enabled or len(texts) <= PROGRESS_ENCODE_CHUNK:
+            return self._encode(texts, batch_size=32, model_name=model_name)
+        parts = []
+        for start in range(0, len(texts), PROGRESS_ENCODE_CHUNK):
+            parts.append(self._encode(texts[start:start + PROGRESS_ENCODE_CHUNK], batch_size=32, model_name=model_name))
+            done = min(start + PROGRESS_ENCODE_CHUNK, len(texts))
+            progress.update(encoded=done, to_encode=len(texts), batches=len(parts), texts_per_sec=progress.rate(done))
+        return np.vstack(parts)
+
+    def _encode_unique(self, keys: List[str], model_name: Optional[str] = None,
+                       progress: ProgressReporter = NULL_PROGRESS):
+        """Кодирует уникальные ключи через LRU кэш эмбеддингов (если он включен).
+
+        Returns:
+            (матрица эмбеддингов в порядке keys, число попаданий в кэш)
+        """
+        model_name = model_name or self.model_name
+        if self.embedding_cache is None:
+            logger.info(f"⚡ Batch encoding {len(keys)} уникальных текстов...")
+            progress.stage(STAGE_ENCODING, to_encode=len(keys), encoded=0)
+            return self._encode_with_progress(keys, model_name, progress), 0
+
+        def encode_missing(texts: List[str]) -> np.ndarray:
+            logger.info(f"⚡ Batch encoding {len(texts)} уникальных текстов (нет в кэше)...")
+            progress.stage(STAGE_ENCODING, to_encode=len(texts), encoded=0, cache_hits=len(keys) - len(texts))
+            return self._encode_with_progress(texts, model_name, progress)
+
+        embeddings, hits = self.embedding_cache.encode(model_name, keys, encode_missing)
+        _EMBEDDING_HITS.inc(hits)
+        _EMBEDDING_MISSES.inc(len(keys) - hits)
+        return embeddings, hits
+
+    @staticmethod
+    def _top_k_matches(
+        warning_embeddings: np.ndarray,
+        anomaly_embeddings: np.ndarray,
+        top_k: int,
+        chunk_size: int = MATCH_CHUNK_SIZE,
+    ):
+        """Точный поиск top-k ближайших аномалий словаря для каждой строки.
+
+        Эмбеддинги нормализованы, поэтому косинусное сходство - скалярное
+        произведение. Матрица сходства считается кусками по chunk_size строк.
+
+        Returns:
+            (индексы, score) формы (n_warnings, k), по убыванию score
+        """
+        n = len(warning_embeddings)
+        k = min(top_k, len(anomaly_embeddings))
+        indices = np.zeros((n, k), dtype=np.int32)
+        scores = np.zeros((n, k), dtype=np.float32)
+        if n == 0 or k == 0:
+            return indices, scores
+
+        for start in range(0, n, chunk_size):
+            end = min(start + chunk_size, n)
+            similarity = warning_embeddings[start:end] @ anomaly_embeddings.T
+            if k == 1:
+                best = similarity.argmax(axis=1)
+                indices[start:end, 0] = best
+                scores[start:end, 0] = similarity[np.arange(end - start), best]
+                continue
+            # Все кандидаты не хуже k-го score; при равенстве побеждает меньший индекс
+            kth_scores = -np.partition(-similarity, k - 1, axis=1)[:, k - 1]
+            above = similarity >= kth_scores[:, None]
+            counts = above.sum(axis=1)
+            exact = counts == k
+            if exact.any():
+                candidates = np.nonzero(above[exact])[1].reshape(-1, k)
+                candidate_scores = np.take_along_axis(similarity[exact], candidates, axis=1)
+                order = np.lexsort((candidates, -candidate_scores), axis=1)
+                rows = np.nonzero(exact)[0] + start
+                indices[rows] = np.take_along_axis(candidates, order, axis=1)
+                scores[rows] = np.take_along_axis(candidate_scores, order, axis=1)
+            for row in np.nonzero(~exact)[0]:
+                best = np.argsort(-similarity[row], kind='stable')[:k]
+                indices[start + row] = best
+                scores[start + row] = similarity[row, best]
+        return indices, scores
+
+    def match_warnings(
+        self,
+        logs_df: pd.DataFrame,
+        anomalies_problems_df: pd.DataFrame,
+        options: Optional[AnalysisOptions] = None,
+        progress: Optional[ProgressReporter] = None,
+    ) -> MatchState:
+        """Сопоставляет WARNING строки со словарем без применения порога.
+
+        Результат можно сохранить и собрать из него находки для любого
+        порога через MatchState.build_findings - без повторного инференса.
 
         Args:
             logs_df: DataFrame с логами (только WARNING и ERROR)
             anomalies_problems_df: DataFrame со словарем аномалий
+            options: Параметры анализа (по умолчанию - порог анализатора)
+            progress: Получатель событий прогресса (этапы сопоставления, кодирования и поиска)
 
         Returns:
-            DataFrame с найденными проблемами и их локациями
+            MatchState с top-k совпадениями каждой WARNING строки
         """
+        if options is None:
+            options = AnalysisOptions(similarity_threshold=self.similarity_threshold)
+        top_k = max(1, int(options.top_k))
+        progress = progress or NULL_PROGRESS
+        started = time.perf_counter()
+
         logger.info(f"Начинаю ML анализ: {len(logs_df)} строк логов, {len(anomalies_problems_df)} аномалий")
 
         # Загружаем модель
-        self._load_model()
-
-        results = []
+        self._get_encoder(options.model_name)
 
         # Получаем эмбеддинги известных аномалий
         known_anomalies = anomalies_problems_df["Аномалия"].astype(str).tolist()
-        anomaly_embeddings = self.model.encode(known_anomalies, normalize_embeddings=True)
-        
-        logger.info(f"Начинаем анализ: {len(logs_df)} строк логов, {len(known_anomalies)} известных аномалий")
-        warning_count = len(logs_df[logs_df["level"] == "WARNING"])
-        error_count = len(logs_df[logs_df["level"] == "ERROR"])
-        logger.info(f"В логах: {warning_count} WARNING, {error_count} ERROR")
-        
-        # Выводим примеры для отладки
-        if warning_count > 0:
-            sample_warning = logs_df[logs_df["level"] == "WARNING"].iloc[0]
-            logger.info(f"Пример WARNING: text='{sample_warning['text']}'")
-        if error_count > 0:
-            sample_error = logs_df[logs_df["level"] == "ERROR"].iloc[0]
-            logger.info(f"Пример ERROR: text='{sample_error['text']}'")
-        if len(known_anomalies) > 0:
-            logger.info(f"Пример аномалии из словаря: '{known_anomalies[0]}'")
-            sample_problem = anomalies_problems_df.iloc[0]
-            logger.info(f"Пример проблемы из словаря: '{sample_problem['Проблема']}'")
-
-        # Список для новых аномалий (ниже порога)
-        low_confidence_anomalies = []
-        
-        # ОПТИМИЗАЦИЯ: Batch encoding вместо loop для всех WARNING строк
+        anomaly_embeddings = self.encode_dictionary(known_anomalies, model_name=options.model_name)
+
         warning_logs = logs_df[logs_df["level"] == "WARNING"]
-        if len(warning_logs) > 0:
-            logger.info(f"⚡ Batch encoding {len(warning_logs)} WARNING логов...")
-            warning_texts = warning_logs["text"].astype(str).tolist()
-            # Кодируем все WARNING строки за раз (быстрее чем loop)
-            warning_embeddings = self.model.encode(warning_texts, normalize_embeddings=True, show_progress_bar=False, batch_size=32)
-            
-            # Теперь обрабатываем с уже готовыми эмбеддингами
-            for idx, (_, row) in enumerate(warning_logs.iterrows()):
-                text = str(row["text"]).strip()
-                text_embedding = warning_embeddings[idx]
-
-                # Вычисляем косинусное сходство со всеми известными аномалиями
-                cosine_scores = util.cos_sim(text_embedding, anomaly_embeddings)[0]
-                best_idx = cosine_scores.argmax().item()
-                best_score = cosine_scores[best_idx].item()
-
-                # Если сходство ниже порога — сохраняем для дальнейшего анализа
-                if best_score < self.similarity_threshold:
-                    logger.debug(f"Новая аномалия (score: {best_score:.3f}): {text[:50]}...")
-                    
-                    # Собираем информацию о полной строке лога
-                    if 'full_line' in row and pd.notna(row['full_line']):
-                        full_log_line = row['full_line']
-                    else:
-                        source = row.get('source', '')
-                        if source and source != 'unknown':
-                            full_log_line = f"{row['datetime']} {row['level']} {source}: {text}"
-                        else:
-                            full_log_line = f"{row['datetime']} {row['level']} {text}"
-                    
-                    low_confidence_anomalies.append({
-                        'score': best_score,
-                        'text': text,
-                        'full_line': full_log_line,
-                        'filename': row['filename'],
-                        'line_number': row['line_number']
-                    })
-                    continue
-
-                # Находим наиболее похожую аномалию и все её проблемы
-                matched_anomaly = anomalies_problems_df.iloc[best_idx]
-                matched_text = matched_anomaly["Аномалия"]
-                
-                logger.debug(f"WARNING сопоставлен с аномалией: {matched_text[:50]}... (score: {best_score:.3f})")
-
-                # Получаем все проблемы для этой аномалии
-                related_problems = anomalies_problems_df[
-                    anomalies_problems_df["Аномалия"] == matched_text
-                ]
-                
-                logger.debug(f"Найдено {len(related_problems)} связанных проблем")
-
-                for _, ap in related_problems.iterrows():
-                    anomaly_id = ap["ID аномалии"]
-                    problem_id = ap["ID проблемы"]
-                    problem_text = ap["Проблема"]
-                    
-                    logger.debug(f"Ищем ERROR с текстом: '{problem_text}'")
-
-                    # Ищем ERROR строки с ТОЧНЫМ совпадением
-                    problem_rows = logs_df[
-                        (logs_df["level"] == "ERROR") &
-                        (logs_df["text"].isin([problem_text]))  # ← Точное совпадение!
-                    ]
-                    
-                    logger.debug(f"Найдено {len(problem_rows)} совпадающих ERROR строк")
-
-                    for _, problem_row in problem_rows.iterrows():
-                        # Формат: дата + уровень + источник + текст
-                        # Используем full_line если есть, иначе собираем из частей
-                        if 'full_line' in problem_row and pd.notna(problem_row['full_line']):
-                            full_log_line = problem_row['full_line']
-                        else:
-                            # Собираем полную строку с источником 
-                            source = problem_row.get('source', '')
-                            if source and source != 'unknown':
-                                full_log_line = f"{problem_row['datetime']} {problem_row['level']} {source}: {problem_row['text']}"
-                            else:
-                                # Если источника нет, формат без него
-                                full_log_line = f"{problem_row['datetime']} {problem_row['level']} {problem_row['text']}"
-                        
-                        results.append({
-                            'ID аномалии': anomaly_id,
-                            'ID проблемы': problem_id,
-                            'Файл с проблемой': problem_row['filename'],
-                            '№ строки': problem_row['line_number'],
-                            'Строка из лога': full_log_line
-                        })
-
-            # Добавляем ВСЕ новые аномалии с score > 0.5 (не только топ)
-            top_new_anomalies = []
-            if low_confidence_anomalies:
-                # Сортируем по score (от большего к меньшему) и фильтруем score > 0.5
-                low_confidence_anomalies.sort(key=lambda x: x['score'], reverse=True)
-                top_new_anomalies = [a for a in low_confidence_anomalies if a['score'] > 0.5]
-            
-            logger.debug(f"Найдено {len(low_confidence_anomalies)} новых аномалий, добавляем {len(top_new_anomalies)}:")
-            
-            if top_new_anomalies:
-                # ОПТИМИЗАЦИЯ: Batch encoding новых аномалий (вместо loop)
-                new_anomaly_texts = [a['text'] for a in top_new_anomalies]
-                logger.info(f"⚡ Batch encoding {len(top_new_anomalies)} новых аномалий...")
-                new_anomaly_embeddings = self.model.encode(new_anomaly_texts, normalize_embeddings=True, show_progress_bar=False, batch_size=32)
-                
-                # Для каждой новой аномалии находим самую похожую СУЩЕСТВУЮЩУЮ аномалию
-                for idx, (anomaly, anomaly_embedding) in enumerate(zip(top_new_anomalies, new_anomaly_embeddings), 1):
-                    anomaly_text = anomaly['text']
-                    
-                    # Вычисляем косинусное сходство со ВСЕМИ аномалиями из словаря
-                    similarity_scores = util.cos_sim(anomaly_embedding, anomaly_embeddings)[0]
-                    best_match_idx = similarity_scores.argmax().item()
-                    best_match_score = similarity_scores[best_match_idx].item()
-                    
-                    # Берем ID аномалии и ID проблемы из самой похожей аномалии
-                    matched_anomaly_row = anomalies_problems_df.iloc[best_match_idx]
-                    matched_anomaly_id = matched_anomaly_row['ID аномалии']
-                    matched_problem_id = matched_anomaly_row['ID проблемы']
-                    matched_anomaly_text = matched_anomaly_row['Аномалия']
-                    
-                    logger.info(f"  Новая аномалия #{idx}: score={anomaly['score']:.3f} -> ID аномалии={matched_anomaly_id}, ID проблемы={matched_problem_id}")
-                    logger.info(f"    Найденный текст: '{anomaly_text[:60]}...'")
-                    logger.info(f"    Похожая аномалия (score={best_match_score:.3f}): '{matched_anomaly_text[:60]}...'")
-                    
-                    results.append({
-                        'ID аномалии': matched_anomaly_id,  # ID самой похожей существующей аномалии
-                        'ID проблемы': matched_problem_id,  # ID проблемы этой аномалии
-                        'Файл с проблемой': anomaly['filename'],
-                        '№ строки': anomaly['line_number'],
-                        'Строка из лога': anomaly['full_line']
-                    })
-
-        result_df = pd.DataFrame(results)
-        logger.info(f"ML анализ завершен: найдено {len(result_df)} проблем (включая новые аномалии)")
+        error_count = int((logs_df["level"] == "ERROR").sum())
+        logger.info(f"В логах: {len(warning_logs)} WARNING, {error_count} ERROR")
+
+        warning_texts = warning_logs["text"].astype(str)
+        progress.stage(STAGE_MATCHING, warnings=len(warning_texts), errors=error_count)
+        dimension = anomaly_embeddings.shape[1] if anomaly_embeddings.ndim == 2 else 0
+        stage_counts = {
+            "warnings": len(warning_texts), "exact": 0, "normalized": 0,
+            "encoded": 0, "encoded_texts": 0, "cache_hits": 0,
+        }
+
+        # Быстрый путь: WARNING, дословно (или с точностью до регистра и пробелов)
+        # совпадающие с аномалией словаря, получают ее эмбеддинг без модели
+        dictionary_rows = np.full(len(warning_texts), -1, dtype=np.int64)
+        if len(known_anomalies) and len(warning_texts):
+            dictionary_rows, stage_counts["exact"], stage_counts["normalized"] = self._lookup_dictionary(
+                warning_texts, known_anomalies
+            )
+
+        warning_embeddings = np.zeros((len(warning_texts), dimension), dtype=np.float32)
+        resolved = dictionary_rows >= 0
+        if resolved.any():
+            warning_embeddings[resolved] = anomaly_embeddings[dictionary_rows[resolved]]
+        unresolved = np.nonzero(~resolved)[0]
+        if len(unresolved) and dimension:
+            # Кодируем каждый уникальный ключ один раз: шаблон сообщения,
+            # текст с маскированными параметрами или сам текст
+            encode_keys = self._encode_keys(warning_logs, warning_texts, unresolved)
+            codes, unique_keys = pd.factorize(encode_keys)
+            unique_embeddings, cache_hits = self._encode_unique(list(unique_keys), options.model_name, progress)
+            warning_embeddings[unresolved] = unique_embeddings[codes]
+            stage_counts["encoded"] = len(unresolved)
+            stage_counts["encoded_texts"] = len(unique_keys) - cache_hits
+            stage_counts["cache_hits"] = cache_hits
+        logger.info(
+            f"Сопоставление WARNING: точное {stage_counts['exact']}, нормализованное {stage_counts['normalized']}, "
+            f"через модель {stage_counts['encoded']} ({stage_counts['encoded_texts']} текстов закодировано, "
+            f"{stage_counts['cache_hits']} из кэша)"
+        )
+
+        progress.stage(STAGE_SEARCH, dictionary=len(known_anomalies), **stage_counts)
+        with span("search", warnings=len(warning_embeddings), dictionary=len(known_anomalies)):
+            index = self.dictionary_index(known_anomalies, anomaly_embeddings, options.model_name)
+            if index is not None and len(warning_embeddings):
+                top_indices, top_scores = index.search(warning_embeddings, top_k)
+            else:
+                top_indices, top_scores = self._top_k_matches(warning_embeddings, anomaly_embeddings, top_k)
+        state = MatchState.from_frames(top_indices, top_scores, logs_df, anomalies_problems_df, options, stage_counts)
+        _MATCH_SECONDS.observe(time.perf_counter() - started)
+        return state
+
+    def iter_match_batches(
+        self,
+        logs_df: pd.DataFrame,
+        anomalies_problems_df: pd.DataFrame,
+        options: Optional[AnalysisOptions] = None,
+        batch_size: int = 2048,
+        progress: Optional[ProgressReporter] = None,
+    ) -> Iterator[MatchState]:
+        """Сопоставляет WARNING строки со словарем батчами (для потоковой выдачи находок).
+
+        Каждый батч кодируется и ищется отдельно, поэтому первые находки
+        доступны до окончания кодирования всего файла. Блоки ERROR строк в
+        MatchState батча пустые - их собирает FindingsStream.
 
+        Args:
+            logs_df: DataFrame с логами (только WARNING и ERROR)
+            anomalies_problems_df: DataFrame со словарем аномалий
+            options: Параметры анализа
+            batch_size: WARNING строк в батче
+            progress: Получатель событий прогресса
+
+        Yields:
+            MatchState очередного батча WARNING строк (в порядке логов)
+        """
+        warning_logs = logs_df[logs_df["level"] == "WARNING"]
+        batch_size = max(1, int(batch_size))
+        for start in range(0, len(warning_logs), batch_size):
+            yield self.match_warnings(warning_logs.iloc[start:start + batch_size], anomalies_problems_df, options, progress)
+
+    def analyze_logs_with_ml(
+        self,
+        logs_df: pd.DataFrame,
+        anomalies_problems_df: pd.DataFrame,
+        options: Optional[AnalysisOptions] = None,
+    ) -> pd.DataFrame:
+        """Анализирует логи с использованием ML-модуля.
+
+        Args:
+            logs_df: DataFrame с логами (только WARNING и ERROR)
+            anomalies_problems_df: DataFrame со словарем аномалий
+            options: Параметры анализа (по умолчанию - порог анализатора)
+
+        Returns:
+            DataFrame с найденными проблемами и их локациями
+        """
+        if options is None:
+            options = AnalysisOptions(similarity_threshold=self.similarity_threshold)
+        state = self.match_warnings(logs_df, anomalies_problems_df, options)
+        result_df = state.build_findings(options.similarity_threshold, options.new_anomaly_floor)
+        logger.info(f"ML анализ завершен: найдено {len(result_df)} проблем (включая новые аномалии)")
         return result_df
 
     def get_analysis_summary(self, results_df: pd.DataFrame) -> Dict:
@@ -0,0 +1,93 @@
+"""События прогресса длительного анализа.
+
+Конвейер анализа (парсинг, кодирование, поиск, отчет) сообщает о ходе
+работы через ProgressReporter. Смена этапа отправляется всегда, а
+промежуточные обновления внутри горячих циклов - не чаще min_interval:
+проверка сводится к одному сравнению time.monotonic(), поэтому накладные
+расходы ничтожны. NULL_PROGRESS ничего не отправляет и используется по
+умолчанию.
+"""
+
+import time
+from typing import Callable, Dict, Optional
+
+STAGE_PARSING = "parsing"
+STAGE_MATCHING = "matching"
+STAGE_ENCODING = "encoding"
+STAGE_SEARCH = "search"
+STAGE_FINDINGS = "findings"
+STAGE_REPORT = "report"
+STAGE_DONE = "done"
+STAGE_FAILED = "failed"
+
+
+class ProgressReporter:
+    """Отправляет события прогресса одного анализа."""
+
+    def __init__(self, emit: Optional[Callable[[Dict], None]] = None, min_interval: float = 0.25):
+        """Инициализация.
+
+        Args:
+            emit: Получатель событий (вызывается из потока анализа); None - события не отправляются
+            min_interval: Минимальный интервал между промежуточными обновлениями (сек)
+        """
+        self.emit = emit
+        self.min_interval = min_interval
+        self.started = time.monotonic()
+        self.stage_name: Optional[str] = None
+        self._stage_started = self.started
+        self._last_emit = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.emit is not None
+
+    def _send(self, now: float, final: bool, fields: Dict) -> None:
+        self._last_emit = now
+        self.emit({
+            "stage": self.stage_name,
+            "elapsed": round(now - self.started, 3),
+            "stage_elapsed": round(now - self._stage_started, 3),
+            "final": final,
+            **fields,
+        })
+
+    def stage(self, name: str, **fields) -> None:
+        """Начало этапа (отправляется всегда)."""
+        if self.emit is None:
+            return
+        now = time.monotonic()
+        self.stage_name = name
+        self._stage_started = now
+        self._send(now, False, fields)
+
+    def update(self, **fields) -> None:
+        """Промежуточное состояние этапа (не чаще min_interval)."""
+        if self.emit is None:
+            return
+        now = time.monotonic()
+        if now - self._last_emit < self.min_interval:
+            return
+        self._send(now, False, fields)
+
+    def rate(self, count: int) -> float:
+        """Скорость обработки с начала текущего этапа (единиц в секунду)."""
+        elapsed = time.monotonic() - self._stage_started
+        return round(count / elapsed, 1) if elapsed > 0 else 0.0
+
+    def finish(self, **fields) -> None:
+        """Анализ завершен (последнее событие)."""
+        if self.emit is None:
+            return
+        self.stage_name = STAGE_DONE
+        self._send(time.monotonic(), True, fields)
+
+    def fail(self, detail: str) -> None:
+        """Анализ завершился ошибкой (последнее событие)."""
+        if self.emit is None:
+            return
+        self.stage_name = STAGE_FAILED
+        self._send(time.monotonic(), True, {"detail": detail})
+
+
+NULL_PROGRESS = ProgressReporter()
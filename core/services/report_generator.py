@@ -9,8 +9,6 @@ import time
 from typing import List
 
 import pandas as pd
-from openpyxl import load_workbook
-from openpyxl.styles import Alignment, PatternFill, Font
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +35,10 @@ class ReportGenerator:
         Returns:
             Путь к созданному файлу
         """
+        # openpyxl нужен только при создании отчета - не грузим его при импорте
+        from openpyxl import load_workbook
+        from openpyxl.styles import Alignment, PatternFill, Font
+
         try:
             # Генерируем уникальное имя файла с временной меткой, если путь не указан
             if output_path is None:
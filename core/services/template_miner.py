@@ -0,0 +1,139 @@
+"""Онлайн майнинг шаблонов сообщений логов (в духе Drain).
+
+Сообщения вида `Fan speed at 1592 RPM` и `Fan speed at 1610 RPM` отличаются
+только параметрами. Майнер сводит их к одному шаблону `Fan speed at <*> RPM`
+и выдает номер шаблона и параметры для каждой строки.
+
+Алгоритм Drain (He et al., 2017): строки раскладываются по дереву
+фиксированной глубины - сначала по числу токенов, затем по первым токенам
+(токены с цифрами идут в общую ветку `<*>`). В листе строка присоединяется
+к самому похожему кластеру, если доля совпавших токенов не ниже порога,
+иначе создается новый кластер. Несовпавшие позиции шаблона становятся `<*>`.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+WILDCARD = "<*>"
+
+
+class _Cluster:
+    """Кластер строк: шаблон (список токенов) и число строк."""
+
+    __slots__ = ("template_id", "tokens", "count")
+
+    def __init__(self, template_id: int, tokens: List[str]):
+        self.template_id = template_id
+        self.tokens = tokens
+        self.count = 0
+
+    @property
+    def template(self) -> str:
+        return " ".join(self.tokens)
+
+
+def _has_digits(token: str) -> bool:
+    return any(char.isdigit() for char in token)
+
+
+class TemplateMiner:
+    """Онлайн майнер шаблонов: строки добавляются по одной во время парсинга."""
+
+    def __init__(self, similarity_threshold: float = 0.5, depth: int = 4, max_children: int = 100):
+        """Инициализация.
+
+        Args:
+            similarity_threshold: Минимальная доля совпавших токенов для присоединения к кластеру
+            depth: Глубина дерева (число токенов-префиксов = depth - 2)
+            max_children: Максимум веток в узле (остальные идут в ветку `<*>`)
+        """
+        self.similarity_threshold = similarity_threshold
+        self.prefix_depth = max(1, depth - 2)
+        self.max_children = max_children
+        self._root: Dict[int, dict] = {}
+        self._clusters: List[_Cluster] = []
+        # Уже виденные тексты - шаблон только обобщается, поэтому текст остается в своем кластере
+        self._seen: Dict[str, _Cluster] = {}
+
+    def __len__(self) -> int:
+        return len(self._clusters)
+
+    def add(self, text: str) -> int:
+        """Добавляет строку и возвращает номер ее шаблона (с 1)."""
+        cluster = self._seen.get(text)
+        if cluster is None:
+            tokens = text.split()
+            leaf = self._leaf(tokens)
+            cluster = self._best_cluster(leaf, tokens)
+            if cluster is None:
+                cluster = _Cluster(len(self._clusters) + 1, tokens)
+                self._clusters.append(cluster)
+                leaf.append(cluster)
+            else:
+                cluster.tokens = [
+                    template_token if template_token == token else WILDCARD
+                    for template_token, token in zip(cluster.tokens, tokens)
+                ]
+            self._seen[text] = cluster
+        cluster.count += 1
+        return cluster.template_id
+
+    def _leaf(self, tokens: List[str]) -> list:
+        """Спускается по дереву (длина, затем префиксные токены) к списку кластеров листа."""
+        node = self._root.setdefault(len(tokens), {})
+        for token in tokens[:self.prefix_depth]:
+            key = WILDCARD if _has_digits(token) else token
+            if key not in node:
+                key = key if len(node) < self.max_children else WILDCARD
+            node = node.setdefault(key, {})
+        return node.setdefault(None, [])
+
+    def _best_cluster(self, leaf: list, tokens: List[str]) -> Optional[_Cluster]:
+        """Самый похожий кластер листа или None, если сходство ниже порога."""
+        best, best_key = None, None
+        for cluster in leaf:
+            same = wildcards = 0
+            for template_token, token in zip(cluster.tokens, tokens):
+                if template_token == WILDCARD:
+                    wildcards += 1
+                elif template_token == token:
+                    same += 1
+            similarity = same / len(tokens) if tokens else 1.0
+            key = (similarity, wildcards)
+            if best_key is None or key > best_key:
+                best, best_key = cluster, key
+        if best is not None and best_key[0] >= self.similarity_threshold:
+            return best
+        return None
+
+    def template(self, template_id: int) -> str:
+        """Текущий шаблон по номеру."""
+        return self._clusters[template_id - 1].template
+
+    def parameters(self, text: str, template_id: int) -> List[str]:
+        """Параметры строки: токены на позициях `<*>` итогового шаблона."""
+        template_tokens = self._clusters[template_id - 1].tokens
+        return [token for template_token, token in zip(template_tokens, text.split()) if template_token == WILDCARD]
+
+    def templates(self) -> pd.DataFrame:
+        """Таблица шаблонов: template_id, template, count."""
+        return pd.DataFrame(
+            [(cluster.template_id, cluster.template, cluster.count) for cluster in self._clusters],
+            columns=["template_id", "template", "count"],
+        )
+
+    def annotate(self, texts: pd.Series, template_ids: pd.Series) -> Tuple[pd.Series, pd.Series]:
+        """Итоговые шаблоны и параметры для уже добавленных строк.
+
+        Шаблон кластера обобщается по мере поступления строк, поэтому
+        колонки заполняются после парсинга всех файлов.
+        """
+        template_by_id = {cluster.template_id: cluster.template for cluster in self._clusters}
+        templates = template_ids.map(template_by_id)
+        params = pd.Series(
+            [self.parameters(text, template_id) for text, template_id in zip(texts, template_ids)],
+            index=texts.index,
+            dtype=object,
+        )
+        return templates, params
@@ -0,0 +1,120 @@
+"""Маскирование параметров в тексте логов перед кодированием.
+
+Быстрая альтернатива майнингу шаблонов: числа, hex идентификаторы, IP,
+UUID, пути и временные метки заменяются токенами-заглушками, поэтому
+`Disk /dev/sda1 at 91%` и `Disk /dev/sdb2 at 93%` дают один ключ
+`Disk <PATH> at <NUM>%` - и один эмбеддинг. Маски применяются
+векторно (pandas .str.replace) ко всей колонке text, набор масок
+настраивается для каждого источника логов.
+"""
+
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+# Порядок важен: метки времени и UUID содержат числа, пути - цифры в именах устройств
+MASKS = OrderedDict([
+    ("timestamp", (
+        re.compile(r"\b\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?\b"
+                   r"|\b\d{2}:\d{2}:\d{2}(?:[.,]\d+)?\b"),
+        "<TS>",
+    )),
+    ("uuid", (
+        re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"),
+        "<UUID>",
+    )),
+    ("ip", (
+        re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}(?::\d+)?\b"),
+        "<IP>",
+    )),
+    ("path", (
+        re.compile(r"(?<![\w<>])(?:[A-Za-z]:)?(?:[/\\][\w.\-]+)+[/\\]?"),
+        "<PATH>",
+    )),
+    ("hex", (
+        re.compile(r"\b0[xX][0-9a-fA-F]+\b|\b(?=[0-9a-fA-F]*\d)(?=[0-9a-fA-F]*[a-fA-F])[0-9a-fA-F]{8,}\b"),
+        "<HEX>",
+    )),
+    ("number", (
+        re.compile(r"(?<![\w<>.])[-+]?\d+(?:[.,]\d+)?(?![\w.])"),
+        "<NUM>",
+    )),
+])
+
+DEFAULT_MASKS = list(MASKS)
+
+
+class TextNormalizer:
+    """Заменяет параметры в тексте логов на токены-заглушки."""
+
+    def __init__(self, masks: Optional[List[str]] = None, source_masks: Optional[Dict[str, List[str]]] = None):
+        """Инициализация.
+
+        Args:
+            masks: Маски по умолчанию (timestamp, uuid, ip, path, hex, number)
+            source_masks: Свой набор масок для отдельных источников логов
+
+        Raises:
+            ValueError: Если указана неизвестная маска
+        """
+        self.masks = self._validate(DEFAULT_MASKS if masks is None else masks)
+        self.source_masks = {source: self._validate(names) for source, names in (source_masks or {}).items()}
+
+    @staticmethod
+    def _validate(names: List[str]) -> List[str]:
+        unknown = [name for name in names if name not in MASKS]
+        if unknown:
+            raise ValueError(f"Неизвестные маски: {', '.join(unknown)}. Допустимо: {', '.join(MASKS)}")
+        # Применяем в каноническом порядке, независимо от порядка в настройках
+        return [name for name in MASKS if name in names]
+
+    @staticmethod
+    def _apply(texts: pd.Series, names: List[str]) -> pd.Series:
+        for name in names:
+            pattern, placeholder = MASKS[name]
+            texts = texts.str.replace(pattern, placeholder, regex=True)
+        return texts
+
+    def normalize(self, texts: pd.Series, sources: Optional[pd.Series] = None) -> pd.Series:
+        """Маскирует параметры во всех текстах.
+
+        Args:
+            texts: Колонка text
+            sources: Колонка source (для масок по источникам)
+
+        Returns:
+            Нормализованные тексты с тем же индексом
+        """
+        texts = texts.astype(str)
+        if not self.source_masks or sources is None:
+            return self._apply(texts, self.masks)
+
+        result = texts.copy()
+        custom = sources.isin(list(self.source_masks)).to_numpy()
+        if (~custom).any():
+            result[~custom] = self._apply(texts[~custom], self.masks)
+        for source, names in self.source_masks.items():
+            rows = (sources == source).to_numpy()
+            if rows.any():
+                result[rows] = self._apply(texts[rows], names)
+        return result
+
+    def normalize_text(self, text: str, source: Optional[str] = None) -> str:
+        """Нормализует одну строку."""
+        names = self.source_masks.get(source, self.masks)
+        for name in names:
+            pattern, placeholder = MASKS[name]
+            text = pattern.sub(placeholder, text)
+        return text
+
+
+def parse_source_masks(value: str) -> Dict[str, List[str]]:
+    """Разбирает настройку вида "hardware=number,path;network=ip" в словарь."""
+    source_masks = {}
+    for item in value.split(";"):
+        source, sep, names = item.partition("=")
+        if sep and source.strip():
+            source_masks[source.strip()] = [name.strip() for name in names.split(",") if name.strip()]
+    return source_masks
@@ -0,0 +1,245 @@
+"""Разбивка времени запроса по этапам (wall и CPU) и trace файлы.
+
+StageTimer собирает интервалы (spans) одного запроса. Текущий таймер
+хранится в ContextVar: эндпоинт активирует его, а run_in_threadpool
+копирует контекст в поток, поэтому span() в парсере и анализаторе
+попадает в таймер своего запроса без передачи параметров. Без активного
+таймера span() ничего не делает.
+
+CPU время - process_time(): учитывает потоки torch/onnx, но при
+параллельных запросах включает и их работу.
+
+С memory=True (и запущенным tracemalloc) для каждого интервала
+записываются пик выделенной памяти над уровнем на начале этапа и чистый
+прирост к концу этапа. Счетчик пика у tracemalloc один на процесс:
+вложенные этапы сбрасывают его, передавая пик внешнему, а параллельные
+запросы искажают друг другу значения - режим для диагностики и бенчмарков.
+tracemalloc видит аллокации Python, numpy и pandas, но не torch/onnx.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from .metrics import STAGE_PEAK_BYTES
+
+_current_timer: ContextVar[Optional["StageTimer"]] = ContextVar("stage_timer", default=None)
+
+
+@dataclass
+class Span:
+    """Интервал этапа: начало относительно начала запроса, wall и CPU время (сек)."""
+
+    name: str
+    start: float
+    wall: float
+    cpu: float
+    thread_id: int
+    args: Dict = field(default_factory=dict)
+    peak_bytes: Optional[int] = None
+    net_bytes: Optional[int] = None
+
+
+class _MemoryFrame:
+    """Уровень памяти на начале этапа и максимум пика, переданный вложенными этапами."""
+
+    __slots__ = ("start", "peak")
+
+    def __init__(self, start: int):
+        self.start = start
+        self.peak = start
+
+
+class StageTimer:
+    """Интервалы этапов одного запроса.
+
+    Args:
+        memory: Записывать пик и прирост памяти этапов (если tracemalloc запущен)
+    """
+
+    def __init__(self, memory: bool = False):
+        self.origin = time.perf_counter()
+        self.origin_epoch = time.time()
+        self.spans: List[Span] = []
+        self.memory = memory
+        self._memory_stack: List[_MemoryFrame] = []
+
+    @contextmanager
+    def span(self, name: str, **args):
+        """Замеряет блок как этап name (вложенные этапы допустимы)."""
+        frame = self._memory_enter() if self.memory and tracemalloc.is_tracing() else None
+        wall_started = time.perf_counter()
+        cpu_started = time.process_time()
+        try:
+            yield
+        finally:
+            record = Span(
+                name=name,
+                start=wall_started - self.origin,
+                wall=time.perf_counter() - wall_started,
+                cpu=time.process_time() - cpu_started,
+                thread_id=threading.get_ident(),
+                args=args,
+            )
+            if frame is not None:
+                record.peak_bytes, record.net_bytes = self._memory_exit(frame)
+                STAGE_PEAK_BYTES.labels(name).observe(record.peak_bytes)
+            self.spans.append(record)
+
+    def _memory_enter(self) -> _MemoryFrame:
+        current, peak = tracemalloc.get_traced_memory()
+        if self._memory_stack:
+            # Пик до начала вложенного этапа принадлежит внешнему
+            parent = self._memory_stack[-1]
+            parent.peak = max(parent.peak, peak)
+        tracemalloc.reset_peak()
+        frame = _MemoryFrame(current)
+        self._memory_stack.append(frame)
+        return frame
+
+    def _memory_exit(self, frame: _MemoryFrame):
+        """Пик над уровнем начала этапа и чистый прирост (байты)."""
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(frame.peak, peak)
+        if self._memory_stack and self._memory_stack[-1] is frame:
+            self._memory_stack.pop()
+        if self._memory_stack:
+            parent = self._memory_stack[-1]
+            parent.peak = max(parent.peak, peak)
+        return peak - frame.start, current - frame.start
+
+    def activate(self) -> Token:
+        """Делает таймер текущим для span() в этом контексте (и потоках run_in_threadpool).
+
+        Returns:
+            Токен для deactivate()
+        """
+        return _current_timer.set(self)
+
+    @staticmethod
+    def deactivate(token: Token) -> None:
+        """Возвращает таймер, который был текущим до activate()."""
+        _current_timer.reset(token)
+
+    def _ordered(self) -> List[Span]:
+        return sorted(self.spans, key=lambda span: span.start)
+
+    def stages(self) -> Dict[str, Dict[str, float]]:
+        """Суммарное время по этапам в порядке первого начала: {этап: wall_ms, cpu_ms, count}.
+
+        С учетом памяти добавляются peak_bytes (максимум по интервалам этапа)
+        и net_bytes (сумма приростов).
+        """
+        stages: Dict[str, Dict[str, float]] = {}
+        for span in self._ordered():
+            stage = stages.setdefault(span.name, {"wall_ms": 0.0, "cpu_ms": 0.0, "count": 0})
+            stage["wall_ms"] += span.wall * 1000
+            stage["cpu_ms"] += span.cpu * 1000
+            stage["count"] += 1
+            if span.peak_bytes is not None:
+                stage["peak_bytes"] = max(stage.get("peak_bytes", 0), span.peak_bytes)
+                stage["net_bytes"] = stage.get("net_bytes", 0) + span.net_bytes
+        for stage in stages.values():
+            stage["wall_ms"] = round(stage["wall_ms"], 3)
+            stage["cpu_ms"] = round(stage["cpu_ms"], 3)
+        return stages
+
+    def server_timing(self) -> str:
+        """Значение заголовка Server-Timing: wall время этапа в dur, CPU (и пик памяти) - в desc."""
+        entries = []
+        for name, stage in self.stages().items():
+            desc = f'cpu {stage["cpu_ms"]:.1f}ms'
+            if "peak_bytes" in stage:
+                desc += f' peak {stage["peak_bytes"] / 2 ** 20:.1f}MB'
+            entries.append(f'{name};dur={stage["wall_ms"]:.1f};desc="{desc}"')
+        return ", ".join(entries)
+
+    def to_dict(self) -> Dict:
+        """Блок timings ответа: итог, этапы и отдельные интервалы."""
+        return {
+            "total_ms": round((time.perf_counter() - self.origin) * 1000, 3),
+            "stages": self.stages(),
+            "spans": [
+                {
+                    "name": span.name,
+                    "start_ms": round(span.start * 1000, 3),
+                    "wall_ms": round(span.wall * 1000, 3),
+                    "cpu_ms": round(span.cpu * 1000, 3),
+                    **({"peak_bytes": span.peak_bytes, "net_bytes": span.net_bytes}
+                       if span.peak_bytes is not None else {}),
+                    **({"args": span.args} if span.args else {}),
+                }
+                for span in self._ordered()
+            ],
+        }
+
+    def chrome_trace(self, name: str = "request") -> Dict:
+        """Интервалы в формате Trace Event (chrome://tracing, Perfetto, speedscope)."""
+        pid = os.getpid()
+        origin_us = self.origin_epoch * 1e6
+        threads = {}
+        events = []
+        for span in self._ordered():
+            tid = threads.setdefault(span.thread_id, len(threads) + 1)
+            events.append({
+                "name": span.name,
+                "cat": "stage",
+                "ph": "X",
+                "ts": round(origin_us + span.start * 1e6, 1),
+                "dur": round(span.wall * 1e6, 1),
+                "pid": pid,
+                "tid": tid,
+                "args": {
+                    "cpu_ms": round(span.cpu * 1000, 3),
+                    **({"peak_bytes": span.peak_bytes, "net_bytes": span.net_bytes}
+                       if span.peak_bytes is not None else {}),
+                    **span.args,
+                },
+            })
+        events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": name}})
+        for thread_id, tid in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                           "args": {"name": f"thread-{thread_id}"}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_trace(self, path: str, name: str = "request") -> str:
+        """Атомарно записывает chrome_trace() в JSON файл.
+
+        Returns:
+            Путь к файлу
+        """
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.chrome_trace(name), f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+
+def current_timer() -> Optional[StageTimer]:
+    """Таймер текущего запроса (None, если не активирован)."""
+    return _current_timer.get()
+
+
+@contextmanager
+def span(name: str, **args):
+    """Этап текущего запроса; без активного таймера - ничего не делает."""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.span(name, **args):
+        yield
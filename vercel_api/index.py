@@ -5,6 +5,10 @@ from pathlib import Path
 # Add parent directory to path so we can import api module
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+# В serverless каждый холодный старт платит за импорт torch - грузим модель
+# только при первом ML запросе, а /health и скачивания отвечают сразу
+os.environ.setdefault("API_PRELOAD_MODEL", "false")
+
 try:
     from api.main import app
 except Exception as e: